@@ -0,0 +1,94 @@
+"""Measure small-chart latency while large charts are being formatted, inline vs in the process pool.
+
+Background threads keep formatting a large columnar line chart while the main thread formats
+small bar charts, as concurrent requests in one server process would. With FORMAT_EXECUTOR
+inline the large charts hold the GIL and the small requests queue behind them; with process
+the large jobs only copy their response body into shared memory. Run from the repository root:
+
+    python -m benchmarks.bench_format_offload [--large-rows 200000] [--small-requests 200]
+"""
+import argparse
+import os
+import random
+import statistics
+import threading
+import time
+
+from benchmarks.fake_llm import FakeLLMManager
+from my_agent.ColumnarWire import decode_columnar, encode_columnar
+from my_agent.DataFormatter import DataFormatter
+from my_agent.FormatExecutor import get_executor
+
+
+def make_state(visualization: str, rows: list) -> dict:
+    names = [str(index) for index in range(len(rows[0]))]
+    results = decode_columnar(encode_columnar(names, rows))
+    return {"visualization": visualization, "results": results, "question": "q", "sql_query": "SELECT 1"}
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run(executor: str, large_state: dict, small_state: dict, args) -> dict:
+    os.environ["FORMAT_EXECUTOR"] = executor
+    formatter = DataFormatter(FakeLLMManager(default="Sales", latency=0))
+    formatter.offload_min_rows = args.offload_min_rows
+    stop = threading.Event()
+    large_done = []
+
+    def large_requests():
+        while not stop.is_set():
+            formatter.format_data_for_visualization(large_state)
+            large_done.append(1)
+
+    threads = [threading.Thread(target=large_requests) for _ in range(args.large_threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    latencies = []
+    for _ in range(args.small_requests):
+        start = time.perf_counter()
+        formatter.format_data_for_visualization(small_state)
+        latencies.append(time.perf_counter() - start)
+        time.sleep(args.interval)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {
+        "p50": statistics.median(latencies),
+        "p99": percentile(latencies, 0.99),
+        "max": max(latencies),
+        "large": len(large_done),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--large-rows", type=int, default=200_000)
+    parser.add_argument("--large-threads", type=int, default=2)
+    parser.add_argument("--small-rows", type=int, default=50)
+    parser.add_argument("--small-requests", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.005, help="seconds between small requests")
+    parser.add_argument("--offload-min-rows", type=int, default=20_000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    large_state = make_state("line", [
+        [f"2024/{i % 12 + 1}/{i % 28 + 1} {i}", ["A", "B", "C"][i % 3], rng.random() * 100]
+        for i in range(args.large_rows)
+    ])
+    small_state = make_state("bar", [[f"Category {i}", rng.random() * 100] for i in range(args.small_rows)])
+    # Start the workers before measuring, as a long-running server would have
+    get_executor().submit(int).result()
+
+    print(f"{'executor':<10}{'small p50 ms':>14}{'small p99 ms':>14}{'small max ms':>14}{'large done':>12}")
+    for executor in ("inline", "process"):
+        result = run(executor, large_state, small_state, args)
+        print(f"{executor:<10}{result['p50'] * 1000:>14.2f}{result['p99'] * 1000:>14.2f}"
+              f"{result['max'] * 1000:>14.2f}{result['large']:>12}")
+
+
+if __name__ == "__main__":
+    main()
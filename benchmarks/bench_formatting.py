@@ -0,0 +1,64 @@
+"""Benchmark the columnar chart formatting engine on synthetic results.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_formatting [--sizes 10000 100000 1000000] [--point-budget 2000]
+"""
+import argparse
+import random
+import time
+
+from my_agent.ColumnarFormatter import to_columns, line_series, bar_series, scatter_series
+
+
+def make_results(kind: str, rows: int, labels: int = 20):
+    rng = random.Random(0)
+    names = [f"Label {i}" for i in range(labels)]
+    if kind == "line":
+        return [[f"2024-01-{i % 28 + 1:02d} {i // 28}", rng.random() * 100] for i in range(rows)]
+    if kind == "grouped_line":
+        return [[names[i % labels], str(i // labels), rng.random() * 100] for i in range(rows)]
+    if kind == "grouped_bar":
+        return [[names[i % labels], f"Category {i // labels}", rng.random() * 100] for i in range(rows)]
+    if kind == "scatter":
+        return [[rng.random(), rng.random()] for _ in range(rows)]
+    if kind == "grouped_scatter":
+        return [[names[i % labels], rng.random(), rng.random()] for i in range(rows)]
+    raise ValueError(kind)
+
+
+CASES = [
+    ("line", line_series),
+    ("grouped_line", line_series),
+    ("grouped_bar", lambda columns, point_budget: bar_series(columns)),
+    ("scatter", scatter_series),
+    ("grouped_scatter", scatter_series),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--point-budget", type=int, default=None,
+                        help="downsample line and scatter output to this many points")
+    args = parser.parse_args()
+
+    print(f"{'case':<16}{'rows':>10}{'to_columns ms':>16}{'format ms':>12}")
+    for rows in args.sizes:
+        for kind, format_series in CASES:
+            results = make_results(kind, rows)
+            convert, fmt = [], []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                columns = to_columns(results)
+                middle = time.perf_counter()
+                format_series(columns, args.point_budget)
+                end = time.perf_counter()
+                convert.append(middle - start)
+                fmt.append(end - middle)
+            print(f"{kind:<16}{rows:>10}{min(convert) * 1000:>16.1f}{min(fmt) * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
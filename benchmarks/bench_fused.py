@@ -0,0 +1,119 @@
+"""Compare the multi-step and fused workflow variants on latency, tokens and accuracy.
+
+Runs a fixed question set over data.sqlite, served by the local SQL server stand-in, through
+both graphs with the LLM and SQL template caches disabled, so every run takes the full path.
+A question counts as correct when its result set matches the one of the reference query,
+ignoring row order and column names. Needs OPENAI_API_KEY. Run from the repository root:
+
+    python -m benchmarks.bench_fused [--db data.sqlite] [--repeat 1]
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import time
+
+from benchmarks.local_sql_server import LocalSQLServer
+from my_agent.ResultDecoder import is_result_rows
+
+TABLE = "`supermarket_sales - Sheet1`"
+NOUN_COLUMNS = ("Branch", "City", "Customer type", "Gender", "Product line", "Payment")
+
+QUESTIONS = [
+    ("What is the total revenue for each city?",
+     f"SELECT `City`, SUM(`Total`) FROM {TABLE} GROUP BY `City`"),
+    ("How many invoices were paid with each payment method?",
+     f"SELECT `Payment`, COUNT(*) FROM {TABLE} GROUP BY `Payment`"),
+    ("What is the average rating per product line?",
+     f"SELECT `Product line`, AVG(`Rating`) FROM {TABLE} GROUP BY `Product line`"),
+    ("Which product line sold the most units?",
+     f"SELECT `Product line`, SUM(`Quantity`) AS units FROM {TABLE} GROUP BY `Product line` ORDER BY units DESC LIMIT 1"),
+    ("What is the gross income of members versus normal customers?",
+     f"SELECT `Customer type`, SUM(`gross income`) FROM {TABLE} GROUP BY `Customer type`"),
+    ("How much did women spend on health and beauty in Yangon?",
+     f"SELECT SUM(`Total`) FROM {TABLE} WHERE `Gender` = 'Female' AND `Product line` = 'Health and beauty' "
+     "AND `City` = 'Yangon'"),
+    ("Is there a relationship between unit price and rating?",
+     f"SELECT `Unit price`, `Rating` FROM {TABLE}"),
+    ("What is the weather like today?", None),
+]
+
+
+def result_key(rows):
+    """Order-insensitive fingerprint of a result set, rounding floats to absorb formatting noise."""
+    return sorted(
+        tuple(round(value, 2) if isinstance(value, float) else value for value in row)
+        for row in rows
+    )
+
+
+def reference_results(db_path: str):
+    with sqlite3.connect(db_path) as conn:
+        return [None if query is None else result_key(conn.execute(query).fetchall()) for _, query in QUESTIONS]
+
+
+def is_correct(result: dict, expected) -> bool:
+    if expected is None:
+        return result.get('sql_query') == "NOT_RELEVANT"
+    results = result.get('results')
+    return is_result_rows(results) and result_key(list(results)) == expected
+
+
+def total_usage(workflow_manager) -> dict:
+    managers = {id(manager): manager for manager in (
+        workflow_manager.sql_agent.llm_manager, workflow_manager.data_formatter.llm_manager)}
+    usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    for manager in managers.values():
+        for name in usage:
+            usage[name] += manager.usage[name]
+    return usage
+
+
+def run_variant(workflow_manager, variant: str, expected, repeat: int) -> dict:
+    graph = workflow_manager.get_graph(variant)
+    before = total_usage(workflow_manager)
+    latencies, correct = [], 0
+    for _ in range(repeat):
+        for (question, _), reference in zip(QUESTIONS, expected):
+            start = time.perf_counter()
+            result = graph.invoke({"question": question, "uuid": "bench"})
+            latencies.append(time.perf_counter() - start)
+            correct += is_correct(result, reference)
+    after = total_usage(workflow_manager)
+    runs = len(latencies)
+    return {
+        "variant": variant,
+        "p50": statistics.median(latencies),
+        "mean": statistics.mean(latencies),
+        "calls": (after["calls"] - before["calls"]) / runs,
+        "prompt_tokens": (after["prompt_tokens"] - before["prompt_tokens"]) / runs,
+        "completion_tokens": (after["completion_tokens"] - before["completion_tokens"]) / runs,
+        "accuracy": correct / runs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="data.sqlite")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    expected = reference_results(args.db)
+    with LocalSQLServer(args.db) as server:
+        os.environ["DB_ENDPOINT_URL"] = server.url
+        os.environ["LLM_CACHE_ENABLED"] = "false"
+        # A template stored by one variant would otherwise answer the other variant's questions
+        os.environ["SQL_TEMPLATE_CACHE_ENABLED"] = "false"
+        from my_agent.WorkflowManager import WorkflowManager
+
+        workflow_manager = WorkflowManager()
+
+        print(f"{'variant':>12}{'p50 s':>9}{'mean s':>9}{'calls':>8}{'prompt tok':>12}{'output tok':>12}{'accuracy':>10}")
+        for variant in ("multi_step", "fused"):
+            row = run_variant(workflow_manager, variant, expected, args.repeat)
+            print(f"{row['variant']:>12}{row['p50']:>9.2f}{row['mean']:>9.2f}{row['calls']:>8.1f}"
+                  f"{row['prompt_tokens']:>12.0f}{row['completion_tokens']:>12.0f}{row['accuracy']:>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Compare the JSON and columnar result formats on payload size and decode time.
+
+Builds a synthetic numeric-heavy table, serves it with the local SQL server stand-in and
+fetches the same query in both formats. Run from the repository root:
+
+    python -m benchmarks.bench_wire_format [--rows 10000 100000 1000000]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import requests
+
+from benchmarks.local_sql_server import LocalSQLServer
+from my_agent.ColumnarWire import CONTENT_TYPE as COLUMNAR_CONTENT_TYPE, decode_columnar
+from my_agent.ResultDecoder import decode_results
+
+
+def make_database(path: str, rows: int) -> None:
+    rng = random.Random(0)
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE measurements (id INTEGER, x REAL, y REAL, category TEXT)")
+        conn.executemany(
+            "INSERT INTO measurements VALUES (?, ?, ?, ?)",
+            ((i, rng.random() * 1000, rng.gauss(0, 1), f"c{i % 10}") for i in range(rows)),
+        )
+
+
+def fetch(url: str, accept: str):
+    response = requests.post(
+        f"{url}/execute-query",
+        json={"uuid": "bench", "query": "SELECT id, x, y, category FROM measurements"},
+        headers={"Accept": accept},
+    )
+    response.raise_for_status()
+    return response.content, response.headers["Content-Type"]
+
+
+def best_of(repeat: int, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10}{'format':>10}{'bytes':>14}{'fetch ms':>12}{'columns ms':>12}{'rows ms':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.rows:
+            path = os.path.join(directory, f"bench_{rows}.sqlite")
+            make_database(path, rows)
+            with LocalSQLServer(path) as server:
+                for name, accept in (("json", "application/json"), ("columnar", COLUMNAR_CONTENT_TYPE)):
+                    body, content_type = fetch(server.url, accept)
+                    fetch_time = best_of(args.repeat, lambda: fetch(server.url, accept))
+                    if name == "columnar":
+                        columns_time = best_of(args.repeat, lambda: decode_columnar(body))
+                    else:
+                        columns_time = float("nan")
+                    rows_time = best_of(args.repeat, lambda: decode_results(body, content_type))
+                    print(f"{rows:>10}{name:>10}{len(body):>14,}{fetch_time * 1000:>12.1f}"
+                          f"{columns_time * 1000:>12.2f}{rows_time * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Deterministic stand-in for LLMManager, for benchmarks that must not call OpenAI.
+
+FakeLLMManager answers from recorded responses (keyed like the LLM cache, on the formatted
+messages) and falls back to a script of (pattern, response) rules matched against the
+system message. Every call sleeps for a configurable latency, reports token usage estimated
+from the prompt and response text, and records a trace span like the real manager.
+
+LLMRecorder wraps a real LLMManager and saves its responses for later replay:
+
+    recorder = LLMRecorder(LLMManager())
+    ...run the workflow with llm_manager=recorder...
+    recorder.save("recording.json")
+    fake = FakeLLMManager.from_recording("recording.json", latency=0.5)
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from my_agent.LLMCache import LLMCache
+from my_agent.LLMManager import LLMManager
+from my_agent.Tracing import span
+from my_agent.token_utils import estimate_tokens
+
+MODEL_NAME = "gpt-4o"
+
+# A rule's response is either fixed text or built from the (system, human) message text
+Response = Union[str, Callable[[str, str], str]]
+
+
+def recording_key(messages) -> str:
+    return LLMCache.make_key(MODEL_NAME, 0, messages)
+
+
+class FakeLLMManager:
+    def __init__(self, responses: Optional[Dict[str, str]] = None,
+                 script: Sequence[Tuple[str, Response]] = (), default: str = "",
+                 latency: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        self.responses = dict(responses or {})
+        self.script = [(re.compile(pattern, re.IGNORECASE), response) for pattern, response in script]
+        self.default = default
+        self.latency = latency
+        self.jitter = jitter
+        self.cache = None
+        self.usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_recording(cls, path: str, **kwargs) -> "FakeLLMManager":
+        with open(path) as f:
+            return cls(responses=json.load(f), **kwargs)
+
+    def _delay(self) -> float:
+        with self._lock:
+            return max(self.latency + self._random.uniform(-self.jitter, self.jitter), 0.0)
+
+    def _respond(self, prompt: ChatPromptTemplate, kwargs: dict, record: dict) -> str:
+        messages = prompt.format_messages(**kwargs)
+        response = self.responses.get(recording_key(messages))
+        if response is None:
+            system = next((message.content for message in messages if message.type == "system"), "")
+            human = "\n".join(message.content for message in messages if message.type == "human")
+            rule = next((response for pattern, response in self.script if pattern.search(system)), self.default)
+            response = rule(system, human) if callable(rule) else rule
+
+        prompt_tokens = sum(estimate_tokens(message.content) for message in messages)
+        completion_tokens = estimate_tokens(response)
+        record.update(cache_hit=False, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        with self._lock:
+            self.usage["calls"] += 1
+            self.usage["prompt_tokens"] += prompt_tokens
+            self.usage["completion_tokens"] += completion_tokens
+        return response
+
+    def invoke(self, prompt: ChatPromptTemplate, **kwargs) -> str:
+        with span("llm", LLMManager._prompt_id(prompt)) as record:
+            time.sleep(self._delay())
+            return self._respond(prompt, kwargs, record)
+
+    def invoke_structured(self, prompt: ChatPromptTemplate, output_schema: dict, **kwargs) -> dict:
+        return json.loads(self.invoke(prompt, **kwargs))
+
+    async def ainvoke(self, prompt: ChatPromptTemplate, **kwargs) -> str:
+        with span("llm", LLMManager._prompt_id(prompt)) as record:
+            await asyncio.sleep(self._delay())
+            return self._respond(prompt, kwargs, record)
+
+    async def ainvoke_structured(self, prompt: ChatPromptTemplate, output_schema: dict, **kwargs) -> dict:
+        return json.loads(await self.ainvoke(prompt, **kwargs))
+
+    def stream(self, prompt: ChatPromptTemplate, **kwargs) -> Iterator[str]:
+        for token in _split_tokens(self.invoke(prompt, **kwargs)):
+            yield token
+
+    async def astream(self, prompt: ChatPromptTemplate, **kwargs) -> AsyncIterator[str]:
+        for token in _split_tokens(await self.ainvoke(prompt, **kwargs)):
+            yield token
+
+
+def _split_tokens(text: str) -> List[str]:
+    return re.findall(r"\s*\S+", text) or [text]
+
+
+class LLMRecorder:
+    """Proxy over an LLMManager that keeps every response, keyed for FakeLLMManager replay."""
+
+    def __init__(self, llm_manager: LLMManager):
+        self.llm_manager = llm_manager
+        self.cache = llm_manager.cache
+        self.usage = llm_manager.usage
+        self.responses: Dict[str, str] = {}
+
+    def _record(self, prompt: ChatPromptTemplate, kwargs: dict, response: str) -> str:
+        self.responses[recording_key(prompt.format_messages(**kwargs))] = response
+        return response
+
+    def invoke(self, prompt: ChatPromptTemplate, **kwargs) -> str:
+        return self._record(prompt, kwargs, self.llm_manager.invoke(prompt, **kwargs))
+
+    def invoke_structured(self, prompt: ChatPromptTemplate, output_schema: dict, **kwargs) -> dict:
+        response = self.llm_manager.invoke_structured(prompt, output_schema, **kwargs)
+        self._record(prompt, kwargs, json.dumps(response))
+        return response
+
+    async def ainvoke(self, prompt: ChatPromptTemplate, **kwargs) -> str:
+        return self._record(prompt, kwargs, await self.llm_manager.ainvoke(prompt, **kwargs))
+
+    async def ainvoke_structured(self, prompt: ChatPromptTemplate, output_schema: dict, **kwargs) -> dict:
+        response = await self.llm_manager.ainvoke_structured(prompt, output_schema, **kwargs)
+        self._record(prompt, kwargs, json.dumps(response))
+        return response
+
+    def stream(self, prompt: ChatPromptTemplate, **kwargs) -> Iterator[str]:
+        tokens = []
+        for token in self.llm_manager.stream(prompt, **kwargs):
+            tokens.append(token)
+            yield token
+        self._record(prompt, kwargs, "".join(tokens))
+
+    async def astream(self, prompt: ChatPromptTemplate, **kwargs) -> AsyncIterator[str]:
+        tokens = []
+        async for token in self.llm_manager.astream(prompt, **kwargs):
+            tokens.append(token)
+            yield token
+        self._record(prompt, kwargs, "".join(tokens))
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.responses, f, indent=2, sort_keys=True)
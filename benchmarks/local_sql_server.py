@@ -0,0 +1,185 @@
+"""Local stand-in for the SQL execution server, backed by SQLite files.
+
+Implements the endpoints DatabaseManager talks to:
+
+    GET  /get-schema/<uuid>   -> {"schema": "<CREATE TABLE statements>"}
+    POST /execute-query       -> rows as JSON, NDJSON or the columnar format, per the Accept header
+    POST /execute-queries     -> {"results": [rows, ...]}
+
+Every uuid is served from the default database unless it is registered with its own file.
+make_synthetic_database scales a database such as data.sqlite up to any row count. Run from
+the repository root:
+
+    python -m benchmarks.local_sql_server --db data.sqlite --port 3001 [--rows 1000000]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from my_agent.ColumnarWire import CONTENT_TYPE as COLUMNAR_CONTENT_TYPE, encode_columnar
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+
+def _preferred_content_type(accept: str) -> str:
+    """Pick the supported media type with the highest q value from an Accept header."""
+    supported = (COLUMNAR_CONTENT_TYPE, NDJSON_CONTENT_TYPE, "application/json")
+    best, best_q = "application/json", -1.0
+    for part in accept.split(","):
+        media_type, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            q = float(params.strip()[2:])
+        if media_type.strip() in supported and q > best_q:
+            best, best_q = media_type.strip(), q
+    return best
+
+
+def make_synthetic_database(source: str, path: str, rows: int, seed: int = 0) -> None:
+    """Create path with the tables of source, each filled with rows rows resampled from the original."""
+    rng = random.Random(seed)
+    with sqlite3.connect(f"file:{source}?mode=ro", uri=True) as source_conn, sqlite3.connect(path) as conn:
+        tables = source_conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND sql IS NOT NULL").fetchall()
+        for table_name, create_sql in tables:
+            conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+            conn.execute(create_sql)
+            sample = source_conn.execute(f'SELECT * FROM "{table_name}"').fetchall()
+            if not sample:
+                continue
+            placeholders = ", ".join("?" * len(sample[0]))
+            conn.executemany(
+                f'INSERT INTO "{table_name}" VALUES ({placeholders})',
+                (rng.choice(sample) for _ in range(rows)),
+            )
+
+
+class LocalSQLServer:
+    def __init__(self, default_db: str, databases: Optional[Dict[str, str]] = None,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.default_db = default_db
+        self.databases = dict(databases or {})
+        self.request_count = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def register(self, uuid: str, path: str) -> None:
+        self.databases[uuid] = path
+
+    def connect(self, uuid: str) -> sqlite3.Connection:
+        path = self.databases.get(uuid, self.default_db)
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+    def schema(self, uuid: str) -> str:
+        with self.connect(uuid) as conn:
+            rows = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND sql IS NOT NULL")
+            return ";\n".join(row[0] for row in rows) + ";"
+
+    def start(self) -> "LocalSQLServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "LocalSQLServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(self, status: int, payload) -> None:
+                self._send(status, json.dumps(payload).encode("utf-8"))
+
+            def _read_json(self):
+                length = int(self.headers.get("Content-Length", "0"))
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                server.request_count += 1
+                if not self.path.startswith("/get-schema/"):
+                    return self._send_json(404, {"error": "Not found"})
+                self._send_json(200, {"schema": server.schema(self.path[len("/get-schema/"):])})
+
+            def do_POST(self):
+                server.request_count += 1
+                body = self._read_json()
+                try:
+                    if self.path == "/execute-query":
+                        return self._execute_query(body)
+                    if self.path == "/execute-queries":
+                        with server.connect(body["uuid"]) as conn:
+                            results = [[list(row) for row in conn.execute(query)] for query in body["queries"]]
+                        return self._send_json(200, {"results": results})
+                except sqlite3.Error as e:
+                    return self._send_json(400, {"error": str(e)})
+                self._send_json(404, {"error": "Not found"})
+
+            def _execute_query(self, body):
+                with server.connect(body["uuid"]) as conn:
+                    cursor = conn.execute(body["query"])
+                    names = [column[0] for column in cursor.description or []]
+                    max_rows = body.get("max_rows")
+                    rows = cursor.fetchmany(max_rows + 1) if max_rows else cursor.fetchall()
+
+                content_type = _preferred_content_type(self.headers.get("Accept", ""))
+                if content_type == COLUMNAR_CONTENT_TYPE:
+                    return self._send(200, encode_columnar(names, rows), COLUMNAR_CONTENT_TYPE)
+                if content_type == NDJSON_CONTENT_TYPE:
+                    payload = "".join(json.dumps(list(row)) + "\n" for row in rows).encode("utf-8")
+                    return self._send(200, payload, NDJSON_CONTENT_TYPE)
+                self._send_json(200, {"results": [list(row) for row in rows]})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the SQL execution server")
+    parser.add_argument("--db", default="data.sqlite", help="SQLite file served for every uuid")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3001)
+    parser.add_argument("--rows", type=int, help="Serve a synthetic copy of --db with this many rows per table")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = args.db
+        if args.rows:
+            db = os.path.join(directory, "synthetic.sqlite")
+            make_synthetic_database(args.db, db, args.rows)
+        server = LocalSQLServer(db, host=args.host, port=args.port)
+        print(f"Serving {db} on {server.url}")
+        server.httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Offline scenario runner for the whole workflow.
+
+Serves synthetic copies of data.sqlite at several sizes with the local SQL server stand-in,
+answers every LLM call with the scripted fake LLM and runs a fixed question set through the
+graph at several concurrency levels, with the SQL template cache disabled so every run
+generates its query. Reports throughput, run and per-node p50/p99 latency and, from a
+separate one-at-a-time pass under tracemalloc, peak memory per node. No network access or
+API key is needed. Run from the repository root:
+
+    python -m benchmarks.run_scenarios [--sizes 1000 100000] [--concurrency 1 4 8] [--latency 0.2]
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from benchmarks.bench_fused import NOUN_COLUMNS, QUESTIONS, TABLE
+from benchmarks.fake_llm import FakeLLMManager
+from benchmarks.local_sql_server import LocalSQLServer, make_synthetic_database
+from my_agent.DatabaseManager import DatabaseManager
+from my_agent.Tracing import run_trace
+from my_agent.WorkflowManager import WorkflowManager
+
+
+def _question_sql(human: str) -> Optional[str]:
+    return next((sql for question, sql in QUESTIONS if question in human), None)
+
+
+def _parsed_question(sql: Optional[str]) -> dict:
+    if sql is None:
+        return {"is_relevant": False, "relevant_tables": []}
+    table_name = TABLE.strip("`")
+    columns = list(dict.fromkeys(name for name in re.findall(r"`([^`]+)`", sql) if name != table_name))
+    return {
+        "is_relevant": True,
+        "relevant_tables": [{
+            "table_name": table_name,
+            "columns": columns,
+            "noun_columns": [column for column in columns if column in NOUN_COLUMNS],
+        }],
+    }
+
+
+def scripted_llm(latency: float, jitter: float, recording: Optional[str] = None) -> FakeLLMManager:
+    """Fake LLM that answers each workflow prompt for the fixed question set."""
+    script = [
+        ("in sql_query", lambda system, human: json.dumps(
+            {**_parsed_question(_question_sql(human)), "sql_query": _question_sql(human) or ""})),
+        ("identify the relevant tables", lambda system, human: json.dumps(_parsed_question(_question_sql(human)))),
+        ("generates SQL queries", lambda system, human: _question_sql(human) or "NOT_ENOUGH_INFO"),
+        ("validates and fixes", json.dumps({"valid": True, "issues": None, "corrected_query": "None"})),
+        ("recommends appropriate data visualizations", "Recommended Visualization: bar\nReason: Scripted response."),
+        ("data labeling expert", "Value"),
+        ("formats database query results", "The scripted answer summarises the query results in one line."),
+        ("formats data according", "{}"),
+    ]
+    responses = None
+    if recording:
+        with open(recording) as f:
+            responses = json.load(f)
+    return FakeLLMManager(responses=responses, script=script, latency=latency, jitter=jitter)
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def run_once(workflow_manager, question: str) -> dict:
+    """Run the graph directly, bypassing the result cache, and return the run's trace summary."""
+    with run_trace() as trace:
+        workflow_manager.get_graph().invoke({"question": question, "uuid": "bench"})
+    return trace.summary()
+
+
+def run_scenario(workflow_manager, runs: int, concurrency: int) -> Dict[str, object]:
+    questions = [QUESTIONS[index % len(QUESTIONS)][0] for index in range(runs)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        traces = list(executor.map(lambda question: run_once(workflow_manager, question), questions))
+    elapsed = time.perf_counter() - start
+
+    node_times = defaultdict(list)
+    for trace in traces:
+        for record in trace["spans"]:
+            if record["kind"] == "node":
+                node_times[record["name"]].append(record["duration"])
+    run_times = [trace["wall_time"] for trace in traces]
+    return {"throughput": runs / elapsed, "run": run_times, "nodes": node_times}
+
+
+def node_peak_memory(workflow_manager) -> Dict[str, int]:
+    """Peak memory per node over one serial pass of the question set."""
+    peaks = defaultdict(int)
+    tracemalloc.start()
+    try:
+        for question, _ in QUESTIONS:
+            for record in run_once(workflow_manager, question)["spans"]:
+                if record["kind"] == "node":
+                    peaks[record["name"]] = max(peaks[record["name"]], record.get("peak_memory", 0))
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="data.sqlite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--runs", type=int, default=32, help="Workflow runs per scenario")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per fake LLM call")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--recording", help="JSON recording from benchmarks.fake_llm.LLMRecorder to replay")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass")
+    args = parser.parse_args()
+
+    # Templates stored by the first scenario would let later ones skip SQL generation
+    os.environ["SQL_TEMPLATE_CACHE_ENABLED"] = "false"
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["NOUN_INDEX_PATH"] = os.path.join(directory, "noun_index.sqlite")
+
+        for size in args.sizes:
+            path = os.path.join(directory, f"synthetic_{size}.sqlite")
+            make_synthetic_database(args.db, path, size)
+            with LocalSQLServer(path) as server:
+                os.environ["DB_ENDPOINT_URL"] = server.url
+                workflow_manager = WorkflowManager(
+                    db_manager=DatabaseManager(), llm_manager=scripted_llm(args.latency, args.jitter, args.recording))
+                # Warm the schema cache and the noun index so every scenario starts from the same state
+                run_once(workflow_manager, QUESTIONS[0][0])
+
+                print(f"\n== {size:,} rows per table ==")
+                print(f"{'concurrency':>12}{'runs/s':>10}{'run p50':>10}{'run p99':>10}")
+                node_stats = {}
+                for concurrency in args.concurrency:
+                    result = run_scenario(workflow_manager, args.runs, concurrency)
+                    print(f"{concurrency:>12}{result['throughput']:>10.2f}"
+                          f"{statistics.median(result['run']):>10.3f}{percentile(result['run'], 0.99):>10.3f}")
+                    node_stats[concurrency] = result["nodes"]
+
+                peaks = {} if args.no_memory else node_peak_memory(workflow_manager)
+                print(f"\n{'node':>32}{'concurrency':>12}{'p50 s':>10}{'p99 s':>10}{'peak MiB':>10}")
+                for concurrency, nodes in node_stats.items():
+                    for node, durations in nodes.items():
+                        peak = peaks.get(node)
+                        peak_text = f"{peak / 2 ** 20:>10.2f}" if peak is not None else f"{'-':>10}"
+                        print(f"{node:>32}{concurrency:>12}{statistics.median(durations):>10.4f}"
+                              f"{percentile(durations, 0.99):>10.4f}{peak_text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+_TREND_WORDS = re.compile(r"\b(trend|over time|per (day|week|month|year)|daily|weekly|monthly|yearly|timeline)\b", re.IGNORECASE)
+_CORRELATION_WORDS = re.compile(r"\b(correlat\w*|relationship|versus|vs\.?)\b", re.IGNORECASE)
+_DISTRIBUTION_WORDS = re.compile(r"\bdistribution\b", re.IGNORECASE)
+_PROPORTION_WORDS = re.compile(r"\b(share|proportion|percent\w*|breakdown|composition|% of)\b", re.IGNORECASE)
+
+
+def _is_year_like(column: Dict[str, Any]) -> bool:
+    return column["type"] == "numeric" and 1900 <= column["min"] and column["max"] <= 2100 and \
+        float(column["min"]).is_integer() and float(column["max"]).is_integer()
+
+
+def _is_time_axis(column: Dict[str, Any]) -> bool:
+    return column["type"] == "date" or _is_year_like(column)
+
+
+def _classify_two_columns(question: str, x: Dict[str, Any], y: Dict[str, Any], row_count: int) -> Tuple[Optional[str], float, str]:
+    if y["type"] != "numeric":
+        return None, 0.0, "The second column is not numeric."
+
+    if _is_time_axis(x):
+        return "line", 0.9, "The x axis is time based and the y axis is numeric."
+
+    if x["type"] == "numeric":
+        if _CORRELATION_WORDS.search(question) or _DISTRIBUTION_WORDS.search(question):
+            return "scatter", 0.9, "Both axes are continuous and the question asks about a relationship or distribution."
+        if row_count > 10:
+            return "scatter", 0.8, "Both axes are continuous."
+        return "scatter", 0.5, "Both axes are numeric but there are only a few points."
+
+    categories = x.get("distinct_count", row_count)
+    if categories <= 8 and 98.5 <= y["sum"] <= 101.5 and y["min"] >= 0:
+        return "pie", 0.9, "The values are proportions of a whole that sum to 100%."
+    if categories <= 8 and _PROPORTION_WORDS.search(question) and y["min"] >= 0:
+        return "pie", 0.8, "The question asks for proportions of a whole across a few categories."
+    if categories <= 2:
+        return "horizontal_bar", 0.8, "Only a small number of categories are being compared."
+    if categories <= 30:
+        return "bar", 0.85, "Categorical x axis with a numeric value per category."
+    return "bar", 0.6, "Categorical x axis with many categories."
+
+
+def _classify_three_columns(question: str, columns: List[Dict[str, Any]]) -> Tuple[Optional[str], float, str]:
+    if columns[2]["type"] != "numeric":
+        return None, 0.0, "The last column is not numeric."
+
+    # The series label is a text column among the first two, the other one is the x axis
+    label, x = columns[1], columns[0]
+    if label["type"] != "text":
+        label, x = x, label
+    if label["type"] != "text":
+        return None, 0.0, "No categorical series column was found."
+
+    if _is_time_axis(x):
+        return "line", 0.85, "A time based x axis with one series per category."
+    if x["type"] == "numeric":
+        return "scatter", 0.75, "Two continuous variables grouped by category."
+    if x["type"] == "text":
+        return "bar", 0.8, "Two categorical dimensions with a numeric value, shown as grouped bars."
+    return None, 0.0, "The series column could not be identified."
+
+
+def classify_chart(question: str, digest: Dict[str, Any]) -> Tuple[Optional[str], float, str]:
+    """Pick a chart type from the shape of the result. Returns (visualization, confidence, reason)."""
+    row_count = digest["row_count"]
+    columns = digest["columns"]
+
+    if row_count == 0:
+        return "none", 0.95, "The query returned no rows."
+    if len(columns) < 2 or row_count == 1:
+        return "none", 0.9, "A single value does not need a visualization."
+    if any(column["type"] == "empty" for column in columns):
+        return None, 0.0, "Some columns have no values."
+
+    if len(columns) == 2:
+        visualization, confidence, reason = _classify_two_columns(question, columns[0], columns[1], row_count)
+    elif len(columns) == 3:
+        visualization, confidence, reason = _classify_three_columns(question, columns)
+    else:
+        return None, 0.0, "Results with more than three columns are ambiguous."
+
+    # A line chart is only a confident pick when the question is about change over time
+    if visualization == "line" and not _TREND_WORDS.search(question) and confidence < 0.9:
+        confidence -= 0.1
+    return visualization, confidence, reason
@@ -0,0 +1,198 @@
+import warnings
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from my_agent.ColumnarWire import ColumnarResult
+from my_agent.Downsampling import lttb_indices, bin_2d, value_range
+
+_is_str = np.frompyfunc(lambda value: isinstance(value, str), 1, 1)
+
+
+def to_columns(results: Sequence[Any]) -> List[np.ndarray]:
+    """Convert result rows into one array per column.
+
+    Rows become object arrays. A ColumnarResult keeps its numeric columns as the arrays
+    decoded over the response body, so they reach the formatter without a copy.
+    """
+    if isinstance(results, ColumnarResult):
+        if not len(results):
+            raise IndexError("Empty result")
+        return [results.column_array(index) for index in range(len(results.columns))]
+    table = np.empty((len(results), len(results[0])), dtype=object)
+    table[:] = results
+    return [table[:, index] for index in range(table.shape[1])]
+
+
+def as_float(column: np.ndarray) -> np.ndarray:
+    # No copy for float64 columns decoded from the columnar wire format
+    return np.asarray(column, dtype=np.float64)
+
+
+def as_str(column: np.ndarray) -> np.ndarray:
+    return column.astype(str)
+
+
+def to_list(values: np.ndarray) -> List[Any]:
+    """Convert a float array to a list, with missing values as None."""
+    if not np.isnan(values).any():
+        return values.tolist()
+    return np.where(np.isnan(values), None, values.astype(object)).tolist()
+
+
+def is_label_column(column: np.ndarray) -> bool:
+    """A label column holds strings that are neither numbers nor dates (no "/")."""
+    if column.dtype != object or not _is_str(column).astype(bool).all():
+        return False
+    strings = as_str(column)
+    return not (np.char.isdigit(np.char.replace(strings, ".", "")).any() or (np.char.find(strings, "/") >= 0).any())
+
+
+def split_label_columns(columns: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return (label, x, y) for a three column result, taking the label from the first column if it holds labels."""
+    if is_label_column(columns[0]):
+        return columns[0], columns[1], columns[2]
+    return columns[1], columns[0], columns[2]
+
+
+def unique_in_order(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the unique keys in order of first appearance and the index of each key in that list."""
+    uniques, first_index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first_index, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return uniques[order], rank[inverse.reshape(-1)]
+
+
+def pivot(row_keys: np.ndarray, column_keys: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Pivot long (row key, column key, value) data into a matrix, with NaN where a pair is missing.
+
+    Raises ValueError when a (row key, column key) pair occurs more than once, rather than
+    silently keeping only one of its values.
+    """
+    row_uniques, row_index = unique_in_order(row_keys)
+    column_uniques, column_index = unique_in_order(column_keys)
+    cells = row_index * len(column_uniques) + column_index
+    if np.unique(cells).size != cells.size:
+        raise ValueError("Results hold more than one value for the same label and x value")
+    matrix = np.full((len(row_uniques), len(column_uniques)), np.nan)
+    matrix[row_index, column_index] = values
+    return row_uniques, column_uniques, matrix
+
+
+def group_by(keys: np.ndarray, *arrays: np.ndarray) -> List[Tuple[Any, List[np.ndarray]]]:
+    """Split arrays by key, keeping keys in order of first appearance and rows in their original order."""
+    uniques, index = unique_in_order(keys)
+    order = np.argsort(index, kind="stable")
+    bounds = np.cumsum(np.bincount(index, minlength=len(uniques)))[:-1]
+    groups = [np.split(array[order], bounds) for array in arrays]
+    return [(key, [group[position] for group in groups]) for position, key in enumerate(uniques.tolist())]
+
+
+def _downsampling(method: str, original_points: int, points: int, budget: Optional[int]) -> Dict[str, Any]:
+    return {"method": method, "original_points": original_points, "points": points, "budget": budget}
+
+
+def line_series(columns: List[np.ndarray], point_budget: Optional[int] = None, method: str = "lttb") -> Dict[str, Any]:
+    """xValues and one y series per label, aligned on the x axis and reduced to point_budget x values with LTTB."""
+    if len(columns) == 2:
+        x_values, matrix = as_str(columns[0]), as_float(columns[1])[np.newaxis, :]
+        labels = None
+    else:
+        label, x, y = split_label_columns(columns)
+        labels, x_values, matrix = pivot(as_str(label), as_str(x), as_float(y))
+
+    original_points = len(x_values)
+    if method == "lttb" and point_budget and original_points > point_budget:
+        # Series share the x axis, so pick the x positions on the average across series
+        with warnings.catch_warnings():
+            # nanmean warns for x values that are NULL in every series
+            warnings.simplefilter("ignore", RuntimeWarning)
+            representative = np.nan_to_num(np.nanmean(matrix, axis=0))
+        indices = lttb_indices(np.arange(original_points, dtype=np.float64), representative, point_budget)
+        x_values, matrix = x_values[indices], matrix[:, indices]
+    else:
+        method = "none"
+
+    if labels is None:
+        y_values = [{"data": to_list(matrix[0])}]
+    else:
+        y_values = [{"data": to_list(row), "label": name} for name, row in zip(labels.tolist(), matrix)]
+    return {
+        "xValues": x_values.tolist(),
+        "yValues": y_values,
+        "downsampling": _downsampling(method, original_points, len(x_values), point_budget),
+    }
+
+
+def bar_series(columns: List[np.ndarray]) -> Dict[str, Any]:
+    """Category labels and one value series per entity, aligned on the categories."""
+    if len(columns) == 2:
+        return {
+            "labels": as_str(columns[0]).tolist(),
+            "values": [{"data": to_list(as_float(columns[1]))}],
+        }
+    entities, labels, matrix = pivot(as_str(columns[0]), as_str(columns[1]), as_float(columns[2]))
+    return {
+        "labels": labels.tolist(),
+        "values": [{"data": to_list(row), "label": entity} for entity, row in zip(entities.tolist(), matrix)],
+    }
+
+
+def scatter_series(columns: List[np.ndarray], point_budget: Optional[int] = None, method: str = "bin") -> Dict[str, Any]:
+    """One series of {x, y, id} points, or one series per label for three column results.
+
+    Above point_budget points the series are binned on a shared 2-D grid and each point
+    carries the number of rows in its cell as "count".
+    """
+    if len(columns) == 2:
+        groups = [("Data Points", [as_float(columns[0]), as_float(columns[1])])]
+        xs, ys = groups[0][1]
+    else:
+        label, x, y = split_label_columns(columns)
+        xs, ys = as_float(x), as_float(y)
+        groups = group_by(as_str(label), xs, ys)
+
+    original_points = len(xs)
+    if method == "bin" and point_budget and original_points > point_budget:
+        bins = max(int(np.sqrt(point_budget / len(groups))), 1)
+        x_range, y_range = value_range(xs), value_range(ys)
+        series = []
+        for name, (group_xs, group_ys) in groups:
+            centers_x, centers_y, counts = bin_2d(group_xs, group_ys, bins, x_range, y_range)
+            series.append({
+                "data": [
+                    {"x": x, "y": y, "id": point_id, "count": count}
+                    for point_id, (x, y, count) in enumerate(
+                        zip(centers_x.tolist(), centers_y.tolist(), counts.tolist()), start=1
+                    )
+                ],
+                "label": name,
+            })
+    else:
+        method = "none"
+        series = [
+            {
+                "data": [
+                    {"x": x, "y": y, "id": point_id}
+                    for point_id, (x, y) in enumerate(zip(to_list(group_xs), to_list(group_ys)), start=1)
+                ],
+                "label": name,
+            }
+            for name, (group_xs, group_ys) in groups
+        ]
+
+    points = sum(len(item["data"]) for item in series)
+    return {"series": series, "downsampling": _downsampling(method, original_points, points, point_budget)}
+
+
+def format_chart(visualization: str, columns: List[np.ndarray], point_budget: Optional[int] = None,
+                 line_method: str = "lttb", scatter_method: str = "bin") -> Dict[str, Any]:
+    """Build the chart payload for a visualization from two or three result columns."""
+    if len(columns) not in (2, 3):
+        raise ValueError("Unexpected data format in results")
+    if visualization == "scatter":
+        return scatter_series(columns, point_budget, scatter_method)
+    if visualization == "bar" or visualization == "horizontal_bar":
+        return bar_series(columns)
+    if visualization == "line":
+        return line_series(columns, point_budget, line_method)
+    raise ValueError(f"No local formatter for {visualization}")
@@ -0,0 +1,201 @@
+"""Compact columnar wire format for query results.
+
+Layout: b"DVC1", a little-endian uint32 header length, a JSON header and then the column
+buffers, each starting on an 8-byte boundary. The header lists the row count and, per
+column, its name, type and buffer (offset, length) pairs relative to the start of the
+body. Types are "f8" and "i8" (one little-endian value per row), "str" (int64 offsets
+plus UTF-8 data) and "json" (a JSON-encoded list, used for mixed-type columns). Every
+column may also carry a one byte per row validity mask where 0 marks NULL.
+
+Numeric buffers are decoded with np.frombuffer, i.e. without copying the body.
+"""
+import dataclasses
+import json
+import struct
+from collections import abc
+import numpy as np
+from typing import Any, Iterator, List, Optional, Sequence
+
+CONTENT_TYPE = "application/x-datavis-columnar"
+MAGIC = b"DVC1"
+
+
+def _column_type(values: Sequence[Any]) -> str:
+    # Fast path on the exact value types; subclasses such as numpy scalars take the slow path
+    types = set(map(type, values))
+    types.discard(type(None))
+    if types <= {int}:
+        return "i8" if types else "f8"
+    if types <= {int, float}:
+        return "f8"
+    if types == {str}:
+        return "str"
+
+    present = [value for value in values if value is not None]
+    if all(isinstance(value, int) and not isinstance(value, bool) for value in present):
+        return "i8" if present else "f8"
+    if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+        return "f8"
+    if all(isinstance(value, str) for value in present):
+        return "str"
+    return "json"
+
+
+def encode_columnar(names: List[str], rows: Sequence[Sequence[Any]]) -> bytes:
+    """Encode rows as the columnar wire format."""
+    buffers: List[bytes] = []
+    offset = 0
+    columns = []
+
+    def add(buffer: bytes) -> List[int]:
+        nonlocal offset
+        padding = -offset % 8
+        if padding:
+            buffers.append(b"\0" * padding)
+            offset += padding
+        buffers.append(buffer)
+        start, offset = offset, offset + len(buffer)
+        return [start, len(buffer)]
+
+    for index, name in enumerate(names):
+        values = [row[index] for row in rows]
+        column_type = _column_type(values)
+        column = {"name": name, "type": column_type}
+        if column_type != "json" and None in values:
+            column["validity"] = add(np.array([value is not None for value in values], dtype=np.uint8).tobytes())
+        if column_type in ("f8", "i8"):
+            fill = 0 if column_type == "i8" else np.nan
+            data = np.array([fill if value is None else value for value in values], dtype="<" + column_type)
+            column["data"] = add(data.tobytes())
+        elif column_type == "str":
+            strings = [value or "" for value in values] if None in values else values
+            data = "".join(strings).encode("utf-8")
+            # Character counts are byte counts for ASCII data, which saves encoding each value
+            lengths = list(map(len, strings)) if len(data) == sum(map(len, strings)) else \
+                [len(value.encode("utf-8")) for value in strings]
+            offsets = np.zeros(len(strings) + 1, dtype="<i8")
+            np.cumsum(lengths, out=offsets[1:])
+            column["offsets"] = add(offsets.tobytes())
+            column["data"] = add(data)
+        else:
+            column["data"] = add(json.dumps(values, default=str).encode("utf-8"))
+        columns.append(column)
+
+    header = json.dumps({"row_count": len(rows), "columns": columns}).encode("utf-8")
+    prefix = MAGIC + struct.pack("<I", len(header)) + header
+    prefix += b"\0" * (-len(prefix) % 8)
+    return prefix + b"".join(buffers)
+
+
+@dataclasses.dataclass(eq=False, repr=False)
+class ColumnarResult(abc.Sequence):
+    """Decoded columnar result, also usable as a read-only sequence of rows.
+
+    Numeric columns are views over body. Rows are built only as they are indexed or iterated,
+    a chunk at a time, so the result can be consumed without materialising the list of rows.
+    body and row_limit are the only fields, so a checkpointer stores the compact body and the
+    columns are decoded again when the state is loaded.
+    """
+    body: bytes
+    row_limit: Optional[int] = None
+
+    def __post_init__(self):
+        view = memoryview(self.body)
+        if bytes(view[:4]) != MAGIC:
+            raise ValueError("Not a columnar result body")
+        (header_length,) = struct.unpack_from("<I", view, 4)
+        header = json.loads(bytes(view[8:8 + header_length]))
+        start = 8 + header_length
+        start += -start % 8
+        self.total_row_count = header["row_count"]
+        self.row_count = self.total_row_count if self.row_limit is None else min(self.total_row_count, self.row_limit)
+
+        def buffer(location: List[int]) -> memoryview:
+            return view[start + location[0]:start + location[0] + location[1]]
+
+        self.names, self.columns, self.validity = [], [], []
+        for column in header["columns"]:
+            self.names.append(column["name"])
+            self.validity.append(
+                np.frombuffer(buffer(column["validity"]), dtype=np.uint8, count=self.row_count)
+                if "validity" in column else None
+            )
+            if column["type"] in ("f8", "i8"):
+                values = np.frombuffer(buffer(column["data"]), dtype="<" + column["type"], count=self.row_count)
+            elif column["type"] == "str":
+                offsets = np.frombuffer(buffer(column["offsets"]), dtype="<i8", count=self.row_count + 1).tolist()
+                data = bytes(buffer(column["data"])[:offsets[-1]])
+                values = [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(self.row_count)]
+            else:
+                values = json.loads(bytes(buffer(column["data"])))[:self.row_count]
+            self.columns.append(values)
+
+    def column_values(self, index: int, start: int = 0, stop: Optional[int] = None) -> List[Any]:
+        """Return one column (or its rows start:stop) as a Python list, with NULLs as None."""
+        column, validity = self.columns[index][start:stop], self.validity[index]
+        values = column.tolist() if isinstance(column, np.ndarray) else list(column)
+        if validity is not None:
+            values = [value if valid else None for value, valid in zip(values, validity[start:stop].tolist())]
+        return values
+
+    def column_array(self, index: int) -> np.ndarray:
+        """Return one column as an array: the zero-copy view over body for numeric columns without
+        NULLs, otherwise an object array with NULLs as None."""
+        column = self.columns[index]
+        if isinstance(column, np.ndarray) and self.validity[index] is None:
+            return column
+        values = np.empty(self.row_count, dtype=object)
+        values[:] = self.column_values(index)
+        return values
+
+    def _rows_between(self, start: int, stop: int) -> List[List[Any]]:
+        if not self.columns:
+            return [[] for _ in range(start, stop)]
+        return [list(row) for row in zip(*(
+            self.column_values(index, start, stop) for index in range(len(self.columns))
+        ))]
+
+    def iter_rows(self, chunk_size: int = 4096) -> Iterator[List[Any]]:
+        for start in range(0, self.row_count, chunk_size):
+            yield from self._rows_between(start, min(start + chunk_size, self.row_count))
+
+    def to_rows(self) -> List[List[Any]]:
+        return self._rows_between(0, self.row_count)
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    def __iter__(self) -> Iterator[List[Any]]:
+        return self.iter_rows()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.row_count)
+            if step == 1:
+                return self._rows_between(start, max(start, stop))
+            return [self[position] for position in range(start, stop, step)]
+        if index < 0:
+            index += self.row_count
+        if not 0 <= index < self.row_count:
+            raise IndexError("row index out of range")
+        return [self.column_values(column, index, index + 1)[0] for column in range(len(self.columns))]
+
+    def __repr__(self) -> str:
+        return repr(self.to_rows())
+
+
+def decode_columnar(body: bytes, row_limit: Optional[int] = None) -> ColumnarResult:
+    """Decode the columnar wire format, keeping at most row_limit rows."""
+    return ColumnarResult(bytes(body) if not isinstance(body, bytes) else body, row_limit)
+
+
+def decode_columnar_rows(body: bytes) -> List[List[Any]]:
+    return decode_columnar(body).to_rows()
+
+
+def decode_arrow_rows(body: bytes) -> List[List[Any]]:
+    """Decode an Arrow IPC stream into rows. Requires the optional pyarrow dependency."""
+    import pyarrow
+
+    table = pyarrow.ipc.open_stream(body).read_all()
+    return [list(row) for row in zip(*(column.to_pylist() for column in table.columns))]
@@ -1,212 +1,172 @@
 import json
+import os
+from concurrent.futures.process import BrokenProcessPool
 from langchain_core.prompts import ChatPromptTemplate
 from my_agent.LLMManager import LLMManager
 from my_agent.graph_instructions import graph_instructions
+from my_agent.ResultDigest import results_for_prompt
+from my_agent.ResultDecoder import decode_results, is_result_rows
+from my_agent.ColumnarFormatter import to_columns, format_chart
+from my_agent.ColumnarWire import ColumnarResult
+from my_agent.FormatExecutor import format_chart_offloaded, aformat_chart_offloaded
+from my_agent.Tracing import span
+
+LINE_SERIES_LABEL_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a data labeling expert. Given a question and some data, provide a concise and relevant label for the data series."),
+    ("human", "Question: {question}\n Data (first few rows): {data}\n\nProvide a concise label for this y axis. For example, if the data is the sales figures over time, the label could be 'Sales'. If the data is the population growth, the label could be 'Population'. If the data is the revenue trend, the label could be 'Revenue'."),
+])
+
+LINE_AXIS_LABEL_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a data labeling expert. Given a question and some data, provide a concise and relevant label for the y-axis."),
+    ("human", "Question: {question}\n Data (first few rows): {data}\n\nProvide a concise label for the y-axis. For example, if the data represents sales figures over time for different categories, the label could be 'Sales'. If it's about population growth for different groups, it could be 'Population'."),
+])
+
+BAR_SERIES_LABEL_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a data labeling expert. Given a question and some data, provide a concise and relevant label for the data series."),
+    ("human", "Question: {question}\nData (first few rows): {data}\n\nProvide a concise label for this y axis. For example, if the data is the sales figures for products, the label could be 'Sales'. If the data is the population of cities, the label could be 'Population'. If the data is the revenue by region, the label could be 'Revenue'."),
+])
+
+OTHER_VISUALIZATION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You are a Data expert who formats data according to the required needs. You are given the question asked by the user, it's sql query, the result of the query and the format you need to format it in."),
+    ("human", 'For the given question: {question}\n\nSQL query: {sql_query}\n\Result: {results}\n\nUse the following example to structure the data: {instructions}. Just give the json string. Do not format it'),
+])
 
 
 class DataFormatter:
-    def __init__(self):
-        self.llm_manager = LLMManager()
+    def __init__(self, llm_manager: LLMManager = None):
+        self.llm_manager = llm_manager or LLMManager()
+        self.point_budget = int(os.getenv("CHART_POINT_BUDGET", "2000"))
+        self.line_downsample_method = os.getenv("LINE_DOWNSAMPLE_METHOD", "lttb")
+        self.scatter_downsample_method = os.getenv("SCATTER_DOWNSAMPLE_METHOD", "bin")
+        # "process" formats columnar results of at least offload_min_rows rows in a worker process
+        self.executor = os.getenv("FORMAT_EXECUTOR", "inline")
+        self.offload_min_rows = int(os.getenv("FORMAT_OFFLOAD_MIN_ROWS", "20000"))
 
     
     def format_data_for_visualization(self, state: dict) -> dict:
         """Format the data for the chosen visualization type."""
         visualization = state['visualization']
-        results = state['results']
-        question = state['question']
-        sql_query = state['sql_query']
+        if visualization == "none":
+            return {"formatted_data_for_visualization": None}
 
+        try:
+            results, formatted_data = self._format_chart_data(visualization, state['results'])
+            label_prompt = self._label_prompt(visualization, results)
+            if label_prompt is not None:
+                label = self.llm_manager.invoke(label_prompt, question=state['question'], data=str(results[:2]))
+                self._apply_label(visualization, formatted_data, label, len(results[0]))
+            return {"formatted_data_for_visualization": formatted_data}
+        except Exception as e:
+            return self._format_other_visualizations(
+                visualization, state['question'], state['sql_query'], state['results'], state.get('results_digest')
+            )
+
+    async def aformat_data_for_visualization(self, state: dict) -> dict:
+        """Async variant of format_data_for_visualization."""
+        visualization = state['visualization']
         if visualization == "none":
             return {"formatted_data_for_visualization": None}
-        
-        if visualization == "scatter":
-            try:
-                return self._format_scatter_data(results)
-            except Exception as e:
-                return self._format_other_visualizations(visualization, question, sql_query, results)
-        
-        if visualization == "bar" or visualization == "horizontal_bar":
-            try:
-                return self._format_bar_data(results, question)
-            except Exception as e:
-                return self._format_other_visualizations(visualization, question, sql_query, results)
-        
+
+        try:
+            results, formatted_data = await self._aformat_chart_data(visualization, state['results'])
+            label_prompt = self._label_prompt(visualization, results)
+            if label_prompt is not None:
+                label = await self.llm_manager.ainvoke(label_prompt, question=state['question'], data=str(results[:2]))
+                self._apply_label(visualization, formatted_data, label, len(results[0]))
+            return {"formatted_data_for_visualization": formatted_data}
+        except Exception as e:
+            return await self._aformat_other_visualizations(
+                visualization, state['question'], state['sql_query'], state['results'], state.get('results_digest')
+            )
+
+    async def aprefetch_label(self, visualization: str, question: str, results) -> None:
+        """Warm the LLM cache with the label request format_data_for_visualization is likely to make."""
+        if self.llm_manager.cache is None or not is_result_rows(results) or not results:
+            return
+        label_prompt = self._label_prompt(visualization, results)
+        if label_prompt is None:
+            return
+        try:
+            await self.llm_manager.ainvoke(label_prompt, question=question, data=str(results[:2]))
+        except Exception:
+            pass
+
+    def _format_chart_data(self, visualization, results):
+        """Decode the results once and build the chart payload locally. Returns (rows, formatted data)."""
+        results = decode_results(results)
+        with span("format", "chart", rows=len(results)) as record:
+            if self._offload(visualization, results):
+                record["offloaded"] = True
+                try:
+                    return results, format_chart_offloaded(visualization, results, *self._chart_options())
+                except BrokenProcessPool:
+                    record["offloaded"] = False
+            return results, format_chart(visualization, to_columns(results), *self._chart_options())
+
+    async def _aformat_chart_data(self, visualization, results):
+        """Async variant of _format_chart_data that awaits offloaded formatting without blocking the event loop."""
+        results = decode_results(results)
+        with span("format", "chart", rows=len(results)) as record:
+            if self._offload(visualization, results):
+                record["offloaded"] = True
+                try:
+                    return results, await aformat_chart_offloaded(visualization, results, *self._chart_options())
+                except BrokenProcessPool:
+                    record["offloaded"] = False
+            return results, format_chart(visualization, to_columns(results), *self._chart_options())
+
+    def _offload(self, visualization, results) -> bool:
+        """Send the job to the process pool only when it is big enough to outweigh the round trip.
+
+        Only columnar results are offloaded: their body is passed on as is, whereas a list of
+        rows would have to be encoded first in this process, holding the GIL.
+        """
+        return (
+            self.executor == "process"
+            and isinstance(results, ColumnarResult)
+            and len(results) >= self.offload_min_rows
+            and visualization in ("bar", "horizontal_bar", "line", "scatter")
+            and len(results[0]) in (2, 3)
+        )
+
+    def _chart_options(self):
+        return self.point_budget, self.line_downsample_method, self.scatter_downsample_method
+
+    @staticmethod
+    def _label_prompt(visualization, results):
+        """Return the prompt used to label the chart, or None if it does not need a label."""
+        column_count = len(results[0])
         if visualization == "line":
-            try:
-                return self._format_line_data(results, question)
-            except Exception as e:
-                return self._format_other_visualizations(visualization, question, sql_query, results)
-        
-        return self._format_other_visualizations(visualization, question, sql_query, results)
-    
-    def _format_line_data(self, results, question):
-        if isinstance(results, str):
-            results = eval(results)
-
-        if len(results[0]) == 2:
-
-            x_values = [str(row[0]) for row in results]
-            y_values = [float(row[1]) for row in results]
-
-            # Use LLM to get a relevant label
-            prompt = ChatPromptTemplate.from_messages([
-                ("system", "You are a data labeling expert. Given a question and some data, provide a concise and relevant label for the data series."),
-                ("human", "Question: {question}\n Data (first few rows): {data}\n\nProvide a concise label for this y axis. For example, if the data is the sales figures over time, the label could be 'Sales'. If the data is the population growth, the label could be 'Population'. If the data is the revenue trend, the label could be 'Revenue'."),
-            ])
-            label = self.llm_manager.invoke(prompt, question=question, data=str(results[:2]))
-
-            formatted_data = {
-                "xValues": x_values,
-                "yValues": [
-                    {
-                        "data": y_values,
-                        "label": label.strip()
-                    }
-                ]
-            }
-        elif len(results[0]) == 3:
-
-            # Group data by label
-            data_by_label = {}
-            x_values = []
-
-            # Get a list of unique labels
-            labels = list(set(item2 for item1, item2, item3 in results 
-                              if isinstance(item2, str) and not item2.replace(".", "").isdigit() and "/" not in item2))
-            
-            # If labels are not in the second position, check the first position
-            if not labels:
-                labels = list(set(item1 for item1, item2, item3 in results 
-                                  if isinstance(item1, str) and not item1.replace(".", "").isdigit() and "/" not in item1))
-
-            for item1, item2, item3 in results:
-                # Determine which item is the label (string not convertible to float and not containing "/")
-                if isinstance(item1, str) and not item1.replace(".", "").isdigit() and "/" not in item1:
-                    label, x, y = item1, item2, item3
-                else:
-                    x, label, y = item1, item2, item3
-                    
-
-                if str(x) not in x_values:
-                    x_values.append(str(x))
-                if label not in data_by_label:
-                    data_by_label[label] = []
-                data_by_label[label].append(float(y))
-                print(labels)
-                for other_label in labels:
-                    if other_label != label:
-                        if other_label not in data_by_label:
-                            data_by_label[other_label] = []
-                        data_by_label[other_label].append(None)
-
-            # Create yValues array
-            y_values = [
-                {
-                    "data": data,
-                    "label": label
-                }
-                for label, data in data_by_label.items()
-            ]
-
-            formatted_data = {
-                "xValues": x_values,
-                "yValues": y_values,
-                "yAxisLabel": ""
-            }
-
-            # Use LLM to get a relevant label for the y-axis
-            prompt = ChatPromptTemplate.from_messages([
-                ("system", "You are a data labeling expert. Given a question and some data, provide a concise and relevant label for the y-axis."),
-                ("human", "Question: {question}\n Data (first few rows): {data}\n\nProvide a concise label for the y-axis. For example, if the data represents sales figures over time for different categories, the label could be 'Sales'. If it's about population growth for different groups, it could be 'Population'."),
-            ])
-            y_axis_label = self.llm_manager.invoke(prompt, question=question, data=str(results[:2]))
-
-            # Add the y-axis label to the formatted data
-            formatted_data["yAxisLabel"] = y_axis_label.strip()
-
-        return {"formatted_data_for_visualization": formatted_data}
-
-    def _format_scatter_data(self, results):
-        if isinstance(results, str):
-            results = eval(results)
-
-        formatted_data = {"series": []}
-        
-        if len(results[0]) == 2:
-            formatted_data["series"].append({
-                "data": [
-                    {"x": float(x), "y": float(y), "id": i+1}
-                    for i, (x, y) in enumerate(results)
-                ],
-                "label": "Data Points"
-            })
-        elif len(results[0]) == 3:
-            entities = {}
-            for item1, item2, item3 in results:
-                # Determine which item is the label (string not convertible to float and not containing "/")
-                if isinstance(item1, str) and not item1.replace(".", "").isdigit() and "/" not in item1:
-                    label, x, y = item1, item2, item3
-                else:
-                    x, label, y = item1, item2, item3
-                if label not in entities:
-                    entities[label] = []
-                entities[label].append({"x": float(x), "y": float(y), "id": len(entities[label])+1})
-            
-            for label, data in entities.items():
-                formatted_data["series"].append({
-                    "data": data,
-                    "label": label
-                })
-        else:
-            raise ValueError("Unexpected data format in results")                
-
-        return {"formatted_data_for_visualization": formatted_data}
-
-
-    def _format_bar_data(self, results, question):
-        if isinstance(results, str):
-            results = eval(results)
-
-        if len(results[0]) == 2:
-            # Simple bar chart with one series
-            labels = [str(row[0]) for row in results]
-            data = [float(row[1]) for row in results]
-            
-            # Use LLM to get a relevant label
-            prompt = ChatPromptTemplate.from_messages([
-                ("system", "You are a data labeling expert. Given a question and some data, provide a concise and relevant label for the data series."),
-                ("human", "Question: {question}\nData (first few rows): {data}\n\nProvide a concise label for this y axis. For example, if the data is the sales figures for products, the label could be 'Sales'. If the data is the population of cities, the label could be 'Population'. If the data is the revenue by region, the label could be 'Revenue'."),
-            ])
-            label = self.llm_manager.invoke(prompt, question=question, data=str(results[:2]))
-            
-            values = [{"data": data, "label": label}]
-        elif len(results[0]) == 3:
-            # Grouped bar chart with multiple series
-            categories = set(row[1] for row in results)
-            labels = list(categories)
-            entities = set(row[0] for row in results)
-            values = []
-            for entity in entities:
-                entity_data = [float(row[2]) for row in results if row[0] == entity]
-                values.append({"data": entity_data, "label": str(entity)})
+            return LINE_SERIES_LABEL_PROMPT if column_count == 2 else LINE_AXIS_LABEL_PROMPT
+        if (visualization == "bar" or visualization == "horizontal_bar") and column_count == 2:
+            return BAR_SERIES_LABEL_PROMPT
+        return None
+
+    @staticmethod
+    def _apply_label(visualization, formatted_data, label, column_count):
+        if visualization != "line":
+            formatted_data["values"][0]["label"] = label
+        elif column_count == 2:
+            formatted_data["yValues"][0]["label"] = label.strip()
         else:
-            raise ValueError("Unexpected data format in results")
-
-        formatted_data = {
-            "labels": labels,
-            "values": values
-        }
-
-        return {"formatted_data_for_visualization": formatted_data}
-
-    def _format_other_visualizations(self, visualization, question, sql_query, results):
-        instructions = graph_instructions[visualization]
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are a Data expert who formats data according to the required needs. You are given the question asked by the user, it's sql query, the result of the query and the format you need to format it in."),
-            ("human", 'For the given question: {question}\n\nSQL query: {sql_query}\n\Result: {results}\n\nUse the following example to structure the data: {instructions}. Just give the json string. Do not format it'),
-        ])
-        response = self.llm_manager.invoke(prompt, question=question, sql_query=sql_query, results=results, instructions=instructions)
-            
+            formatted_data["yAxisLabel"] = label.strip()
+
+    def _format_other_visualizations(self, visualization, question, sql_query, results, results_digest=None):
+        response = self.llm_manager.invoke(
+            OTHER_VISUALIZATION_PROMPT, question=question, sql_query=sql_query,
+            results=results_for_prompt(results, results_digest), instructions=graph_instructions[visualization]
+        )
+        return self._parse_formatted_data(response)
+
+    async def _aformat_other_visualizations(self, visualization, question, sql_query, results, results_digest=None):
+        response = await self.llm_manager.ainvoke(
+            OTHER_VISUALIZATION_PROMPT, question=question, sql_query=sql_query,
+            results=results_for_prompt(results, results_digest), instructions=graph_instructions[visualization]
+        )
+        return self._parse_formatted_data(response)
+
+    @staticmethod
+    def _parse_formatted_data(response):
         try:
             formatted_data_for_visualization = json.loads(response)
             return {"formatted_data_for_visualization": formatted_data_for_visualization}
@@ -1,31 +1,517 @@
 import requests
+import asyncio
+import contextvars
+import importlib.util
 import os
-from typing import List, Any
+import json
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from my_agent.Cache import TTLCache
+from my_agent.ColumnarWire import CONTENT_TYPE as COLUMNAR_CONTENT_TYPE, decode_columnar
+from my_agent.ResultDecoder import decode_results, ACCEPT_HEADER, NDJSON_ACCEPT_HEADER, STREAM_ACCEPT_HEADER
+from my_agent.Scheduler import SingleFlight
+from my_agent.Tracing import record_span, span
+
+
+class QueryStream:
+    """Iterator over the rows of a query result that stops once a row or byte budget is used up.
+
+    Rows are read line by line when the server answers with NDJSON; columnar and JSON bodies
+    are read whole (see DatabaseManager.stream_query for how their size is bounded), decoded in
+    one go and then iterated under the same budget.
+    """
+
+    def __init__(self, response: requests.Response, max_rows: Optional[int] = None, max_bytes: Optional[int] = None,
+                 started_at: Optional[float] = None, body: Optional[bytes] = None):
+        self.response = response
+        self.body = body
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.row_count = 0
+        self.bytes_read = 0
+        self.truncated = False
+
+    def _sized_rows(self) -> Iterator[Any]:
+        content_type = self.response.headers.get("Content-Type", "")
+        if content_type.startswith("application/x-ndjson"):
+            for line in self.response.iter_lines():
+                if line:
+                    yield json.loads(line), len(line) + 1
+        else:
+            body = self.body if self.body is not None else self.response.content
+            rows = decode_results(body, content_type)
+            row_size = len(body) / max(len(rows), 1)
+            for row in rows:
+                yield row, row_size
+
+    def _admit(self, size: float) -> bool:
+        """Count a row of size bytes against the budget, or mark the result truncated if it does not fit."""
+        if (self.max_rows is not None and self.row_count >= self.max_rows) or \
+                (self.max_bytes is not None and self.bytes_read + size > self.max_bytes):
+            self.truncated = True
+            return False
+        self.row_count += 1
+        self.bytes_read += size
+        return True
+
+    def __iter__(self) -> Iterator[Any]:
+        try:
+            for row, size in self._sized_rows():
+                if not self._admit(size):
+                    break
+                yield row
+        finally:
+            self.response.close()
+            self._record()
+
+    def collect(self) -> Sequence[Any]:
+        """Read the whole result under the budget.
+
+        A columnar body is returned as a ColumnarResult over the body, which downstream nodes
+        iterate row by row or read column by column; other formats are collected into a list.
+        """
+        if not self._is_columnar():
+            return list(self)
+        try:
+            return self._columnar_result()
+        finally:
+            self.response.close()
+            self._record()
+
+    async def acollect(self) -> Sequence[Any]:
+        """collect() in a worker thread, for callers on the event loop."""
+        return await asyncio.to_thread(self.collect)
+
+    def _is_columnar(self) -> bool:
+        return self.body is not None and self.response.headers.get("Content-Type", "").startswith(COLUMNAR_CONTENT_TYPE)
+
+    def _columnar_result(self):
+        result = decode_columnar(self.body, row_limit=self.max_rows)
+        self.row_count = result.row_count
+        self.bytes_read = len(self.body)
+        self.truncated = result.total_row_count > result.row_count
+        return result
+
+    def _record(self) -> None:
+        record_span("db", "stream_query", time.perf_counter() - self.started_at,
+                    bytes=int(self.bytes_read), rows=self.row_count, truncated=self.truncated)
+
+
+class AsyncQueryStream(QueryStream):
+    """Async counterpart of QueryStream over a streamed httpx response."""
+
+    async def _asized_rows(self) -> AsyncIterator[Any]:
+        content_type = self.response.headers.get("Content-Type", "")
+        if content_type.startswith("application/x-ndjson"):
+            async for line in self.response.aiter_lines():
+                if line:
+                    yield json.loads(line), len(line.encode("utf-8")) + 1
+        else:
+            for row, size in self._sized_rows():
+                yield row, size
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        try:
+            async for row, size in self._asized_rows():
+                if not self._admit(size):
+                    break
+                yield row
+        finally:
+            await self.response.aclose()
+            self._record()
+
+    async def acollect(self) -> Sequence[Any]:
+        if not self._is_columnar():
+            return [row async for row in self]
+        try:
+            return self._columnar_result()
+        finally:
+            await self.response.aclose()
+            self._record()
+
+
+def _read_body(response: requests.Response, max_bytes: Optional[int]) -> Optional[bytes]:
+    """Read a whole response body, or close the response and return None once it exceeds max_bytes."""
+    length = response.headers.get("Content-Length")
+    if max_bytes is not None and length is not None and int(length) > max_bytes:
+        response.close()
+        return None
+    chunks, size = [], 0
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        size += len(chunk)
+        if max_bytes is not None and size > max_bytes:
+            response.close()
+            return None
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def _aread_body(response, max_bytes: Optional[int]) -> Optional[bytes]:
+    """Async variant of _read_body for a streamed httpx response."""
+    length = response.headers.get("Content-Length")
+    if max_bytes is not None and length is not None and int(length) > max_bytes:
+        await response.aclose()
+        return None
+    chunks, size = [], 0
+    async for chunk in response.aiter_bytes(64 * 1024):
+        size += len(chunk)
+        if max_bytes is not None and size > max_bytes:
+            await response.aclose()
+            return None
+        chunks.append(chunk)
+    return b"".join(chunks)
 
 
 class DatabaseManager:
     def __init__(self):
         self.endpoint_url = os.getenv("DB_ENDPOINT_URL")
+        self.timeout = (
+            float(os.getenv("DB_CONNECT_TIMEOUT", "3.05")),
+            float(os.getenv("DB_READ_TIMEOUT", "60")),
+        )
+        self.pool_size = int(os.getenv("DB_POOL_SIZE", "20"))
+        self.max_retries = int(os.getenv("DB_MAX_RETRIES", "3"))
+        self.session = self._create_session()
+        # httpx connections belong to the event loop that opened them, so keep one client per loop
+        self._async_clients = weakref.WeakKeyDictionary()
+        # Without httpx the async methods run the blocking ones in worker threads
+        self.async_transport = importlib.util.find_spec("httpx") is not None
+        self.batch_supported = True
+        self.schema_cache = TTLCache(
+            max_size=int(os.getenv("SCHEMA_CACHE_SIZE", "256")),
+            ttl=float(os.getenv("SCHEMA_CACHE_TTL", "600")),
+        )
+        self.data_versions: Dict[str, str] = {}
+        # Concurrent identical requests share one round trip
+        self._flights = SingleFlight()
 
-    def get_schema(self, uuid: str) -> str:
-        """Retrieve the database schema."""
-        try:
-            response = requests.get(
-                f"{self.endpoint_url}/get-schema/{uuid}"
+    def _create_session(self) -> requests.Session:
+        """Create a keep-alive session with a bounded connection pool and retries on idempotent calls."""
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=self.max_retries,
+            backoff_factor=float(os.getenv("DB_RETRY_BACKOFF", "0.3")),
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _get_async_client(self):
+        """Lazily create the pooled async client of the running event loop. Requires the optional httpx dependency."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            try:
+                import httpx
+            except ImportError:
+                raise Exception("The async transport requires httpx to be installed")
+            connect_timeout, read_timeout = self.timeout
+            client = self._async_clients[loop] = httpx.AsyncClient(
+                base_url=self.endpoint_url,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                transport=httpx.AsyncHTTPTransport(
+                    retries=self.max_retries,
+                    limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                ),
             )
-            response.raise_for_status()
-            return response.json()['schema']
-        except requests.RequestException as e:
-            raise Exception(f"Error fetching schema: {str(e)}")
+        return client
+
+    def close(self) -> None:
+        self.session.close()
+
+    async def aclose(self) -> None:
+        self.session.close()
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def get_schema(self, uuid: str) -> str:
+        """Retrieve the database schema, served from the per-uuid cache when possible."""
+        with span("db", "get_schema") as record:
+            schema = self.schema_cache.get(uuid)
+            record["cache_hit"] = schema is not None
+            if schema is not None:
+                return schema
+
+            def fetch():
+                try:
+                    response = self.session.get(
+                        f"{self.endpoint_url}/get-schema/{uuid}",
+                        timeout=self.timeout
+                    )
+                    response.raise_for_status()
+                    record["bytes"] = len(response.content)
+                    schema = response.json()['schema']
+                except requests.RequestException as e:
+                    raise Exception(f"Error fetching schema: {str(e)}")
+                self.schema_cache.set(uuid, schema)
+                return schema
+
+            schema, record["coalesced"] = self._flights.do(("schema", uuid), fetch)
+        return schema
+
+    def invalidate_schema(self, uuid: str) -> None:
+        """Drop the cached schema for a dataset, e.g. after it has been re-uploaded."""
+        self.schema_cache.pop(uuid)
+
+    def set_data_version(self, uuid: str, version: str) -> bool:
+        """Record the current version of a dataset. Returns True if the version changed."""
+        if self.data_versions.get(uuid) == version:
+            return False
+        self.data_versions[uuid] = version
+        self.invalidate_schema(uuid)
+        return True
+
+    def get_data_version(self, uuid: str) -> Optional[str]:
+        return self.data_versions.get(uuid)
+
+    def schema_cache_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters for the schema cache."""
+        return self.schema_cache.stats()
 
     def execute_query(self, uuid: str, query: str) -> List[Any]:
-        """Execute SQL query on the remote database and return results."""
+        """Execute SQL query on the remote database and return results.
+
+        Callers running the same query concurrently share one request and receive the same list.
+        """
+        with span("db", "execute_query") as record:
+            def fetch():
+                try:
+                    response = self.session.post(
+                        f"{self.endpoint_url}/execute-query",
+                        json={"uuid": uuid, "query": query},
+                        headers={"Accept": ACCEPT_HEADER},
+                        timeout=self.timeout
+                    )
+                    response.raise_for_status()
+                    record["bytes"] = len(response.content)
+                    return decode_results(response.content, response.headers.get("Content-Type"))
+                except requests.RequestException as e:
+                    raise Exception(f"Error executing query: {str(e)}")
+
+            results, record["coalesced"] = self._flights.do(("query", uuid, query), fetch)
+        return results
+
+    def stream_query(self, uuid: str, query: str, max_rows: Optional[int] = None,
+                     max_bytes: Optional[int] = None) -> QueryStream:
+        """Execute SQL query and return a budgeted row iterator, preferring the columnar format, then NDJSON.
+
+        A columnar or JSON body can only be decoded whole, so it is read up to max_bytes first.
+        If it is larger, reading stops and the query is re-run as NDJSON, whose rows the budget
+        can cut off line by line.
+        """
+        started_at = time.perf_counter()
+        response = self._post_stream(uuid, query, max_rows, STREAM_ACCEPT_HEADER)
+        if response.headers.get("Content-Type", "").startswith("application/x-ndjson"):
+            return QueryStream(response, max_rows=max_rows, max_bytes=max_bytes, started_at=started_at)
+
+        body = _read_body(response, max_bytes)
+        if body is not None:
+            return QueryStream(response, max_rows=max_rows, max_bytes=max_bytes, started_at=started_at, body=body)
+
+        response = self._post_stream(uuid, query, max_rows, NDJSON_ACCEPT_HEADER)
+        if not response.headers.get("Content-Type", "").startswith("application/x-ndjson"):
+            response.close()
+            raise Exception(f"Error executing query: the result exceeds {max_bytes} bytes and cannot be streamed")
+        return QueryStream(response, max_rows=max_rows, max_bytes=max_bytes, started_at=started_at)
+
+    def collect_query(self, uuid: str, query: str, max_rows: Optional[int] = None,
+                      max_bytes: Optional[int] = None) -> Tuple[QueryStream, Sequence[Any]]:
+        """Run stream_query and collect it, returning (stream, results).
+
+        Callers running the same query under the same budget concurrently share one request and
+        receive the same stream and results.
+        """
+        with span("db", "collect_query") as record:
+            def fetch():
+                stream = self.stream_query(uuid, query, max_rows=max_rows, max_bytes=max_bytes)
+                return stream, stream.collect()
+
+            collected, record["coalesced"] = self._flights.do(("stream", uuid, query, max_rows, max_bytes), fetch)
+        return collected
+
+    def _post_stream(self, uuid: str, query: str, max_rows: Optional[int], accept: str) -> requests.Response:
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.endpoint_url}/execute-query",
-                json={"uuid": uuid, "query": query}
+                json={"uuid": uuid, "query": query, "stream": True, "max_rows": max_rows},
+                headers={"Accept": accept},
+                timeout=self.timeout,
+                stream=True
             )
             response.raise_for_status()
-            return response.json()['results']
         except requests.RequestException as e:
-            raise Exception(f"Error executing query: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Error executing query: {str(e)}")
+        return response
+
+    def execute_queries(self, uuid: str, queries: List[str]) -> List[List[Any]]:
+        """Execute several queries in one batched round trip, or in parallel if the server cannot batch."""
+        if not queries:
+            return []
+        if len(queries) == 1:
+            return [self.execute_query(uuid, queries[0])]
+
+        if self.batch_supported:
+            with span("db", "execute_queries", queries=len(queries)) as record:
+                def fetch():
+                    try:
+                        response = self.session.post(
+                            f"{self.endpoint_url}/execute-queries",
+                            json={"uuid": uuid, "queries": queries},
+                            timeout=self.timeout
+                        )
+                        if response.status_code in (404, 405, 501):
+                            self.batch_supported = False
+                            return None
+                        response.raise_for_status()
+                        record["bytes"] = len(response.content)
+                        return response.json()['results']
+                    except requests.RequestException as e:
+                        raise Exception(f"Error executing queries: {str(e)}")
+
+                results, record["coalesced"] = self._flights.do(("queries", uuid, tuple(queries)), fetch)
+                if results is not None:
+                    return results
+
+        # Each query runs in a copy of the caller's context, so its span joins the caller's run trace
+        with ThreadPoolExecutor(max_workers=min(len(queries), self.pool_size)) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, self.execute_query, uuid, query) for query in queries
+            ]
+            return [future.result() for future in futures]
+
+    async def aget_schema(self, uuid: str) -> str:
+        """Async variant of get_schema that does not block the event loop."""
+        if not self.async_transport:
+            return await asyncio.to_thread(self.get_schema, uuid)
+        with span("db", "get_schema") as record:
+            schema = self.schema_cache.get(uuid)
+            record["cache_hit"] = schema is not None
+            if schema is not None:
+                return schema
+
+            async def fetch():
+                client = self._get_async_client()
+                try:
+                    response = await client.get(f"/get-schema/{uuid}")
+                    response.raise_for_status()
+                    record["bytes"] = len(response.content)
+                    schema = response.json()['schema']
+                except Exception as e:
+                    raise Exception(f"Error fetching schema: {str(e)}")
+                self.schema_cache.set(uuid, schema)
+                return schema
+
+            schema, record["coalesced"] = await self._flights.ado(("schema", uuid), fetch)
+        return schema
+
+    async def aexecute_query(self, uuid: str, query: str) -> List[Any]:
+        """Async variant of execute_query that does not block the event loop."""
+        if not self.async_transport:
+            return await asyncio.to_thread(self.execute_query, uuid, query)
+        with span("db", "execute_query") as record:
+            async def fetch():
+                client = self._get_async_client()
+                try:
+                    response = await client.post(
+                        "/execute-query", json={"uuid": uuid, "query": query}, headers={"Accept": ACCEPT_HEADER}
+                    )
+                    response.raise_for_status()
+                    record["bytes"] = len(response.content)
+                    return decode_results(response.content, response.headers.get("Content-Type"))
+                except Exception as e:
+                    raise Exception(f"Error executing query: {str(e)}")
+
+            results, record["coalesced"] = await self._flights.ado(("query", uuid, query), fetch)
+        return results
+
+    async def aexecute_queries(self, uuid: str, queries: List[str]) -> List[List[Any]]:
+        """Async variant of execute_queries."""
+        if not self.async_transport:
+            return await asyncio.to_thread(self.execute_queries, uuid, queries)
+        if not queries:
+            return []
+        if len(queries) == 1:
+            return [await self.aexecute_query(uuid, queries[0])]
+
+        if self.batch_supported:
+            with span("db", "execute_queries", queries=len(queries)) as record:
+                async def fetch():
+                    client = self._get_async_client()
+                    try:
+                        response = await client.post("/execute-queries", json={"uuid": uuid, "queries": queries})
+                        if response.status_code in (404, 405, 501):
+                            self.batch_supported = False
+                            return None
+                        response.raise_for_status()
+                        record["bytes"] = len(response.content)
+                        return response.json()['results']
+                    except Exception as e:
+                        raise Exception(f"Error executing queries: {str(e)}")
+
+                results, record["coalesced"] = await self._flights.ado(("queries", uuid, tuple(queries)), fetch)
+                if results is not None:
+                    return results
+
+        return list(await asyncio.gather(*(self.aexecute_query(uuid, query) for query in queries)))
+
+    async def astream_query(self, uuid: str, query: str, max_rows: Optional[int] = None,
+                            max_bytes: Optional[int] = None) -> QueryStream:
+        """Async variant of stream_query. Read the result with the returned stream's acollect()."""
+        if not self.async_transport:
+            return await asyncio.to_thread(self.stream_query, uuid, query, max_rows, max_bytes)
+        started_at = time.perf_counter()
+        response = await self._apost_stream(uuid, query, max_rows, STREAM_ACCEPT_HEADER)
+        if response.headers.get("Content-Type", "").startswith("application/x-ndjson"):
+            return AsyncQueryStream(response, max_rows=max_rows, max_bytes=max_bytes, started_at=started_at)
+
+        body = await _aread_body(response, max_bytes)
+        if body is not None:
+            return AsyncQueryStream(response, max_rows=max_rows, max_bytes=max_bytes, started_at=started_at, body=body)
+
+        response = await self._apost_stream(uuid, query, max_rows, NDJSON_ACCEPT_HEADER)
+        if not response.headers.get("Content-Type", "").startswith("application/x-ndjson"):
+            await response.aclose()
+            raise Exception(f"Error executing query: the result exceeds {max_bytes} bytes and cannot be streamed")
+        return AsyncQueryStream(response, max_rows=max_rows, max_bytes=max_bytes, started_at=started_at)
+
+    async def acollect_query(self, uuid: str, query: str, max_rows: Optional[int] = None,
+                             max_bytes: Optional[int] = None) -> Tuple[QueryStream, Sequence[Any]]:
+        """Async variant of collect_query."""
+        with span("db", "collect_query") as record:
+            async def fetch():
+                stream = await self.astream_query(uuid, query, max_rows=max_rows, max_bytes=max_bytes)
+                return stream, await stream.acollect()
+
+            collected, record["coalesced"] = await self._flights.ado(
+                ("stream", uuid, query, max_rows, max_bytes), fetch
+            )
+        return collected
+
+    async def _apost_stream(self, uuid: str, query: str, max_rows: Optional[int], accept: str):
+        client = self._get_async_client()
+        request = client.build_request(
+            "POST", "/execute-query",
+            json={"uuid": uuid, "query": query, "stream": True, "max_rows": max_rows},
+            headers={"Accept": accept},
+        )
+        response = None
+        try:
+            response = await client.send(request, stream=True)
+            response.raise_for_status()
+        except Exception as e:
+            if response is not None:
+                await response.aclose()
+            raise Exception(f"Error executing query: {str(e)}")
+        return response
@@ -0,0 +1,47 @@
+import numpy as np
+from typing import Tuple
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Pick threshold points with Largest-Triangle-Three-Buckets, always keeping the first and last point."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(int)
+    indices = np.empty(threshold, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    selected = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+
+        # The third triangle vertex is the average of the next bucket (or the last point)
+        if bucket + 2 < len(edges):
+            next_start, next_end = end, edges[bucket + 2]
+            average_x = x[next_start:next_end].mean()
+            average_y = y[next_start:next_end].mean()
+        else:
+            average_x, average_y = x[n - 1], y[n - 1]
+
+        areas = np.abs(
+            (x[selected] - average_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (average_y - y[selected])
+        )
+        selected = start + int(np.argmax(areas))
+        indices[bucket + 1] = selected
+    return indices
+
+
+def bin_2d(x: np.ndarray, y: np.ndarray, bins: int, x_range: Tuple[float, float],
+           y_range: Tuple[float, float]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Aggregate points into a bins x bins grid and return the centers and counts of non-empty cells."""
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins, range=[x_range, y_range])
+    x_index, y_index = np.nonzero(counts)
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+    return x_centers[x_index], y_centers[y_index], counts[x_index, y_index].astype(int)
+
+
+def value_range(values: np.ndarray) -> Tuple[float, float]:
+    low, high = float(np.nanmin(values)), float(np.nanmax(values))
+    return (low, high) if high > low else (low - 0.5, high + 0.5)
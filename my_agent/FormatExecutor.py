@@ -0,0 +1,104 @@
+"""Process-pool offload for chart formatting.
+
+The columnar response body of a large result is copied as is into a shared memory block,
+so the worker receives only the block's name instead of a pickled list of rows, and the
+calling process does no per-row work while holding the GIL. The worker decodes the columns,
+builds the chart payload with ColumnarFormatter.format_chart and sends back only that
+payload, which is bounded by the chart point budget for line and scatter charts.
+
+This module only imports numpy and the columnar helpers, so spawned workers start without
+loading the LLM and graph dependencies.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Dict, Optional
+from my_agent.ColumnarFormatter import format_chart, to_columns
+from my_agent.ColumnarWire import ColumnarResult, decode_columnar
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> Executor:
+    """Return the process-wide formatting pool, sized by FORMAT_PROCESS_WORKERS."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # Spawn rather than fork: the parent runs threads (graph nodes, HTTP pools)
+                _executor = ProcessPoolExecutor(
+                    max_workers=int(os.getenv("FORMAT_PROCESS_WORKERS", "2")),
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _executor
+
+
+def _reset_broken(executor: Executor) -> None:
+    """Drop a pool whose worker died, so the next job starts a fresh one."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+
+
+def _share(result: ColumnarResult) -> shared_memory.SharedMemory:
+    """Copy the columnar body of result into a new shared memory block."""
+    block = shared_memory.SharedMemory(create=True, size=max(len(result.body), 1))
+    block.buf[:len(result.body)] = result.body
+    return block
+
+
+def _release(block: shared_memory.SharedMemory) -> None:
+    block.close()
+    block.unlink()
+
+
+def _format_shared(name: str, size: int, row_limit: Optional[int], visualization: str,
+                   point_budget: Optional[int], line_method: str, scatter_method: str) -> Dict[str, Any]:
+    """Worker entry point: format the columnar body held in shared memory block name."""
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        # Copy out of the block so no numpy view keeps it mapped after close
+        result = decode_columnar(bytes(block.buf[:size]), row_limit)
+    finally:
+        block.close()
+    return format_chart(visualization, to_columns(result), point_budget, line_method, scatter_method)
+
+
+def format_chart_offloaded(visualization: str, result: ColumnarResult, point_budget: Optional[int] = None,
+                           line_method: str = "lttb", scatter_method: str = "bin") -> Dict[str, Any]:
+    """format_chart for a columnar result, computed in the process pool. Blocks until the payload is ready."""
+    block = _share(result)
+    executor = get_executor()
+    try:
+        return executor.submit(
+            _format_shared, block.name, len(result.body), result.row_limit,
+            visualization, point_budget, line_method, scatter_method
+        ).result()
+    except BrokenProcessPool:
+        _reset_broken(executor)
+        raise
+    finally:
+        _release(block)
+
+
+async def aformat_chart_offloaded(visualization: str, result: ColumnarResult, point_budget: Optional[int] = None,
+                                  line_method: str = "lttb", scatter_method: str = "bin") -> Dict[str, Any]:
+    """Async variant of format_chart_offloaded that awaits the pool without blocking the event loop."""
+    block = _share(result)
+    executor = get_executor()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, _format_shared, block.name, len(result.body), result.row_limit,
+            visualization, point_budget, line_method, scatter_method
+        )
+    except BrokenProcessPool:
+        _reset_broken(executor)
+        raise
+    finally:
+        _release(block)
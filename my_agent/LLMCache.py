@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+from my_agent.Cache import TTLCache
+
+
+class MemoryBackend:
+    """In-process LRU tier."""
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.cache = TTLCache(max_size=max_size, ttl=ttl)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.cache.get(key)
+
+    def set(self, key: str, value: str) -> None:
+        self.cache.set(key, value)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+
+class SQLiteBackend:
+    """On-disk tier that survives restarts and can be shared between processes."""
+
+    def __init__(self, path: str, ttl: Optional[float] = None):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            return None
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?)", (key, value, expires_at))
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_cache")
+
+
+class LLMCache:
+    """Content-addressed cache of LLM responses, looked up tier by tier.
+
+    Keys are a hash of the model, temperature and formatted messages, so only byte-identical
+    requests are reused. A hit in a slower tier is copied into the faster ones.
+    """
+
+    def __init__(self, backends: List[Any]):
+        self.backends = backends
+        self._lock = threading.Lock()
+        self._prompt_stats = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+    @staticmethod
+    def make_key(model: str, temperature: float, messages: List[Any]) -> str:
+        payload = json.dumps(
+            {
+                "model": model,
+                "temperature": temperature,
+                "messages": [[message.type, message.content] for message in messages],
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, prompt_id: str = "default") -> Optional[str]:
+        for depth, backend in enumerate(self.backends):
+            value = backend.get(key)
+            if value is not None:
+                for faster in self.backends[:depth]:
+                    faster.set(key, value)
+                self._record(prompt_id, "hits")
+                return value
+        self._record(prompt_id, "misses")
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        for backend in self.backends:
+            backend.set(key, value)
+
+    def clear(self) -> None:
+        for backend in self.backends:
+            backend.clear()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return hit/miss counts and hit rate per prompt."""
+        with self._lock:
+            return {
+                prompt_id: {**counts, "hit_rate": counts["hits"] / (counts["hits"] + counts["misses"])}
+                for prompt_id, counts in self._prompt_stats.items()
+            }
+
+    def _record(self, prompt_id: str, outcome: str) -> None:
+        with self._lock:
+            self._prompt_stats[prompt_id][outcome] += 1
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[LLMCache]:
+    """Return the process-wide LLM cache configured from the environment, or None if disabled."""
+    global _default_cache
+    if os.getenv("LLM_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            ttl = float(os.getenv("LLM_CACHE_TTL", "3600")) or None
+            backends = [MemoryBackend(max_size=int(os.getenv("LLM_CACHE_SIZE", "1024")), ttl=ttl)]
+            path = os.getenv("LLM_CACHE_PATH")
+            if path:
+                backends.append(SQLiteBackend(path, ttl=ttl))
+            _default_cache = LLMCache(backends)
+        return _default_cache
@@ -1,11 +1,213 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import weakref
+from typing import AsyncIterator, Iterator
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
+from my_agent.LLMCache import LLMCache, get_default_cache
+from my_agent.Scheduler import SingleFlight
+from my_agent.Tracing import span
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+# Process-wide cap on blocking LLM calls, shared by every LLMManager
+_sync_limiter = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+# Identical deterministic requests in flight at the same time share one call
+_flights = SingleFlight()
+
+# asyncio semaphores belong to one event loop, so keep one limiter per loop
+_limiters = weakref.WeakKeyDictionary()
+
+
+def _get_limiter() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    limiter = _limiters.get(loop)
+    if limiter is None:
+        limiter = _limiters[loop] = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return limiter
+
 
 class LLMManager:
     def __init__(self):
-        self.llm = ChatOpenAI(model="gpt-4o", temperature=0)
+        self.llm = ChatOpenAI(model="gpt-4o", temperature=0, stream_usage=True)
+        self.cache = get_default_cache()
+        self.usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self._usage_lock = threading.Lock()
 
     def invoke(self, prompt: ChatPromptTemplate, **kwargs) -> str:
         messages = prompt.format_messages(**kwargs)
-        response = self.llm.invoke(messages)
-        return response.content
\ No newline at end of file
+        with span("llm", self._prompt_id(prompt)) as record:
+            key, cached = self._lookup(prompt, messages)
+            record["cache_hit"] = cached is not None
+            if cached is not None:
+                return cached
+
+            def call():
+                with _sync_limiter:
+                    response = self.llm.invoke(messages)
+                self._record_usage(response, record)
+                self._store(key, response.content)
+                return response.content
+
+            content, record["coalesced"] = self._coalesce(messages, call)
+        return content
+
+    def invoke_structured(self, prompt: ChatPromptTemplate, output_schema: dict, **kwargs) -> dict:
+        """Invoke the model with a strict JSON schema for its output and return the parsed object."""
+        messages = prompt.format_messages(**kwargs)
+        with span("llm", self._prompt_id(prompt)) as record:
+            key, cached = self._lookup(prompt, messages, output_schema)
+            record["cache_hit"] = cached is not None
+            if cached is not None:
+                return json.loads(cached)
+
+            def call():
+                structured_llm = self.llm.with_structured_output(
+                    output_schema, method="json_schema", strict=True, include_raw=True)
+                with _sync_limiter:
+                    response = structured_llm.invoke(messages)
+                self._record_usage(response["raw"], record)
+                if response["parsing_error"] is not None:
+                    raise response["parsing_error"]
+                self._store(key, json.dumps(response["parsed"]))
+                return response["parsed"]
+
+            parsed, record["coalesced"] = self._coalesce(messages, call, output_schema)
+        return parsed
+
+    async def ainvoke(self, prompt: ChatPromptTemplate, **kwargs) -> str:
+        """Async variant of invoke, limited to LLM_MAX_CONCURRENCY concurrent calls per event loop."""
+        messages = prompt.format_messages(**kwargs)
+        with span("llm", self._prompt_id(prompt)) as record:
+            key, cached = self._lookup(prompt, messages)
+            record["cache_hit"] = cached is not None
+            if cached is not None:
+                return cached
+
+            async def call():
+                async with _get_limiter():
+                    response = await self.llm.ainvoke(messages)
+                self._record_usage(response, record)
+                self._store(key, response.content)
+                return response.content
+
+            content, record["coalesced"] = await self._acoalesce(messages, call)
+        return content
+
+    async def ainvoke_structured(self, prompt: ChatPromptTemplate, output_schema: dict, **kwargs) -> dict:
+        """Async variant of invoke_structured, sharing the concurrency limit of ainvoke."""
+        messages = prompt.format_messages(**kwargs)
+        with span("llm", self._prompt_id(prompt)) as record:
+            key, cached = self._lookup(prompt, messages, output_schema)
+            record["cache_hit"] = cached is not None
+            if cached is not None:
+                return json.loads(cached)
+
+            async def call():
+                structured_llm = self.llm.with_structured_output(
+                    output_schema, method="json_schema", strict=True, include_raw=True)
+                async with _get_limiter():
+                    response = await structured_llm.ainvoke(messages)
+                self._record_usage(response["raw"], record)
+                if response["parsing_error"] is not None:
+                    raise response["parsing_error"]
+                self._store(key, json.dumps(response["parsed"]))
+                return response["parsed"]
+
+            parsed, record["coalesced"] = await self._acoalesce(messages, call, output_schema)
+        return parsed
+
+    def stream(self, prompt: ChatPromptTemplate, **kwargs) -> Iterator[str]:
+        """Yield the response text as the model produces it. A cached response is yielded whole."""
+        messages = prompt.format_messages(**kwargs)
+        with span("llm", self._prompt_id(prompt)) as record:
+            key, cached = self._lookup(prompt, messages)
+            record["cache_hit"] = cached is not None
+            if cached is not None:
+                yield cached
+                return
+
+            response = None
+            with _sync_limiter:
+                for chunk in self.llm.stream(messages):
+                    response = chunk if response is None else response + chunk
+                    if chunk.content:
+                        yield chunk.content
+            if response is not None:
+                self._record_usage(response, record)
+                self._store(key, response.content)
+
+    async def astream(self, prompt: ChatPromptTemplate, **kwargs) -> AsyncIterator[str]:
+        """Async variant of stream, sharing the concurrency limit of ainvoke."""
+        messages = prompt.format_messages(**kwargs)
+        with span("llm", self._prompt_id(prompt)) as record:
+            key, cached = self._lookup(prompt, messages)
+            record["cache_hit"] = cached is not None
+            if cached is not None:
+                yield cached
+                return
+
+            response = None
+            async with _get_limiter():
+                async for chunk in self.llm.astream(messages):
+                    response = chunk if response is None else response + chunk
+                    if chunk.content:
+                        yield chunk.content
+            if response is not None:
+                self._record_usage(response, record)
+                self._store(key, response.content)
+
+    def _lookup(self, prompt: ChatPromptTemplate, messages, output_schema: dict = None):
+        """Return (cache key, cached response). The key is None when the response must not be cached."""
+        # Responses are only reused when sampling is deterministic
+        if self.cache is None or self.llm.temperature:
+            return None, None
+        key = self._flight_key(messages, output_schema)
+        return key, self.cache.get(key, self._prompt_id(prompt))
+
+    def _flight_key(self, messages, output_schema: dict = None):
+        """Key identifying identical deterministic requests, or None when responses may differ."""
+        if self.llm.temperature:
+            return None
+        model = self.llm.model_name
+        if output_schema is not None:
+            model += ":" + json.dumps(output_schema, sort_keys=True)
+        return LLMCache.make_key(model, self.llm.temperature, messages)
+
+    def _coalesce(self, messages, call, output_schema: dict = None):
+        """Run call, or wait for an identical call already in flight. Returns (result, coalesced)."""
+        flight_key = self._flight_key(messages, output_schema)
+        if flight_key is None:
+            return call(), False
+        return _flights.do(flight_key, call)
+
+    async def _acoalesce(self, messages, call, output_schema: dict = None):
+        """Async variant of _coalesce."""
+        flight_key = self._flight_key(messages, output_schema)
+        if flight_key is None:
+            return await call(), False
+        return await _flights.ado(flight_key, call)
+
+    def _record_usage(self, response, record: dict) -> None:
+        """Add a response's token usage to the running totals and to its trace span."""
+        usage = getattr(response, "usage_metadata", None) or {}
+        record["prompt_tokens"] = usage.get("input_tokens", 0)
+        record["completion_tokens"] = usage.get("output_tokens", 0)
+        with self._usage_lock:
+            self.usage["calls"] += 1
+            self.usage["prompt_tokens"] += usage.get("input_tokens", 0)
+            self.usage["completion_tokens"] += usage.get("output_tokens", 0)
+
+    def _store(self, key, content: str) -> None:
+        if key is not None:
+            self.cache.set(key, content)
+
+    @staticmethod
+    def _prompt_id(prompt: ChatPromptTemplate) -> str:
+        """Identify a prompt template by a short hash of its unformatted messages."""
+        template = repr([getattr(message, "prompt", message) for message in prompt.messages])
+        return hashlib.sha1(template.encode("utf-8")).hexdigest()[:12]
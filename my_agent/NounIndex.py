@@ -0,0 +1,235 @@
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+from my_agent.DatabaseManager import DatabaseManager
+
+NounColumns = Dict[str, Tuple[Tuple[str, str], ...]]
+
+
+class NounIndex:
+    """Local on-disk index of the distinct values of noun columns, per (uuid, table, column).
+
+    Each column is built with a capped SELECT DISTINCT on first use. On later lookups the
+    table's (row count, max rowid) fingerprint is compared against the one stored at build
+    time: an unchanged table is served locally, an append-only change only fetches the rows
+    past the stored max rowid, and anything else triggers a rebuild of that column. Views
+    and WITHOUT ROWID tables have no rowid; they are fingerprinted by row count alone and
+    rebuilt whenever it changes.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, path: Optional[str] = None):
+        self.db_manager = db_manager
+        self.path = path or os.getenv("NOUN_INDEX_PATH", ".noun_index.sqlite")
+        self.cardinality_cap = int(os.getenv("NOUN_CARDINALITY_CAP", "1000"))
+        self._lock = threading.Lock()
+        # uuid -> (index fingerprint, noun map), see noun_map
+        self._noun_maps: Dict[str, Tuple[tuple, NounColumns]] = {}
+        # (uuid, table) pairs whose rowid could not be read, fingerprinted by row count only
+        self._rowless_tables: Set[Tuple[str, str]] = set()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS noun_values ("
+                "uuid TEXT, table_name TEXT, column_name TEXT, value TEXT, "
+                "PRIMARY KEY (uuid, table_name, column_name, value))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS noun_columns ("
+                "uuid TEXT, table_name TEXT, column_name TEXT, row_count INTEGER, max_rowid INTEGER, "
+                "PRIMARY KEY (uuid, table_name, column_name))"
+            )
+
+    def get_nouns(self, uuid: str, columns: List[Tuple[str, str]]) -> List[str]:
+        """Return the unique values of the given (table, column) pairs, refreshing stale entries first."""
+        columns = list(dict.fromkeys(columns))
+        if not columns:
+            return []
+        self.refresh(uuid, columns)
+        return self._indexed_nouns(uuid, columns)
+
+    async def aget_nouns(self, uuid: str, columns: List[Tuple[str, str]]) -> List[str]:
+        """Async variant of get_nouns; only the remote queries are awaited, the local index is read inline."""
+        columns = list(dict.fromkeys(columns))
+        if not columns:
+            return []
+        await self.arefresh(uuid, columns)
+        return self._indexed_nouns(uuid, columns)
+
+    def _indexed_nouns(self, uuid: str, columns: List[Tuple[str, str]]) -> List[str]:
+        unique_nouns = set()
+        with self._lock:
+            for table_name, column_name in columns:
+                rows = self._conn.execute(
+                    "SELECT value FROM noun_values WHERE uuid = ? AND table_name = ? AND column_name = ? LIMIT ?",
+                    (uuid, table_name, column_name, self.cardinality_cap),
+                )
+                unique_nouns.update(value for (value,) in rows)
+        return list(unique_nouns)
+
+    def cached_nouns(self, uuid: str) -> List[str]:
+        """Return every indexed value for a dataset without checking the remote tables."""
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT value FROM noun_values WHERE uuid = ?", (uuid,))
+            return [value for (value,) in rows]
+
+    def noun_columns(self, uuid: str) -> NounColumns:
+        """Map every indexed value of a dataset to the (table, column) pairs it occurs in, without remote checks."""
+        return self.noun_map(uuid)[1]
+
+    def noun_map(self, uuid: str) -> Tuple[tuple, NounColumns]:
+        """Return (index fingerprint, noun_columns map) for a dataset.
+
+        The fingerprint is the stored (table, column, row count, max rowid) of every indexed
+        column, so it changes whenever the indexed values do. The map is only reloaded from
+        the index when it does; callers must not modify it.
+        """
+        with self._lock:
+            fingerprint = tuple(self._conn.execute(
+                "SELECT table_name, column_name, row_count, max_rowid FROM noun_columns WHERE uuid = ? "
+                "ORDER BY table_name, column_name",
+                (uuid,),
+            ).fetchall())
+            cached = self._noun_maps.get(uuid)
+            if cached is not None and cached[0] == fingerprint:
+                return cached
+            rows = self._conn.execute(
+                "SELECT value, table_name, column_name FROM noun_values WHERE uuid = ? ORDER BY table_name, column_name",
+                (uuid,),
+            ).fetchall()
+            columns: NounColumns = {}
+            for value, table_name, column_name in rows:
+                columns[value] = columns.get(value, ()) + ((table_name, column_name),)
+            self._noun_maps[uuid] = (fingerprint, columns)
+            return fingerprint, columns
+
+    def sample_values(self, uuid: str, columns: List[Tuple[str, str]], limit: int) -> Dict[Tuple[str, str], List[str]]:
+        """Return up to limit indexed values per (table, column), for columns already in the index."""
+        samples = {}
+        with self._lock:
+            for table_name, column_name in dict.fromkeys(columns):
+                rows = self._conn.execute(
+                    "SELECT value FROM noun_values WHERE uuid = ? AND table_name = ? AND column_name = ? LIMIT ?",
+                    (uuid, table_name, column_name, limit),
+                ).fetchall()
+                if rows:
+                    samples[(table_name, column_name)] = [value for (value,) in rows]
+        return samples
+
+    def refresh(self, uuid: str, columns: List[Tuple[str, str]]) -> None:
+        """Bring the index for the given columns up to date with the remote tables."""
+        tables = list(dict.fromkeys(table_name for table_name, _ in columns))
+        try:
+            fingerprint_results = self.db_manager.execute_queries(uuid, self._fingerprint_queries(uuid, tables))
+        except Exception:
+            fingerprint_results = self.db_manager.execute_queries(uuid, _fingerprint_queries(tables, rowid=False))
+            self._mark_rowless(uuid, tables)
+        queries, targets = self._stale_columns(uuid, columns, tables, fingerprint_results)
+        if queries:
+            self._store(uuid, targets, self.db_manager.execute_queries(uuid, queries))
+
+    async def arefresh(self, uuid: str, columns: List[Tuple[str, str]]) -> None:
+        """Async variant of refresh."""
+        tables = list(dict.fromkeys(table_name for table_name, _ in columns))
+        try:
+            fingerprint_results = await self.db_manager.aexecute_queries(
+                uuid, self._fingerprint_queries(uuid, tables)
+            )
+        except Exception:
+            fingerprint_results = await self.db_manager.aexecute_queries(
+                uuid, _fingerprint_queries(tables, rowid=False)
+            )
+            self._mark_rowless(uuid, tables)
+        queries, targets = self._stale_columns(uuid, columns, tables, fingerprint_results)
+        if queries:
+            self._store(uuid, targets, await self.db_manager.aexecute_queries(uuid, queries))
+
+    def _fingerprint_queries(self, uuid: str, tables: List[str]) -> List[str]:
+        """Fingerprint queries for tables, by row count only if a table is known to have no rowid."""
+        with self._lock:
+            rowid = not any((uuid, table_name) in self._rowless_tables for table_name in tables)
+        return _fingerprint_queries(tables, rowid)
+
+    def _mark_rowless(self, uuid: str, tables: List[str]) -> None:
+        # A failed batch does not say which table lacks a rowid, so all of them fall back to counts
+        with self._lock:
+            self._rowless_tables.update((uuid, table_name) for table_name in tables)
+
+    def _stale_columns(self, uuid: str, columns: List[Tuple[str, str]], tables: List[str], fingerprint_results):
+        """Compare the remote table fingerprints with the stored ones.
+
+        Returns (queries fetching the new values of stale columns, (table, column, row count,
+        max rowid, is append) per query). max rowid is None when the table has no rows or no
+        rowid, and such columns are rebuilt rather than appended to.
+        """
+        fingerprints = {}
+        for table_name, result in zip(tables, fingerprint_results):
+            max_rowid = result[0][1] if len(result[0]) > 1 else None
+            fingerprints[table_name] = (int(result[0][0] or 0), int(max_rowid) if max_rowid is not None else None)
+
+        stored = self._stored_fingerprints(uuid, columns)
+        queries, targets = [], []
+        for table_name, column_name in columns:
+            row_count, max_rowid = fingerprints[table_name]
+            previous = stored.get((table_name, column_name))
+            if previous == (row_count, max_rowid):
+                continue
+
+            condition = f"`{column_name}` IS NOT NULL AND `{column_name}` != ''"
+            is_append = (
+                previous is not None
+                and max_rowid is not None and previous[1] is not None
+                and row_count - previous[0] == max_rowid - previous[1] > 0
+            )
+            if is_append:
+                condition += f" AND rowid > {previous[1]}"
+            queries.append(
+                f"SELECT DISTINCT `{column_name}` FROM `{table_name}` WHERE {condition} LIMIT {self.cardinality_cap}"
+            )
+            targets.append((table_name, column_name, row_count, max_rowid, is_append))
+        return queries, targets
+
+    def _store(self, uuid: str, targets, results) -> None:
+        with self._lock, self._conn:
+            self._noun_maps.pop(uuid, None)
+            for (table_name, column_name, row_count, max_rowid, is_append), rows in zip(targets, results):
+                key = (uuid, table_name, column_name)
+                if not is_append:
+                    self._conn.execute(
+                        "DELETE FROM noun_values WHERE uuid = ? AND table_name = ? AND column_name = ?", key
+                    )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO noun_values VALUES (?, ?, ?, ?)",
+                    ((*key, str(value)) for row in rows for value in row if value),
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO noun_columns VALUES (?, ?, ?, ?, ?)",
+                    (*key, row_count, max_rowid),
+                )
+
+    def invalidate(self, uuid: str) -> None:
+        """Drop every indexed column for a dataset."""
+        with self._lock, self._conn:
+            self._noun_maps.pop(uuid, None)
+            self._rowless_tables = {key for key in self._rowless_tables if key[0] != uuid}
+            self._conn.execute("DELETE FROM noun_values WHERE uuid = ?", (uuid,))
+            self._conn.execute("DELETE FROM noun_columns WHERE uuid = ?", (uuid,))
+
+    def _stored_fingerprints(self, uuid: str, columns: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Tuple[int, Optional[int]]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT table_name, column_name, row_count, max_rowid FROM noun_columns WHERE uuid = ?",
+                (uuid,),
+            ).fetchall()
+        wanted = set(columns)
+        return {
+            (table_name, column_name): (row_count, max_rowid)
+            for table_name, column_name, row_count, max_rowid in rows
+            if (table_name, column_name) in wanted
+        }
+
+
+def _fingerprint_queries(tables: List[str], rowid: bool = True) -> List[str]:
+    if not rowid:
+        return [f"SELECT COUNT(*) FROM `{table_name}`" for table_name in tables]
+    return [f"SELECT COUNT(*), MAX(rowid) FROM `{table_name}`" for table_name in tables]
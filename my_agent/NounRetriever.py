@@ -0,0 +1,55 @@
+import os
+import re
+from collections import defaultdict
+from typing import Dict, List, Set
+from my_agent.Cache import TTLCache
+
+
+def _trigrams(text: str) -> Set[str]:
+    text = "  " + re.sub(r"\s+", " ", text.lower()).strip() + " "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class NounRetriever:
+    """Trigram index used to keep only the unique nouns that are close to the terms in a question."""
+
+    def __init__(self):
+        self.top_k = int(os.getenv("NOUN_TOP_K", "50"))
+        self.min_score = float(os.getenv("NOUN_MIN_SCORE", "0.5"))
+        self._indexes = TTLCache(max_size=32)
+
+    def retrieve(self, question: str, nouns: List[str]) -> List[str]:
+        """Return at most top_k nouns, ranked by how much of each noun appears in the question."""
+        if len(nouns) <= self.top_k:
+            return list(nouns)
+
+        index = self._get_index(nouns)
+        shared = defaultdict(int)
+        for trigram in _trigrams(question):
+            for noun_id in index["postings"].get(trigram, ()):
+                shared[noun_id] += 1
+
+        sizes = index["sizes"]
+        scored = [
+            (count / sizes[noun_id], noun_id)
+            for noun_id, count in shared.items()
+            if count / sizes[noun_id] >= self.min_score
+        ]
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [index["nouns"][noun_id] for _, noun_id in scored[:self.top_k]]
+
+    def _get_index(self, nouns: List[str]) -> Dict:
+        key = frozenset(nouns)
+        index = self._indexes.get(key)
+        if index is None:
+            ordered = sorted(key)
+            postings = defaultdict(list)
+            sizes = []
+            for noun_id, noun in enumerate(ordered):
+                trigrams = _trigrams(noun)
+                sizes.append(len(trigrams))
+                for trigram in trigrams:
+                    postings[trigram].append(noun_id)
+            index = {"nouns": ordered, "postings": dict(postings), "sizes": sizes}
+            self._indexes.set(key, index)
+        return index
@@ -0,0 +1,39 @@
+import os
+import re
+from typing import Any, Dict, Optional
+from my_agent.Cache import TTLCache
+
+# The fields of a final workflow state that make up the agent's response
+RESPONSE_FIELDS = ("answer", "visualization", "visualization_reason", "formatted_data_for_visualization")
+
+
+class ResultCache:
+    """Cache of workflow responses keyed on (uuid, normalized question, data version).
+
+    Only the RESPONSE_FIELDS of a final state are kept, not its query results.
+    """
+
+    def __init__(self):
+        self.cache = TTLCache(
+            max_size=int(os.getenv("RESULT_CACHE_SIZE", "512")),
+            ttl=float(os.getenv("RESULT_CACHE_TTL", "3600")),
+        )
+
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        """Lowercase, collapse whitespace and drop trailing punctuation."""
+        return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?.!").strip()
+
+    def get(self, uuid: str, question: str, version: Optional[str]) -> Optional[Dict[str, Any]]:
+        return self.cache.get((uuid, self.normalize_question(question), version))
+
+    def set(self, uuid: str, question: str, version: Optional[str], result: Dict[str, Any]) -> None:
+        self.cache.set((uuid, self.normalize_question(question), version),
+                       {field: result[field] for field in RESPONSE_FIELDS})
+
+    def invalidate(self, uuid: str) -> int:
+        """Evict every cached result for a dataset."""
+        return self.cache.pop_matching(lambda key: key[0] == uuid)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
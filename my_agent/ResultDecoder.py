@@ -0,0 +1,60 @@
+import ast
+import json
+from typing import Any, Callable, Dict, Optional, Sequence
+from my_agent import ColumnarWire
+
+
+def _decode_json(body: bytes) -> Any:
+    return json.loads(body)
+
+
+# Decoders for query result bodies, by content type
+DECODERS: Dict[str, Callable[[bytes], Any]] = {
+    "application/json": _decode_json,
+    ColumnarWire.CONTENT_TYPE: ColumnarWire.decode_columnar_rows,
+}
+
+try:
+    import pyarrow  # noqa: F401
+    DECODERS["application/vnd.apache.arrow.stream"] = ColumnarWire.decode_arrow_rows
+except ImportError:
+    pass
+
+# Accept headers preferring the compact binary formats, then NDJSON when streaming, with JSON as the fallback
+_BINARY_CONTENT_TYPES = [content_type for content_type in DECODERS if content_type != "application/json"]
+ACCEPT_HEADER = ", ".join(_BINARY_CONTENT_TYPES + ["application/json;q=0.5"])
+STREAM_ACCEPT_HEADER = ", ".join(_BINARY_CONTENT_TYPES + ["application/x-ndjson;q=0.8", "application/json;q=0.5"])
+# For results too large to read whole, which only NDJSON lets a client cut off mid-body
+NDJSON_ACCEPT_HEADER = "application/x-ndjson"
+
+
+def is_result_rows(value: Any) -> bool:
+    """True for decoded query results: a list of rows or a ColumnarResult."""
+    return isinstance(value, (list, ColumnarWire.ColumnarResult))
+
+
+def decode_results(payload: Any, content_type: Optional[str] = None) -> Sequence[Any]:
+    """Decode a query result payload into a sequence of rows.
+
+    Accepts already decoded rows (a list or a ColumnarResult), a response body in any
+    registered content type, or a JSON / Python literal string. Strings are parsed with
+    ast.literal_eval, never eval.
+    """
+    if isinstance(payload, ColumnarWire.ColumnarResult):
+        return payload
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        media_type = (content_type or "application/json").split(";")[0].strip()
+        if media_type not in DECODERS:
+            raise ValueError(f"Unsupported result content type: {media_type}")
+        payload = DECODERS[media_type](bytes(payload) if isinstance(payload, memoryview) else payload)
+    elif isinstance(payload, str):
+        try:
+            payload = json.loads(payload)
+        except ValueError:
+            payload = ast.literal_eval(payload)
+
+    if isinstance(payload, dict):
+        payload = payload['results']
+    if not isinstance(payload, list):
+        raise ValueError("Query results must be a list of rows")
+    return payload
@@ -0,0 +1,93 @@
+import json
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+from my_agent.ColumnarWire import ColumnarResult
+
+DIGEST_ROW_THRESHOLD = int(os.getenv("DIGEST_ROW_THRESHOLD", "50"))
+DIGEST_SAMPLE_SIZE = int(os.getenv("DIGEST_SAMPLE_SIZE", "20"))
+DIGEST_TOP_K = int(os.getenv("DIGEST_TOP_K", "10"))
+
+_DATE_PATTERN = re.compile(
+    r"^(\d{4}-\d{1,2}(-\d{1,2})?([ T]\d{1,2}:\d{2}(:\d{2})?)?|\d{1,2}/\d{1,2}/\d{2,4}|\d{1,2}:\d{2}(:\d{2})?)$"
+)
+
+
+def _to_float(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def _describe_column(values: List[Any]) -> Dict[str, Any]:
+    present = [value for value in values if value is not None and value != ""]
+    if not present:
+        return {"type": "empty"}
+
+    numbers = [_to_float(value) for value in present]
+    if all(number is not None for number in numbers):
+        numbers.sort()
+        return {
+            "type": "numeric",
+            "min": numbers[0],
+            "max": numbers[-1],
+            "sum": sum(numbers),
+            "quantiles": {"p25": _quantile(numbers, 0.25), "p50": _quantile(numbers, 0.5), "p75": _quantile(numbers, 0.75)},
+        }
+
+    counts = Counter(str(value) for value in present)
+    return {
+        "type": "date" if all(_DATE_PATTERN.match(value) for value in counts) else "text",
+        "distinct_count": len(counts),
+        "top_values": counts.most_common(DIGEST_TOP_K),
+    }
+
+
+def build_result_digest(results: Sequence[Any], truncated: bool = False) -> Dict[str, Any]:
+    """Build a bounded summary of a query result: column types and stats plus a representative sample.
+
+    A ColumnarResult is described column by column, without building its rows.
+    """
+    if isinstance(results, ColumnarResult):
+        rows = results
+        columns = [_describe_column(results.column_values(index)) for index in range(len(results.columns))]
+    else:
+        rows = [row if isinstance(row, (list, tuple)) else [row] for row in results]
+        column_count = max((len(row) for row in rows), default=0)
+        columns = [
+            _describe_column([row[index] if index < len(row) else None for row in rows])
+            for index in range(column_count)
+        ]
+
+    # The first rows plus evenly spaced rows from the rest of the result
+    if len(rows) <= DIGEST_SAMPLE_SIZE:
+        sample = list(rows)
+    else:
+        head = DIGEST_SAMPLE_SIZE // 4
+        step = (len(rows) - head) / (DIGEST_SAMPLE_SIZE - head)
+        sample = rows[:head] + [rows[head + int(i * step)] for i in range(DIGEST_SAMPLE_SIZE - head)]
+
+    return {
+        "row_count": len(rows),
+        "truncated": truncated,
+        "columns": columns,
+        "sample": sample,
+    }
+
+
+def results_for_prompt(results: Any, digest: Optional[Dict[str, Any]]) -> str:
+    """Return the results themselves when small, otherwise the digest, for interpolation into a prompt."""
+    if digest is None or not isinstance(results, (list, ColumnarResult)) or len(results) <= DIGEST_ROW_THRESHOLD:
+        return str(results)
+    return "Summary of " + str(digest["row_count"]) + " rows (not the full result): " + json.dumps(digest, default=str)
@@ -1,18 +1,130 @@
+import os
+import re
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
+from langgraph.config import get_stream_writer
 from my_agent.DatabaseManager import DatabaseManager
 from my_agent.LLMManager import LLMManager
+from my_agent.NounIndex import NounIndex
+from my_agent.NounRetriever import NounRetriever
+from my_agent.SQLValidator import SQLValidator
+from my_agent.SQLTemplateCache import SQLTemplateCache
+from my_agent.Schema import parse_schema
+from my_agent.ResultDecoder import is_result_rows
+from my_agent.ResultDigest import build_result_digest, results_for_prompt
+from my_agent.ChartClassifier import classify_chart
+from my_agent.token_utils import estimate_tokens
 
-class SQLAgent:
-    def __init__(self):
-        self.db_manager = DatabaseManager()
-        self.llm_manager = LLMManager()
+VISUALIZATION_TYPES = ("bar", "horizontal_bar", "line", "pie", "scatter", "none")
 
-    def parse_question(self, state: dict) -> dict:
-        """Parse user question and identify relevant tables and columns."""
-        question = state['question']
-        schema = self.db_manager.get_schema(state['uuid'])
+SQL_GENERATION_RULES = '''If there is not enough information to write a SQL query, respond with "NOT_ENOUGH_INFO".
+
+Here are some examples:
+
+1. What is the top selling product?
+Answer: SELECT product_name, SUM(quantity) as total_quantity FROM sales WHERE product_name IS NOT NULL AND quantity IS NOT NULL AND product_name != "" AND quantity != "" AND product_name != "N/A" AND quantity != "N/A" GROUP BY product_name ORDER BY total_quantity DESC LIMIT 1
 
+2. What is the total revenue for each product?
+Answer: SELECT \`product name\`, SUM(quantity * price) as total_revenue FROM sales WHERE \`product name\` IS NOT NULL AND quantity IS NOT NULL AND price IS NOT NULL AND \`product name\` != "" AND quantity != "" AND price != "" AND \`product name\` != "N/A" AND quantity != "N/A" AND price != "N/A" GROUP BY \`product name\`  ORDER BY total_revenue DESC
+
+3. What is the market share of each product?
+Answer: SELECT \`product name\`, SUM(quantity) * 100.0 / (SELECT SUM(quantity) FROM sa  les) as market_share FROM sales WHERE \`product name\` IS NOT NULL AND quantity IS NOT NULL AND \`product name\` != "" AND quantity != "" AND \`product name\` != "N/A" AND quantity != "N/A" GROUP BY \`product name\`  ORDER BY market_share DESC
+
+4. Plot the distribution of income over time
+Answer: SELECT income, COUNT(*) as count FROM users WHERE income IS NOT NULL AND income != "" AND income != "N/A" GROUP BY income
+
+THE RESULTS SHOULD ONLY BE IN THE FOLLOWING FORMAT, SO MAKE SURE TO ONLY GIVE TWO OR THREE COLUMNS:
+[[x, y]]
+or 
+[[label, x, y]]
+             
+For questions like "plot a distribution of the fares for men and women", count the frequency of each fare and plot it. The x axis should be the fare and the y axis should be the count of people who paid that fare.
+SKIP ALL ROWS WHERE ANY COLUMN IS NULL or "N/A" or "".
+Just give the query string. Do not format it. Make sure to use the correct spellings of nouns as provided in the unique nouns list. All the table and column names should be enclosed in backticks.
+'''
+
+# Output schema of the fused parse + generate call, enforced by the model's structured output mode
+FUSED_OUTPUT_SCHEMA = {
+    "title": "fused_sql_generation",
+    "type": "object",
+    "properties": {
+        "is_relevant": {"type": "boolean"},
+        "relevant_tables": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "table_name": {"type": "string"},
+                    "columns": {"type": "array", "items": {"type": "string"}},
+                    "noun_columns": {"type": "array", "items": {"type": "string"}},
+                },
+                "required": ["table_name", "columns", "noun_columns"],
+                "additionalProperties": False,
+            },
+        },
+        "sql_query": {"type": "string"},
+    },
+    "required": ["is_relevant", "relevant_tables", "sql_query"],
+    "additionalProperties": False,
+}
+
+class SQLAgent:
+    def __init__(self, db_manager: DatabaseManager = None, llm_manager: LLMManager = None):
+        self.db_manager = db_manager or DatabaseManager()
+        self.llm_manager = llm_manager or LLMManager()
+        self.noun_index = NounIndex(self.db_manager)
+        self.noun_retriever = NounRetriever()
+        self.sql_validator = SQLValidator()
+        self.sql_template_cache = (
+            SQLTemplateCache() if os.getenv("SQL_TEMPLATE_CACHE_ENABLED", "true").lower() == "true" else None
+        )
+        self.max_result_rows = int(os.getenv("MAX_RESULT_ROWS", "10000"))
+        self.max_result_bytes = int(os.getenv("MAX_RESULT_BYTES", str(16 * 1024 * 1024)))
+        self.chart_rule_min_confidence = float(os.getenv("CHART_RULE_MIN_CONFIDENCE", "0.8"))
+        self.schema_sample_values = int(os.getenv("SCHEMA_SAMPLE_VALUES", "3"))
+
+    def _pruned_schema(self, state: dict, schema: str, keep_all_columns: bool = False):
+        """Return (schema text for the prompt, tokens saved) limited to the tables of the parsed question.
+
+        Falls back to the full schema when it cannot be parsed or no relevant table matches it.
+        """
+        parsed_schema = parse_schema(schema)
+        relevant_tables = (state.get('parsed_question') or {}).get('relevant_tables') or []
+        columns = parsed_schema.prune(relevant_tables, keep_all_columns) if parsed_schema.is_parsed else {}
+        if not columns:
+            return schema, 0
+
+        samples = self.noun_index.sample_values(
+            state['uuid'],
+            [(table_name, column) for table_name, column_names in columns.items() for column in column_names],
+            self.schema_sample_values,
+        ) if self.schema_sample_values > 0 else {}
+        pruned = parsed_schema.render(columns, samples)
+        return pruned, max(estimate_tokens(schema) - estimate_tokens(pruned), 0)
+
+    def lookup_sql_template(self, state: dict) -> dict:
+        """Reuse the query of an earlier question that differed only in its noun literals."""
+        uuid = state['uuid']
+        sql_query = self.sql_template_cache.get(
+            uuid, state['question'], self.db_manager.get_data_version(uuid), *self.noun_index.noun_map(uuid)
+        )
+        if sql_query is None:
+            return {"sql_template_hit": False}
+        return {"sql_query": sql_query, "sql_valid": True, "sql_template_hit": True}
+
+    def store_sql_template(self, state: dict) -> dict:
+        """Remember a query that was generated for this question and executed successfully."""
+        if state.get('sql_template_hit') or not is_result_rows(state.get('results')):
+            return {}
+        uuid = state['uuid']
+        self.sql_template_cache.set(
+            uuid, state['question'], self.db_manager.get_data_version(uuid),
+            *self.noun_index.noun_map(uuid), state['sql_query'],
+        )
+        return {}
+
+    def _parse_question_request(self, state: dict, schema: str):
+        """Return (prompt, prompt_kwargs) for parse_question."""
         prompt = ChatPromptTemplate.from_messages([
             ("system", '''You are a data analyst that can help summarize SQL tables and parse user questions about a database. 
 Given the question and database schema, identify the relevant tables and columns. 
@@ -35,12 +147,35 @@ The "noun_columns" field should contain only the columns that are relevant to th
             ("human", "===Database schema:\n{schema}\n\n===User question:\n{question}\n\nIdentify relevant tables and columns:")
         ])
 
+        return prompt, {"schema": schema, "question": state['question']}
+
+    def parse_question(self, state: dict) -> dict:
+        """Parse user question and identify relevant tables and columns."""
+        prompt, prompt_kwargs = self._parse_question_request(state, self.db_manager.get_schema(state['uuid']))
         output_parser = JsonOutputParser()
-        
-        response = self.llm_manager.invoke(prompt, schema=schema, question=question)
+
+        response = self.llm_manager.invoke(prompt, **prompt_kwargs)
+        parsed_response = output_parser.parse(response)
+        return {"parsed_question": parsed_response}
+
+    async def aparse_question(self, state: dict) -> dict:
+        """Async variant of parse_question."""
+        prompt, prompt_kwargs = self._parse_question_request(state, await self.db_manager.aget_schema(state['uuid']))
+        output_parser = JsonOutputParser()
+
+        response = await self.llm_manager.ainvoke(prompt, **prompt_kwargs)
         parsed_response = output_parser.parse(response)
         return {"parsed_question": parsed_response}
 
+    @staticmethod
+    def _noun_columns(parsed_question: dict):
+        """Return the relevant (table, column) pairs that hold nouns."""
+        return [
+            (table_info['table_name'], column)
+            for table_info in parsed_question['relevant_tables']
+            for column in table_info['noun_columns']
+        ]
+
     def get_unique_nouns(self, state: dict) -> dict:
         """Find unique nouns in relevant tables and columns."""
         parsed_question = state['parsed_question']
@@ -48,60 +183,37 @@ The "noun_columns" field should contain only the columns that are relevant to th
         if not parsed_question['is_relevant']:
             return {"unique_nouns": []}
 
-        unique_nouns = set()
-        for table_info in parsed_question['relevant_tables']:
-            table_name = table_info['table_name']
-            noun_columns = table_info['noun_columns']
-            
-            if noun_columns:
-                column_names = ', '.join(f"`{col}`" for col in noun_columns)
-                query = f"SELECT DISTINCT {column_names} FROM `{table_name}`"
-                results = self.db_manager.execute_query(state['uuid'], query)
-                for row in results:
-                    unique_nouns.update(str(value) for value in row if value)
+        unique_nouns = self.noun_index.get_nouns(state['uuid'], self._noun_columns(parsed_question))
 
-        return {"unique_nouns": list(unique_nouns)}
+        return {"unique_nouns": unique_nouns}
 
-    def generate_sql(self, state: dict) -> dict:
-        """Generate SQL query based on parsed question and unique nouns."""
-        question = state['question']
+    async def aget_unique_nouns(self, state: dict) -> dict:
+        """Async variant of get_unique_nouns."""
         parsed_question = state['parsed_question']
-        unique_nouns = state['unique_nouns']
 
         if not parsed_question['is_relevant']:
-            return {"sql_query": "NOT_RELEVANT", "is_relevant": False}
-    
-        schema = self.db_manager.get_schema(state['uuid'])
-
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", '''
-You are an AI assistant that generates SQL queries based on user questions, database schema, and unique nouns found in the relevant tables. Generate a valid SQL query to answer the user's question.
-
-If there is not enough information to write a SQL query, respond with "NOT_ENOUGH_INFO".
+            return {"unique_nouns": []}
 
-Here are some examples:
+        unique_nouns = await self.noun_index.aget_nouns(state['uuid'], self._noun_columns(parsed_question))
 
-1. What is the top selling product?
-Answer: SELECT product_name, SUM(quantity) as total_quantity FROM sales WHERE product_name IS NOT NULL AND quantity IS NOT NULL AND product_name != "" AND quantity != "" AND product_name != "N/A" AND quantity != "N/A" GROUP BY product_name ORDER BY total_quantity DESC LIMIT 1
+        return {"unique_nouns": unique_nouns}
 
-2. What is the total revenue for each product?
-Answer: SELECT \`product name\`, SUM(quantity * price) as total_revenue FROM sales WHERE \`product name\` IS NOT NULL AND quantity IS NOT NULL AND price IS NOT NULL AND \`product name\` != "" AND quantity != "" AND price != "" AND \`product name\` != "N/A" AND quantity != "N/A" AND price != "N/A" GROUP BY \`product name\`  ORDER BY total_revenue DESC
+    def filter_unique_nouns(self, state: dict) -> dict:
+        """Keep only the unique nouns closest to the terms in the question."""
+        unique_nouns = state['unique_nouns']
+        relevant_nouns = self.noun_retriever.retrieve(state['question'], unique_nouns)
+        tokens_saved = estimate_tokens(unique_nouns) - estimate_tokens(relevant_nouns)
+        return {"unique_nouns": relevant_nouns, "noun_tokens_saved": tokens_saved}
 
-3. What is the market share of each product?
-Answer: SELECT \`product name\`, SUM(quantity) * 100.0 / (SELECT SUM(quantity) FROM sa  les) as market_share FROM sales WHERE \`product name\` IS NOT NULL AND quantity IS NOT NULL AND \`product name\` != "" AND quantity != "" AND \`product name\` != "N/A" AND quantity != "N/A" GROUP BY \`product name\`  ORDER BY market_share DESC
+    def _generate_sql_request(self, state: dict, schema: str):
+        """Return (prompt, prompt_kwargs, schema tokens saved) for generate_sql."""
+        schema, tokens_saved = self._pruned_schema(state, schema)
 
-4. Plot the distribution of income over time
-Answer: SELECT income, COUNT(*) as count FROM users WHERE income IS NOT NULL AND income != "" AND income != "N/A" GROUP BY income
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", '''
+You are an AI assistant that generates SQL queries based on user questions, database schema, and unique nouns found in the relevant tables. Generate a valid SQL query to answer the user's question.
 
-THE RESULTS SHOULD ONLY BE IN THE FOLLOWING FORMAT, SO MAKE SURE TO ONLY GIVE TWO OR THREE COLUMNS:
-[[x, y]]
-or 
-[[label, x, y]]
-             
-For questions like "plot a distribution of the fares for men and women", count the frequency of each fare and plot it. The x axis should be the fare and the y axis should be the count of people who paid that fare.
-SKIP ALL ROWS WHERE ANY COLUMN IS NULL or "N/A" or "".
-Just give the query string. Do not format it. Make sure to use the correct spellings of nouns as provided in the unique nouns list. All the table and column names should be enclosed in backticks.
-'''),
+''' + SQL_GENERATION_RULES),
             ("human", '''===Database schema:
 {schema}
 
@@ -117,21 +229,110 @@ Just give the query string. Do not format it. Make sure to use the correct spell
 Generate SQL query string'''),
         ])
 
-        response = self.llm_manager.invoke(prompt, schema=schema, question=question, parsed_question=parsed_question, unique_nouns=unique_nouns)
-        
+        prompt_kwargs = {
+            "schema": schema,
+            "question": state['question'],
+            "parsed_question": state['parsed_question'],
+            "unique_nouns": state['unique_nouns'],
+        }
+        return prompt, prompt_kwargs, tokens_saved
+
+    @staticmethod
+    def _generated_sql_update(response: str, tokens_saved: int) -> dict:
         if response.strip() == "NOT_ENOUGH_INFO":
-            return {"sql_query": "NOT_RELEVANT"}
+            return {"sql_query": "NOT_RELEVANT", "schema_tokens_saved": tokens_saved}
         else:
-            return {"sql_query": response}
+            return {"sql_query": response, "schema_tokens_saved": tokens_saved}
 
-    def validate_and_fix_sql(self, state: dict) -> dict:
-        """Validate and fix the generated SQL query."""
-        sql_query = state['sql_query']
+    def generate_sql(self, state: dict) -> dict:
+        """Generate SQL query based on parsed question and unique nouns."""
+        if not state['parsed_question']['is_relevant']:
+            return {"sql_query": "NOT_RELEVANT", "is_relevant": False}
 
-        if sql_query == "NOT_RELEVANT":
-            return {"sql_query": "NOT_RELEVANT", "sql_valid": False}
-        
-        schema = self.db_manager.get_schema(state['uuid'])
+        prompt, prompt_kwargs, tokens_saved = self._generate_sql_request(state, self.db_manager.get_schema(state['uuid']))
+        response = self.llm_manager.invoke(prompt, **prompt_kwargs)
+        return self._generated_sql_update(response, tokens_saved)
+
+    async def agenerate_sql(self, state: dict) -> dict:
+        """Async variant of generate_sql."""
+        if not state['parsed_question']['is_relevant']:
+            return {"sql_query": "NOT_RELEVANT", "is_relevant": False}
+
+        schema = await self.db_manager.aget_schema(state['uuid'])
+        prompt, prompt_kwargs, tokens_saved = self._generate_sql_request(state, schema)
+        response = await self.llm_manager.ainvoke(prompt, **prompt_kwargs)
+        return self._generated_sql_update(response, tokens_saved)
+
+    def _parse_and_generate_request(self, state: dict, schema: str):
+        """Return (prompt, prompt_kwargs) for parse_and_generate_sql. Nouns come from the local noun index only."""
+        question = state['question']
+        unique_nouns = self.noun_retriever.retrieve(question, self.noun_index.cached_nouns(state['uuid']))
+
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", '''
+You are an AI assistant that parses user questions about a database and generates SQL queries to answer them.
+Given the question, the database schema and unique nouns found in the database:
+1. Set is_relevant to false if the question is not relevant to the database or there is not enough information to answer it.
+2. List the relevant tables and columns in relevant_tables. noun_columns holds only the relevant columns that contain nouns or names, never columns that contain numbers.
+3. Put a valid SQL query that answers the question in sql_query, or an empty string when is_relevant is false.
+
+''' + SQL_GENERATION_RULES),
+            ("human", '''===Database schema:
+{schema}
+
+===User question:
+{question}
+
+===Unique nouns in the database:
+{unique_nouns}
+
+Identify the relevant tables and columns and generate the SQL query'''),
+        ])
+
+        return prompt, {"schema": schema, "question": question, "unique_nouns": unique_nouns}
+
+    @staticmethod
+    def _parsed_and_generated_update(response: dict) -> dict:
+        parsed_question = {"is_relevant": response["is_relevant"], "relevant_tables": response["relevant_tables"]}
+        sql_query = response["sql_query"].strip()
+        if not response["is_relevant"] or not sql_query or sql_query == "NOT_ENOUGH_INFO":
+            sql_query = "NOT_RELEVANT"
+        return {"parsed_question": parsed_question, "sql_query": sql_query}
+
+    def parse_and_generate_sql(self, state: dict) -> dict:
+        """Identify the relevant tables and generate the SQL query in one structured-output call.
+
+        Returns no update when the call fails, so the workflow can fall back to the multi-step path.
+        The call only reads the local noun index; afterwards the index is brought up to date for
+        the noun columns it named, so the state and later questions see their current nouns.
+        """
+        prompt, prompt_kwargs = self._parse_and_generate_request(state, self.db_manager.get_schema(state['uuid']))
+        try:
+            response = self.llm_manager.invoke_structured(prompt, FUSED_OUTPUT_SCHEMA, **prompt_kwargs)
+        except Exception:
+            return {}
+        update = self._parsed_and_generated_update(response)
+        unique_nouns = self.noun_index.get_nouns(state['uuid'], self._noun_columns(update['parsed_question']))
+        update["unique_nouns"] = self.noun_retriever.retrieve(state['question'], unique_nouns)
+        return update
+
+    async def aparse_and_generate_sql(self, state: dict) -> dict:
+        """Async variant of parse_and_generate_sql."""
+        schema = await self.db_manager.aget_schema(state['uuid'])
+        prompt, prompt_kwargs = self._parse_and_generate_request(state, schema)
+        try:
+            response = await self.llm_manager.ainvoke_structured(prompt, FUSED_OUTPUT_SCHEMA, **prompt_kwargs)
+        except Exception:
+            return {}
+        update = self._parsed_and_generated_update(response)
+        unique_nouns = await self.noun_index.aget_nouns(state['uuid'], self._noun_columns(update['parsed_question']))
+        update["unique_nouns"] = self.noun_retriever.retrieve(state['question'], unique_nouns)
+        return update
+
+    def _fix_sql_request(self, state: dict, schema: str, issues: str):
+        """Return (prompt, prompt_kwargs, schema tokens saved) for the LLM fix of validate_and_fix_sql."""
+        # The fix may need columns the parsed question left out, so keep whole tables
+        prompt_schema, tokens_saved = self._pruned_schema(state, schema, keep_all_columns=True)
 
         prompt = ChatPromptTemplate.from_messages([
             ("system", '''
@@ -154,6 +355,9 @@ Respond in JSON format with the following structure. Only respond with the JSON:
 ===Generated SQL query:
 {sql_query}
 
+===Local validation error:
+{issues}
+
 Respond in JSON format with the following structure. Only respond with the JSON:
 {{
     "valid": boolean,
@@ -183,19 +387,67 @@ For example:
 '''),
         ])
 
+        return prompt, {"schema": prompt_schema, "sql_query": state['sql_query'], "issues": issues}, tokens_saved
+
+    @staticmethod
+    def _fixed_sql_update(sql_query: str, response: str, tokens_saved: int) -> dict:
         output_parser = JsonOutputParser()
-        response = self.llm_manager.invoke(prompt, schema=schema, sql_query=sql_query)
         result = output_parser.parse(response)
 
         if result["valid"] and result["issues"] is None:
-            return {"sql_query": sql_query, "sql_valid": True}
+            return {"sql_query": sql_query, "sql_valid": True, "schema_tokens_saved": tokens_saved}
         else:
             return {
                 "sql_query": result["corrected_query"],
                 "sql_valid": result["valid"],
-                "sql_issues": result["issues"]
+                "sql_issues": result["issues"],
+                "schema_tokens_saved": tokens_saved,
             }
 
+    def validate_and_fix_sql(self, state: dict) -> dict:
+        """Validate and fix the generated SQL query."""
+        sql_query = state['sql_query']
+
+        if sql_query == "NOT_RELEVANT":
+            return {"sql_query": "NOT_RELEVANT", "sql_valid": False}
+
+        schema = self.db_manager.get_schema(state['uuid'])
+
+        # Only fall back to the LLM when the local check fails or cannot run
+        valid, issues = self.sql_validator.validate(schema, sql_query)
+        if valid:
+            return {"sql_query": sql_query, "sql_valid": True}
+
+        prompt, prompt_kwargs, tokens_saved = self._fix_sql_request(state, schema, issues)
+        response = self.llm_manager.invoke(prompt, **prompt_kwargs)
+        return self._fixed_sql_update(sql_query, response, tokens_saved)
+
+    async def avalidate_and_fix_sql(self, state: dict) -> dict:
+        """Async variant of validate_and_fix_sql."""
+        sql_query = state['sql_query']
+
+        if sql_query == "NOT_RELEVANT":
+            return {"sql_query": "NOT_RELEVANT", "sql_valid": False}
+
+        schema = await self.db_manager.aget_schema(state['uuid'])
+
+        valid, issues = self.sql_validator.validate(schema, sql_query)
+        if valid:
+            return {"sql_query": sql_query, "sql_valid": True}
+
+        prompt, prompt_kwargs, tokens_saved = self._fix_sql_request(state, schema, issues)
+        response = await self.llm_manager.ainvoke(prompt, **prompt_kwargs)
+        return self._fixed_sql_update(sql_query, response, tokens_saved)
+
+    @staticmethod
+    def _results_update(stream, results) -> dict:
+        return {
+            "results": results,
+            "results_row_count": stream.row_count,
+            "results_truncated": stream.truncated,
+            "results_digest": build_result_digest(results, truncated=stream.truncated),
+        }
+
     def execute_sql(self, state: dict) -> dict:
         """Execute SQL query and return results."""
         query = state['sql_query']
@@ -205,35 +457,89 @@ For example:
             return {"results": "NOT_RELEVANT"}
 
         try:
-            results = self.db_manager.execute_query(uuid, query)
-            return {"results": results}
+            stream, results = self.db_manager.collect_query(
+                uuid, query, max_rows=self.max_result_rows, max_bytes=self.max_result_bytes
+            )
+            return self._results_update(stream, results)
         except Exception as e:
             return {"error": str(e)}
 
-    def format_results(self, state: dict) -> dict:
-        """Format query results into a human-readable response."""
+    async def aexecute_sql(self, state: dict) -> dict:
+        """Async variant of execute_sql."""
+        query = state['sql_query']
+
+        if query == "NOT_RELEVANT":
+            return {"results": "NOT_RELEVANT"}
+
+        try:
+            stream, results = await self.db_manager.acollect_query(
+                state['uuid'], query, max_rows=self.max_result_rows, max_bytes=self.max_result_bytes
+            )
+            return self._results_update(stream, results)
+        except Exception as e:
+            return {"error": str(e)}
+
+    def _format_results_request(self, state: dict):
+        """Return (update, None, None) when no LLM call is needed, otherwise (None, prompt, prompt_kwargs)."""
         question = state['question']
         results = state['results']
 
         if results == "NOT_RELEVANT":
-            return {"answer": "Sorry, I can only give answers relevant to the database."}
+            return {"answer": "Sorry, I can only give answers relevant to the database."}, None, None
 
         prompt = ChatPromptTemplate.from_messages([
             ("system", "You are an AI assistant that formats database query results into a human-readable response. Give a conclusion to the user's question based on the query results. Do not give the answer in markdown format. Only give the answer in one line."),
             ("human", "User question: {question}\n\nQuery results: {results}\n\nFormatted response:"),
         ])
 
-        response = self.llm_manager.invoke(prompt, question=question, results=results)
-        return {"answer": response}
+        return None, prompt, {"question": question, "results": results_for_prompt(results, state.get('results_digest'))}
 
-    def choose_visualization(self, state: dict) -> dict:
-        """Choose an appropriate visualization for the data."""
+    def format_results(self, state: dict) -> dict:
+        """Format query results into a human-readable response, streaming the answer as custom graph events."""
+        update, prompt, prompt_kwargs = self._format_results_request(state)
+        if update is not None:
+            return update
+        writer = get_stream_writer()
+        answer = []
+        for token in self.llm_manager.stream(prompt, **prompt_kwargs):
+            answer.append(token)
+            writer({"node": "format_results", "token": token})
+        return {"answer": "".join(answer)}
+
+    async def aformat_results(self, state: dict) -> dict:
+        """Async variant of format_results."""
+        update, prompt, prompt_kwargs = self._format_results_request(state)
+        if update is not None:
+            return update
+        writer = get_stream_writer()
+        answer = []
+        async for token in self.llm_manager.astream(prompt, **prompt_kwargs):
+            answer.append(token)
+            writer({"node": "format_results", "token": token})
+        return {"answer": "".join(answer)}
+
+    def guess_visualization(self, state: dict):
+        """Return the locally classified chart type for the results, however low its confidence."""
+        results = state.get('results')
+        if not is_result_rows(results):
+            return None
+        results_digest = state.get('results_digest') or build_result_digest(results)
+        return classify_chart(state['question'], results_digest)[0]
+
+    def _visualization_request(self, state: dict):
+        """Return (update, None, None) when no LLM call is needed, otherwise (None, prompt, prompt_kwargs)."""
         question = state['question']
         results = state['results']
         sql_query = state['sql_query']
 
         if results == "NOT_RELEVANT":
-            return {"visualization": "none", "visualization_reasoning": "No visualization needed for irrelevant questions."}
+            return {"visualization": "none", "visualization_reasoning": "No visualization needed for irrelevant questions."}, None, None
+
+        # Decide locally from the result shape and only ask the LLM about ambiguous shapes
+        results_digest = state.get('results_digest') or build_result_digest(results)
+        visualization, confidence, reason = classify_chart(question, results_digest)
+        if visualization is not None and confidence >= self.chart_rule_min_confidence:
+            return {"visualization": visualization, "visualization_reason": reason}, None, None
 
         prompt = ChatPromptTemplate.from_messages([
             ("system", '''
@@ -266,10 +572,33 @@ Query results: {results}
 Recommend a visualization:'''),
         ])
 
-        response = self.llm_manager.invoke(prompt, question=question, sql_query=sql_query, results=results)
-        
-        lines = response.split('\n')
-        visualization = lines[0].split(': ')[1]
-        reason = lines[1].split(': ')[1]
+        return None, prompt, {
+            "question": question,
+            "sql_query": sql_query,
+            "results": results_for_prompt(results, results_digest),
+        }
+
+    @staticmethod
+    def _parse_visualization(response: str) -> dict:
+        match = re.search(r"Recommended Visualization:\s*\[?\s*\"?([A-Za-z_ ]+)", response, re.IGNORECASE)
+        visualization = match.group(1).strip().lower().replace(" ", "_") if match else "none"
+        if visualization not in VISUALIZATION_TYPES:
+            visualization = "none"
+        match = re.search(r"Reason:\s*(.+)", response, re.IGNORECASE)
+        reason = match.group(1).strip() if match else ""
 
         return {"visualization": visualization, "visualization_reason": reason}
+
+    def choose_visualization(self, state: dict) -> dict:
+        """Choose an appropriate visualization for the data."""
+        update, prompt, prompt_kwargs = self._visualization_request(state)
+        if update is not None:
+            return update
+        return self._parse_visualization(self.llm_manager.invoke(prompt, **prompt_kwargs))
+
+    async def achoose_visualization(self, state: dict) -> dict:
+        """Async variant of choose_visualization."""
+        update, prompt, prompt_kwargs = self._visualization_request(state)
+        if update is not None:
+            return update
+        return self._parse_visualization(await self.llm_manager.ainvoke(prompt, **prompt_kwargs))
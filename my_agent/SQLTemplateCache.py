@@ -0,0 +1,127 @@
+import os
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from my_agent.Cache import TTLCache
+from my_agent.ResultCache import ResultCache
+
+# Single- or double-quoted SQL string literal, with doubled quotes as escapes
+_SQL_STRING = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+
+# Nouns shorter than this only match with their exact case, so "a" in a question is not branch "A"
+MIN_CASE_INSENSITIVE_LENGTH = 3
+
+
+class SQLTemplateCache:
+    """Cache of executed SQL queries keyed on the question skeleton, i.e. the normalized question
+    with every known noun literal replaced by a placeholder naming the column(s) it belongs to.
+
+    A query is stored as a template where the string literals that carry a question's nouns
+    become parameters. A later question with the same skeleton gets the template with its own
+    nouns substituted. Nouns that never made it into the query must match exactly.
+    """
+
+    def __init__(self):
+        self.cache = TTLCache(
+            max_size=int(os.getenv("SQL_TEMPLATE_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("SQL_TEMPLATE_CACHE_TTL", "86400")),
+        )
+        # (uuid, noun index fingerprint) -> matcher, see _matcher
+        self._matchers = TTLCache(max_size=64)
+
+    def _matcher(self, uuid: str, noun_fingerprint, noun_columns: Dict[str, Tuple[Tuple[str, str], ...]]):
+        """Return (compiled noun regex, lookup of matched text to canonical noun) for a dataset.
+
+        Compiling the regex over every noun is slow for large indexes, so it is built once per
+        noun index fingerprint (see NounIndex.noun_map) and replaced when the index changes.
+        """
+        key = (uuid, noun_fingerprint)
+        matcher = self._matchers.get(key)
+        if matcher is None:
+            lookup = {}
+            for noun in noun_columns:
+                lookup.setdefault(noun.lower() if len(noun) >= MIN_CASE_INSENSITIVE_LENGTH else noun, noun)
+            matcher = (_noun_pattern(noun_columns), lookup)
+            self._matchers.pop_matching(lambda matcher_key: matcher_key[0] == uuid)
+            self._matchers.set(key, matcher)
+        return matcher
+
+    def skeleton(self, uuid: str, question: str, noun_fingerprint,
+                 noun_columns: Dict[str, Tuple[Tuple[str, str], ...]]) -> Tuple[str, List[str]]:
+        """Return (question skeleton, canonical nouns in order of appearance)."""
+        pattern, lookup = self._matcher(uuid, noun_fingerprint, noun_columns)
+        nouns = []
+
+        def replace(match):
+            text = match.group()
+            noun = lookup.get(text) or lookup[text.lower()]
+            nouns.append(noun)
+            return "<" + "|".join(f"{table}.{column}" for table, column in noun_columns[noun]) + ">"
+
+        if pattern is not None:
+            question = pattern.sub(replace, question)
+        return ResultCache.normalize_question(question), nouns
+
+    def get(self, uuid: str, question: str, version: Optional[str], noun_fingerprint,
+            noun_columns: Dict[str, Tuple[Tuple[str, str], ...]]) -> Optional[str]:
+        """Return the cached query for the question's skeleton with the question's nouns filled in.
+
+        noun_fingerprint and noun_columns are the pair returned by NounIndex.noun_map.
+        """
+        skeleton, nouns = self.skeleton(uuid, question, noun_fingerprint, noun_columns)
+        entry = self.cache.get((uuid, skeleton, version))
+        if entry is None:
+            return None
+        parts, fixed = entry
+        if any(nouns[index].lower() != value for index, value in fixed.items()):
+            return None
+        return "".join(
+            part if isinstance(part, str) else nouns[part[0]].replace(part[1], part[1] * 2)
+            for part in parts
+        )
+
+    def set(self, uuid: str, question: str, version: Optional[str], noun_fingerprint,
+            noun_columns: Dict[str, Tuple[Tuple[str, str], ...]], sql_query: str) -> None:
+        skeleton, nouns = self.skeleton(uuid, question, noun_fingerprint, noun_columns)
+        parts, found = _parameterize(sql_query, nouns)
+        fixed = {index: noun.lower() for index, noun in enumerate(nouns) if index not in found}
+        self.cache.set((uuid, skeleton, version), (parts, fixed))
+
+    def invalidate(self, uuid: str) -> int:
+        """Evict every template and noun matcher for a dataset. Returns the number of templates evicted."""
+        self._matchers.pop_matching(lambda key: key[0] == uuid)
+        return self.cache.pop_matching(lambda key: key[0] == uuid)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
+
+
+def _noun_pattern(nouns) -> Optional["re.Pattern"]:
+    """Match any of nouns as a whole word, longest first, ignoring case for all but short nouns."""
+    alternatives = [
+        f"(?i:{re.escape(noun)})" if len(noun) >= MIN_CASE_INSENSITIVE_LENGTH else re.escape(noun)
+        for noun in sorted(nouns, key=len, reverse=True)
+    ]
+    return re.compile(r"(?<!\w)(?:" + "|".join(alternatives) + r")(?!\w)") if alternatives else None
+
+
+def _parameterize(sql_query: str, nouns: Sequence[str]):
+    """Split sql_query into text and (noun index, quote) parameters wherever a string literal holds
+    one of nouns, optionally wrapped in LIKE wildcards. Returns (parts, indexes of the nouns found)."""
+    parts, found, position = [], set(), 0
+    for match in _SQL_STRING.finditer(sql_query):
+        quote, body = match.group()[0], match.group()[1:-1]
+        core = body.strip("%")
+        escaped = {}
+        for index, noun in enumerate(nouns):
+            # Inside the literal a noun appears with its quotes doubled
+            text = noun.replace(quote, quote * 2)
+            escaped.setdefault(text.lower() if len(text) >= MIN_CASE_INSENSITIVE_LENGTH else text, index)
+        index = escaped.get(core.lower() if len(core) >= MIN_CASE_INSENSITIVE_LENGTH else core)
+        if not core or index is None:
+            continue
+        core_start = match.start() + 1 + body.index(core)
+        parts.extend([sql_query[position:core_start], (index, quote)])
+        position = core_start + len(core)
+        found.add(index)
+    parts.append(sql_query[position:])
+    return parts, found
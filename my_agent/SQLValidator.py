@@ -0,0 +1,25 @@
+import sqlite3
+from typing import Optional, Tuple
+from my_agent.Schema import parse_schema
+
+ONLY_SELECT = "Only a single SELECT statement is allowed"
+
+
+class SQLValidator:
+    """Deterministic validation of generated SQL against the dataset schema, without an LLM."""
+
+    def validate(self, schema_text: str, query: str) -> Tuple[Optional[bool], Optional[str]]:
+        """Return (valid, issues). valid is None when the schema could not be parsed locally."""
+        schema = parse_schema(schema_text)
+        if not schema.is_parsed:
+            return None, None
+
+        query = query.strip().rstrip(";").strip()
+        if not query.split(None, 1) or query.split(None, 1)[0].upper() not in ("SELECT", "WITH"):
+            return False, ONLY_SELECT
+
+        try:
+            schema.explain(query)
+        except (sqlite3.Error, sqlite3.Warning) as e:
+            return False, ONLY_SELECT if str(e) == "not authorized" else str(e)
+        return True, None
@@ -0,0 +1,235 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from my_agent.Tracing import METRICS
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing a run when the scheduler's wait queue is full."""
+
+
+class SingleFlight:
+    """Share one execution among concurrent callers that ask for the same key.
+
+    The first caller runs the function; callers arriving while it is in flight wait for and
+    receive the same result (or exception). Nothing is kept once the call completes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, "_Call"] = {}
+        self._async_calls: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], asyncio.Task] = {}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return (result, shared) where shared is True if another caller's execution was reused."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    async def ado(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Async variant of do. Calls are only shared within one event loop.
+
+        The call runs as its own task that every caller awaits through a shield, so cancelling
+        any caller, including the one that started it, leaves the call running for the others.
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (loop, key)
+        with self._lock:
+            task = self._async_calls.get(flight_key)
+            leader = task is None
+            if leader:
+                task = self._async_calls[flight_key] = loop.create_task(func())
+                task.add_done_callback(functools.partial(self._finish_async, flight_key))
+        return await asyncio.shield(task), not leader
+
+    def _finish_async(self, flight_key: Tuple[asyncio.AbstractEventLoop, Hashable], task: asyncio.Task) -> None:
+        with self._lock:
+            del self._async_calls[flight_key]
+        # Mark the exception as retrieved in case every caller was cancelled before it was raised
+        if not task.cancelled():
+            task.exception()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Ticket:
+    """A queued run, granted either through a threading.Event or an asyncio future."""
+
+    __slots__ = ("uuid", "event", "future", "loop", "queued_at")
+
+    def __init__(self, uuid: str, loop: asyncio.AbstractEventLoop = None):
+        self.uuid = uuid
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.queued_at = time.perf_counter()
+
+    def grant(self) -> None:
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class ConcurrencyController:
+    """Admission control for workflow runs across tenants.
+
+    At most max_concurrency runs execute at once and at most per_uuid_limit of them for the
+    same dataset. Waiting runs are granted round-robin across datasets, so a burst on one
+    uuid cannot starve the others. Once max_queue_depth runs are waiting, new runs fail
+    fast with Overloaded.
+    """
+
+    def __init__(self, max_concurrency: int = None, per_uuid_limit: int = None, max_queue_depth: int = None):
+        self.max_concurrency = max_concurrency or int(os.getenv("RUN_MAX_CONCURRENCY", "16"))
+        self.per_uuid_limit = per_uuid_limit or int(os.getenv("RUN_PER_UUID_LIMIT", "4"))
+        self.max_queue_depth = max_queue_depth if max_queue_depth is not None else \
+            int(os.getenv("RUN_MAX_QUEUE_DEPTH", "256"))
+        self._lock = threading.Lock()
+        self._waiting: "OrderedDict[str, deque]" = OrderedDict()
+        self._queue_depth = 0
+        self._running = 0
+        self._running_per_uuid: Dict[str, int] = {}
+        self.admitted = 0
+        self.rejected = 0
+        self.peak_queue_depth = 0
+
+    @contextmanager
+    def slot(self, uuid: str):
+        """Block until the run may start, then hold its slot for the duration of the block."""
+        ticket = self._enqueue(_Ticket(uuid))
+        ticket.event.wait()
+        self._record_wait(ticket)
+        try:
+            yield
+        finally:
+            self._release(uuid)
+
+    @asynccontextmanager
+    async def aslot(self, uuid: str):
+        """Async variant of slot that waits without blocking the event loop."""
+        ticket = self._enqueue(_Ticket(uuid, asyncio.get_running_loop()))
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            self._cancel(ticket)
+            raise
+        self._record_wait(ticket)
+        try:
+            yield
+        finally:
+            self._release(uuid)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "running": self._running,
+                "queue_depth": self._queue_depth,
+                "peak_queue_depth": self.peak_queue_depth,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "running_per_uuid": dict(self._running_per_uuid),
+            }
+
+    def _enqueue(self, ticket: _Ticket) -> _Ticket:
+        with self._lock:
+            self._waiting.setdefault(ticket.uuid, deque()).append(ticket)
+            self._queue_depth += 1
+            self._dispatch()
+            if self._queue_depth > self.max_queue_depth and ticket in self._waiting.get(ticket.uuid, ()):
+                self._withdraw(ticket)
+                self.rejected += 1
+                METRICS.inc("datavis_runs_rejected_total")
+                raise Overloaded(f"{self._queue_depth} runs already waiting")
+            self.peak_queue_depth = max(self.peak_queue_depth, self._queue_depth)
+        return ticket
+
+    def _record_wait(self, ticket: _Ticket) -> None:
+        METRICS.observe("datavis_queue_wait_seconds", time.perf_counter() - ticket.queued_at)
+
+    def _release(self, uuid: str) -> None:
+        with self._lock:
+            self._running -= 1
+            self._running_per_uuid[uuid] -= 1
+            if not self._running_per_uuid[uuid]:
+                del self._running_per_uuid[uuid]
+            self._dispatch()
+
+    def _cancel(self, ticket: _Ticket) -> None:
+        """Withdraw a cancelled async waiter, giving back its slot if it was granted meanwhile."""
+        with self._lock:
+            if ticket in self._waiting.get(ticket.uuid, ()):
+                self._withdraw(ticket)
+                return
+        self._release(ticket.uuid)
+
+    def _withdraw(self, ticket: _Ticket) -> None:
+        """Remove a ticket that is still waiting. Caller holds the lock."""
+        queue = self._waiting[ticket.uuid]
+        queue.remove(ticket)
+        if not queue:
+            del self._waiting[ticket.uuid]
+        self._queue_depth -= 1
+        self._update_gauges()
+
+    def _dispatch(self) -> None:
+        """Grant free slots round-robin across datasets with waiting runs. Caller holds the lock."""
+        granted = True
+        while granted and self._running < self.max_concurrency:
+            granted = False
+            for uuid in list(self._waiting):
+                if self._running_per_uuid.get(uuid, 0) >= self.per_uuid_limit:
+                    continue
+                queue = self._waiting[uuid]
+                ticket = queue.popleft()
+                if queue:
+                    self._waiting.move_to_end(uuid)
+                else:
+                    del self._waiting[uuid]
+                self._queue_depth -= 1
+                self._running += 1
+                self._running_per_uuid[uuid] = self._running_per_uuid.get(uuid, 0) + 1
+                self.admitted += 1
+                ticket.grant()
+                granted = True
+                break
+        self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        METRICS.set("datavis_run_queue_depth", self._queue_depth)
+        METRICS.set("datavis_runs_in_flight", self._running)
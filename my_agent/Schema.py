@@ -0,0 +1,141 @@
+import hashlib
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+from my_agent.Cache import TTLCache
+
+_CREATE_TABLE = re.compile(r"CREATE\s+(?:TEMP\w*\s+)?TABLE\b", re.IGNORECASE)
+_QUOTES = {"'": "'", '"': '"', "`": "`", "[": "]"}
+_READ_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+
+
+def _read_only_authorizer(action: int, *args) -> int:
+    return sqlite3.SQLITE_OK if action in _READ_ACTIONS else sqlite3.SQLITE_DENY
+
+
+def _extract_create_statements(text: str) -> List[str]:
+    """Find every CREATE TABLE statement in text, matching parentheses outside quoted identifiers."""
+    statements = []
+    for match in _CREATE_TABLE.finditer(text):
+        depth, quote, position = 0, None, match.end()
+        while position < len(text):
+            char = text[position]
+            if quote:
+                if char == quote:
+                    quote = None
+            elif char in _QUOTES:
+                quote = _QUOTES[char]
+            elif char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+                if depth == 0:
+                    statements.append(text[match.start():position + 1])
+                    break
+            position += 1
+    return statements
+
+
+class Schema:
+    """Structured view of a dataset schema, backed by an empty in-memory SQLite copy of its tables."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        for statement in _extract_create_statements(text):
+            try:
+                self._conn.execute(statement)
+            except sqlite3.Error:
+                continue
+
+        self.tables: Dict[str, List[Tuple[str, str]]] = {}
+        table_names = [row[0] for row in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        for table_name in table_names:
+            escaped = table_name.replace('"', '""')
+            self.tables[table_name] = [
+                (row[1], row[2]) for row in self._conn.execute(f'PRAGMA table_info("{escaped}")')
+            ]
+
+    @property
+    def is_parsed(self) -> bool:
+        return bool(self.tables)
+
+    def resolve_table(self, name: str) -> Optional[str]:
+        """Return the schema's spelling of a table name, matched case-insensitively and without quotes."""
+        wanted = name.strip().strip('`"[]').lower()
+        return next((table_name for table_name in self.tables if table_name.lower() == wanted), None)
+
+    def prune(self, relevant_tables: Sequence[dict], keep_all_columns: bool = False) -> Dict[str, List[str]]:
+        """Map the tables named in a parsed question to the columns to keep, in schema order.
+
+        Unknown tables and columns are dropped, and a table whose listed columns all fail to
+        match keeps every column.
+        """
+        pruned = {}
+        for table_info in relevant_tables:
+            table_name = self.resolve_table(table_info.get('table_name', ''))
+            if table_name is None:
+                continue
+            column_names = [column for column, _ in self.tables[table_name]]
+            wanted = {
+                column.strip().strip('`"[]').lower()
+                for column in [*table_info.get('columns', []), *table_info.get('noun_columns', [])]
+            }
+            kept = [column for column in column_names if column.lower() in wanted]
+            if keep_all_columns or not kept:
+                kept = column_names
+            pruned[table_name] = list(dict.fromkeys(pruned.get(table_name, []) + kept))
+        return pruned
+
+    def render(self, columns: Optional[Dict[str, List[str]]] = None,
+               samples: Optional[Dict[Tuple[str, str], List[str]]] = None) -> str:
+        """Render tables compactly, one per line, as `table`(`column` TYPE ['sample', ...], ...).
+
+        columns limits the output to some tables and columns (all of them by default) and
+        samples adds example values per (table, column).
+        """
+        columns = columns if columns is not None else {
+            table_name: [column for column, _ in table_columns] for table_name, table_columns in self.tables.items()
+        }
+        samples = samples or {}
+        lines = []
+        for table_name, column_names in columns.items():
+            types = dict(self.tables[table_name])
+            rendered = []
+            for column in column_names:
+                item = f"`{column}`"
+                if types.get(column):
+                    item += f" {types[column]}"
+                if samples.get((table_name, column)):
+                    item += " [" + ", ".join(repr(value) for value in samples[(table_name, column)]) + "]"
+                rendered.append(item)
+            lines.append(f"`{table_name}`(" + ", ".join(rendered) + ")")
+        return "\n".join(lines)
+
+    def explain(self, query: str) -> None:
+        """Compile query against the empty copy of the schema, raising sqlite3.Error if it is invalid.
+
+        Only reads are authorized while it compiles, so a statement that would write or change
+        the database, such as a DELETE behind a WITH clause, fails with "not authorized".
+        """
+        with self._lock:
+            self._conn.set_authorizer(_read_only_authorizer)
+            try:
+                self._conn.execute(f"EXPLAIN {query}").fetchall()
+            finally:
+                self._conn.set_authorizer(None)
+
+
+_schemas = TTLCache(max_size=64)
+
+
+def parse_schema(text: str) -> Schema:
+    """Parse a schema string once, reusing the parsed object for identical schemas."""
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    schema = _schemas.get(key)
+    if schema is None:
+        schema = Schema(text)
+        _schemas.set(key, schema)
+    return schema
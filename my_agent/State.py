@@ -1,4 +1,4 @@
-from typing import List, Any, Annotated, Dict, Optional
+from typing import List, Any, Annotated, Dict, Optional, Sequence
 from typing_extensions import TypedDict
 import operator
 
@@ -8,16 +8,23 @@ class InputState(TypedDict):
     parsed_question: Dict[str, Any]
     unique_nouns: List[str]
     sql_query: str
-    results: List[Any]
+    results: Sequence[Any]
+    results_digest: Dict[str, Any]
     visualization: Annotated[str, operator.add]
 
 class OutputState(TypedDict):
     parsed_question: Dict[str, Any]
     unique_nouns: List[str]
+    noun_tokens_saved: int
+    schema_tokens_saved: Annotated[int, operator.add]
     sql_query: str
     sql_valid: bool
     sql_issues: str
-    results: List[Any]
+    sql_template_hit: bool
+    results: Sequence[Any]
+    results_row_count: int
+    results_truncated: bool
+    results_digest: Dict[str, Any]
     answer: Annotated[str, operator.add]
     error: str
     visualization: Annotated[str, operator.add]
@@ -0,0 +1,222 @@
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+import tracemalloc
+import uuid as uuid_lib
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Fields of a span record that are summed into the run totals and exported as counters
+COUNTED_FIELDS = ("prompt_tokens", "completion_tokens", "bytes", "cache_hit")
+
+_current_trace: contextvars.ContextVar[Optional["RunTrace"]] = contextvars.ContextVar("current_trace", default=None)
+_current_node: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_node", default=None)
+
+
+def llm_cost(prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated USD cost of an LLM call, priced per 1K tokens by LLM_PROMPT_COST_PER_1K / LLM_COMPLETION_COST_PER_1K."""
+    return (
+        prompt_tokens * float(os.getenv("LLM_PROMPT_COST_PER_1K", "0.0025"))
+        + completion_tokens * float(os.getenv("LLM_COMPLETION_COST_PER_1K", "0.01"))
+    ) / 1000
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """In-process histograms, counters and gauges, keyed by metric name and label values."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self.gauges: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+    def observe(self, metric: str, value: float, **labels) -> None:
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, metric: str, value: float = 1, **labels) -> None:
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, metric: str, value: float, **labels) -> None:
+        with self._lock:
+            self.gauges[(metric, tuple(sorted(labels.items())))] = value
+
+    def clear(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
+
+    def to_prometheus(self) -> str:
+        """Export every metric in the Prometheus text exposition format."""
+        def format_labels(labels, extra=()):
+            items = [*labels, *extra]
+            if not items:
+                return ""
+            escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in items)
+            return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + "}"
+
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f"{name}_bucket{format_labels(labels, [('le', repr(bound))])} {count}")
+                lines.append(f"{name}_bucket{format_labels(labels, [('le', '+Inf')])} {histogram.count}")
+                lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+            for metric_type, values in (("counter", self.counters), ("gauge", self.gauges)):
+                for (name, labels), value in sorted(values.items()):
+                    if name not in typed:
+                        lines.append(f"# TYPE {name} {metric_type}")
+                        typed.add(name)
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+
+def export_prometheus() -> str:
+    return METRICS.to_prometheus()
+
+
+class RunTrace:
+    """Structured record of one workflow run: a flat list of spans for nodes, LLM calls and DB calls."""
+
+    def __init__(self):
+        self.run_id = uuid_lib.uuid4().hex
+        self.started_at = time.perf_counter()
+        self.wall_time = None
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append(record)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = [dict(record) for record in self.spans]
+        totals = {"llm_calls": 0, "db_calls": 0, **{field: 0 for field in COUNTED_FIELDS}}
+        for record in spans:
+            if record["kind"] in ("llm", "db"):
+                totals[f"{record['kind']}_calls"] += 1
+            for field in COUNTED_FIELDS:
+                totals[field] += int(record.get(field) or 0)
+        totals["cache_hits"] = totals.pop("cache_hit")
+        totals["cost_usd"] = llm_cost(totals["prompt_tokens"], totals["completion_tokens"])
+        wall_time = self.wall_time if self.wall_time is not None else time.perf_counter() - self.started_at
+        return {"run_id": self.run_id, "wall_time": wall_time, "totals": totals, "spans": spans}
+
+
+@contextmanager
+def run_trace() -> Iterator[RunTrace]:
+    """Collect every span recorded in this context into a new RunTrace."""
+    trace = RunTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.wall_time = time.perf_counter() - trace.started_at
+        _current_trace.reset(token)
+        METRICS.observe("datavis_run_duration_seconds", trace.wall_time)
+
+
+def record_span(kind: str, name: str, duration: float, **fields) -> None:
+    """Record a finished span in the current run (if any) and in the process-wide metrics."""
+    record = {"kind": kind, "name": name, "node": _current_node.get(), "duration": duration, **fields}
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(record)
+
+    METRICS.observe(f"datavis_{kind}_duration_seconds", duration, name=name)
+    if record.get("cache_hit"):
+        METRICS.inc("datavis_cache_hits_total", kind=kind, name=name)
+    if record.get("bytes"):
+        METRICS.inc(f"datavis_{kind}_bytes_total", record["bytes"], name=name)
+    for token_type in ("prompt", "completion"):
+        if record.get(f"{token_type}_tokens"):
+            METRICS.inc("datavis_llm_tokens_total", record[f"{token_type}_tokens"], node=record["node"] or "", type=token_type)
+    if kind == "llm" and not record.get("cache_hit"):
+        METRICS.inc("datavis_llm_cost_usd_total", llm_cost(record.get("prompt_tokens") or 0,
+                                                           record.get("completion_tokens") or 0))
+
+
+@contextmanager
+def span(kind: str, name: str, **fields) -> Iterator[Dict[str, Any]]:
+    """Time a block as a span. The yielded dict collects extra fields such as tokens, bytes or cache_hit."""
+    record = dict(fields)
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record_span(kind, name, time.perf_counter() - start, **record)
+
+
+@contextmanager
+def _node_span(name: str) -> Iterator[Dict[str, Any]]:
+    token = _current_node.set(name)
+    try:
+        with span("node", name) as record:
+            # Peak memory is only attributable to the node when nodes run one at a time
+            if tracemalloc.is_tracing():
+                start_memory = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+            yield record
+            if tracemalloc.is_tracing():
+                record["peak_memory"] = tracemalloc.get_traced_memory()[1] - start_memory
+    finally:
+        _current_node.reset(token)
+
+
+def traced_node(name: str, func: Callable) -> Callable:
+    """Wrap a graph node (sync or async) so that it runs inside a "node" span.
+
+    While tracemalloc is tracing, the span also records the node's peak memory above its
+    starting point.
+    """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            with _node_span(name):
+                return await func(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _node_span(name):
+            return func(*args, **kwargs)
+    return wrapper
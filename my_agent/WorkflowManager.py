@@ -1,31 +1,66 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterator, List, Tuple
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph
 from my_agent.State import InputState, OutputState
+from my_agent.DatabaseManager import DatabaseManager
+from my_agent.LLMManager import LLMManager
 from my_agent.SQLAgent import SQLAgent
 from my_agent.DataFormatter import DataFormatter
+from my_agent.ResultCache import RESPONSE_FIELDS, ResultCache
+from my_agent.Scheduler import ConcurrencyController
+from my_agent.Tracing import RunTrace, run_trace, span, traced_node
 from langgraph.graph import END
 
+WORKFLOW_VARIANTS = ("multi_step", "fused")
+
 class WorkflowManager:
-    def __init__(self):
-        self.sql_agent = SQLAgent()
-        self.data_formatter = DataFormatter()
+    def __init__(self, db_manager: DatabaseManager = None, llm_manager: LLMManager = None):
+        # Both agents share one LLMManager: one chat client, one connection pool, one usage count
+        llm_manager = llm_manager or LLMManager()
+        self.sql_agent = SQLAgent(db_manager, llm_manager)
+        self.data_formatter = DataFormatter(llm_manager)
+        self.result_cache = ResultCache()
+        self.scheduler = ConcurrencyController()
+        self.variant = os.getenv("WORKFLOW_VARIANT", "multi_step")
+        self._graphs = {}
+        self._graph_lock = threading.Lock()
+        self._background_tasks = set()
+
+    def create_workflow(self, variant: str = None) -> StateGraph:
+        """Create and configure the workflow graph.
 
-    def create_workflow(self) -> StateGraph:
-        """Create and configure the workflow graph."""
+        The "fused" variant starts with a single structured-output call that returns the
+        relevant tables and the SQL query, and falls back to the multi-step path when it fails.
+        """
+        variant = variant or self.variant
+        if variant not in WORKFLOW_VARIANTS:
+            raise ValueError(f"Unknown workflow variant: {variant}")
         workflow = StateGraph(input=InputState, output=OutputState)
 
-        # Add nodes to the graph
-        workflow.add_node("parse_question", self.sql_agent.parse_question)
-        workflow.add_node("get_unique_nouns", self.sql_agent.get_unique_nouns)
-        workflow.add_node("generate_sql", self.sql_agent.generate_sql)
-        workflow.add_node("validate_and_fix_sql", self.sql_agent.validate_and_fix_sql)
-        workflow.add_node("execute_sql", self.sql_agent.execute_sql)
-        workflow.add_node("format_results", self.sql_agent.format_results)
-        workflow.add_node("choose_visualization", self.sql_agent.choose_visualization)
-        workflow.add_node("format_data_for_visualization", self.data_formatter.format_data_for_visualization)
+        # Add nodes to the graph. Nodes that wait on the LLM or the database get native async
+        # implementations for ainvoke/astream; the others only do local work
+        self._add_node(workflow, "parse_question", self.sql_agent.parse_question, self.sql_agent.aparse_question)
+        self._add_node(workflow, "get_unique_nouns", self.sql_agent.get_unique_nouns, self.sql_agent.aget_unique_nouns)
+        self._add_node(workflow, "filter_unique_nouns", self.sql_agent.filter_unique_nouns)
+        self._add_node(workflow, "generate_sql", self.sql_agent.generate_sql, self.sql_agent.agenerate_sql)
+        self._add_node(workflow, "validate_and_fix_sql",
+                       self.sql_agent.validate_and_fix_sql, self.sql_agent.avalidate_and_fix_sql)
+        self._add_node(workflow, "execute_sql", self.sql_agent.execute_sql, self.sql_agent.aexecute_sql)
+        self._add_node(workflow, "format_results", self.sql_agent.format_results, self.sql_agent.aformat_results)
+        self._add_node(workflow, "choose_visualization",
+                       self.sql_agent.choose_visualization, self._achoose_visualization)
+        self._add_node(workflow, "format_data_for_visualization",
+                       self.data_formatter.format_data_for_visualization,
+                       self.data_formatter.aformat_data_for_visualization)
         
         # Define edges
         workflow.add_edge("parse_question", "get_unique_nouns")
-        workflow.add_edge("get_unique_nouns", "generate_sql")
+        workflow.add_edge("get_unique_nouns", "filter_unique_nouns")
+        workflow.add_edge("filter_unique_nouns", "generate_sql")
         workflow.add_edge("generate_sql", "validate_and_fix_sql")
         workflow.add_edge("validate_and_fix_sql", "execute_sql")
         workflow.add_edge("execute_sql", "format_results")
@@ -33,20 +68,195 @@ class WorkflowManager:
         workflow.add_edge("choose_visualization", "format_data_for_visualization")
         workflow.add_edge("format_data_for_visualization", END)
         workflow.add_edge("format_results", END)
-        workflow.set_entry_point("parse_question")
+
+        if variant == "fused":
+            self._add_node(workflow, "parse_and_generate_sql",
+                           self.sql_agent.parse_and_generate_sql, self.sql_agent.aparse_and_generate_sql)
+            workflow.add_conditional_edges(
+                "parse_and_generate_sql",
+                lambda state: "validate_and_fix_sql" if state.get('sql_query') else "parse_question",
+                ["validate_and_fix_sql", "parse_question"],
+            )
+            first_step = "parse_and_generate_sql"
+        else:
+            first_step = "parse_question"
+
+        # Questions matching a cached SQL template skip straight to execution
+        if self.sql_agent.sql_template_cache is not None:
+            self._add_node(workflow, "lookup_sql_template", self.sql_agent.lookup_sql_template)
+            self._add_node(workflow, "store_sql_template", self.sql_agent.store_sql_template)
+            workflow.add_conditional_edges(
+                "lookup_sql_template",
+                lambda state: "execute_sql" if state.get('sql_template_hit') else first_step,
+                ["execute_sql", first_step],
+            )
+            workflow.add_edge("execute_sql", "store_sql_template")
+            workflow.add_edge("store_sql_template", END)
+            workflow.set_entry_point("lookup_sql_template")
+        else:
+            workflow.set_entry_point(first_step)
 
         return workflow
+
+    @staticmethod
+    def _add_node(workflow: StateGraph, name: str, func, afunc=None) -> None:
+        """Add a node that records a trace span per run, with an optional native async implementation."""
+        if afunc is None:
+            workflow.add_node(name, traced_node(name, func))
+        else:
+            workflow.add_node(name, RunnableLambda(traced_node(name, func), afunc=traced_node(name, afunc)))
     
+    async def _achoose_visualization(self, state: dict) -> dict:
+        """Choose the chart while speculatively fetching the axis label it will most likely need.
+
+        The prefetch runs in the background and is not awaited: if format_data_for_visualization
+        asks for the same label while it is still in flight, the two share one LLM call.
+        """
+        guess = self.sql_agent.guess_visualization(state)
+        prefetch = asyncio.create_task(
+            self.data_formatter.aprefetch_label(guess, state['question'], state.get('results'))
+        )
+        # The event loop only keeps weak references to tasks
+        self._background_tasks.add(prefetch)
+        prefetch.add_done_callback(self._background_tasks.discard)
+        return await self.sql_agent.achoose_visualization(state)
+
+    def get_graph(self, variant: str = None):
+        """Return the compiled graph of a workflow variant, compiling it on first use."""
+        variant = variant or self.variant
+        graph = self._graphs.get(variant)
+        if graph is None:
+            with self._graph_lock:
+                graph = self._graphs.get(variant)
+                if graph is None:
+                    graph = self._graphs[variant] = self.create_workflow(variant).compile()
+        return graph
+
     def returnGraph(self):
-        return self.create_workflow().compile()
+        return self.get_graph()
+
+    def warm_up(self, uuids: List[str] = ()) -> None:
+        """Compile the graph and prefetch the schemas of known datasets ahead of the first request."""
+        self.get_graph()
+        for uuid in uuids:
+            self.sql_agent.db_manager.get_schema(uuid)
+
+    def set_data_version(self, uuid: str, version: str) -> None:
+        """Record a new version of a dataset, evicting everything cached for the old one."""
+        self.result_cache.invalidate(uuid)
+        if self.sql_agent.sql_template_cache is not None:
+            self.sql_agent.sql_template_cache.invalidate(uuid)
+        self.sql_agent.noun_index.invalidate(uuid)
+        self.sql_agent.db_manager.set_data_version(uuid, version)
 
     def run_sql_agent(self, question: str, uuid: str) -> dict:
-        """Run the SQL agent workflow and return the formatted answer and visualization recommendation."""
-        app = self.create_workflow().compile()
-        result = app.invoke({"question": question, "uuid": uuid})
-        return {
-            "answer": result['answer'],
-            "visualization": result['visualization'],
-            "visualization_reason": result['visualization_reason'],
-            "formatted_data_for_visualization": result['formatted_data_for_visualization']
-        }
\ No newline at end of file
+        """Run the SQL agent workflow and return the formatted answer and visualization recommendation.
+
+        Runs that miss the result cache wait for a slot from the scheduler, which raises
+        Overloaded when too many runs are already waiting.
+        """
+        with run_trace() as trace:
+            version = self.sql_agent.db_manager.get_data_version(uuid)
+            result = self._cached_result(uuid, question, version)
+            if result is None:
+                with self.scheduler.slot(uuid):
+                    result = self.get_graph().invoke({"question": question, "uuid": uuid})
+                if not result.get('error'):
+                    self.result_cache.set(uuid, question, version, result)
+        return self._agent_response(result, trace)
+
+    async def arun_sql_agent(self, question: str, uuid: str) -> dict:
+        """Async variant of run_sql_agent; independent LLM calls in the graph run concurrently."""
+        with run_trace() as trace:
+            version = self.sql_agent.db_manager.get_data_version(uuid)
+            result = self._cached_result(uuid, question, version)
+            if result is None:
+                async with self.scheduler.aslot(uuid):
+                    result = await self.get_graph().ainvoke({"question": question, "uuid": uuid})
+                if not result.get('error'):
+                    self.result_cache.set(uuid, question, version, result)
+        return self._agent_response(result, trace)
+
+    def stream_sql_agent(self, question: str, uuid: str) -> Iterator[dict]:
+        """Run the SQL agent workflow, yielding events as soon as each piece of the result is ready.
+
+        Events are {"event": "node", "node", "update"} when a node finishes, {"event": "token",
+        "node", "token"} for each chunk of the streamed answer and a final {"event": "end",
+        "result"} carrying the same dict as run_sql_agent.
+        """
+        with run_trace() as trace:
+            version = self.sql_agent.db_manager.get_data_version(uuid)
+            result = self._cached_result(uuid, question, version)
+            if result is None:
+                with self.scheduler.slot(uuid):
+                    stream = self.get_graph().stream(
+                        {"question": question, "uuid": uuid}, stream_mode=["updates", "custom", "values"])
+                    for mode, chunk in stream:
+                        if mode == "values":
+                            result = chunk
+                        for event in self._stream_events(mode, chunk):
+                            yield event
+                if not result.get('error'):
+                    self.result_cache.set(uuid, question, version, result)
+        yield {"event": "end", "result": self._agent_response(result, trace)}
+
+    async def astream_sql_agent(self, question: str, uuid: str) -> AsyncIterator[dict]:
+        """Async variant of stream_sql_agent."""
+        with run_trace() as trace:
+            version = self.sql_agent.db_manager.get_data_version(uuid)
+            result = self._cached_result(uuid, question, version)
+            if result is None:
+                async with self.scheduler.aslot(uuid):
+                    stream = self.get_graph().astream(
+                        {"question": question, "uuid": uuid}, stream_mode=["updates", "custom", "values"])
+                    async for mode, chunk in stream:
+                        if mode == "values":
+                            result = chunk
+                        for event in self._stream_events(mode, chunk):
+                            yield event
+                if not result.get('error'):
+                    self.result_cache.set(uuid, question, version, result)
+        yield {"event": "end", "result": self._agent_response(result, trace)}
+
+    def _cached_result(self, uuid: str, question: str, version):
+        with span("cache", "result_cache") as record:
+            result = self.result_cache.get(uuid, question, version)
+            record["cache_hit"] = result is not None
+        return result
+
+    @staticmethod
+    def _stream_events(mode: str, chunk) -> List[dict]:
+        """Translate a graph stream chunk into client events. Full-state snapshots produce none."""
+        if mode == "custom":
+            return [{"event": "token", **chunk}]
+        if mode == "updates":
+            return [{"event": "node", "node": node, "update": update or {}} for node, update in chunk.items()]
+        return []
+
+    @staticmethod
+    def _agent_response(result: dict, trace: RunTrace) -> dict:
+        response = {field: result[field] for field in RESPONSE_FIELDS}
+        response["trace"] = trace.summary()
+        return response
+
+    def run_batch(self, questions: List[Tuple[str, str]], max_concurrency: int = 4) -> List[dict]:
+        """Run many (question, uuid) pairs through the shared graph with bounded concurrency."""
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            return list(executor.map(lambda item: self.run_sql_agent(*item), questions))
+
+
+_workflow_manager = None
+_workflow_manager_lock = threading.Lock()
+
+
+def get_workflow_manager() -> WorkflowManager:
+    """Return the process-wide WorkflowManager, so the graph and its clients are only built once."""
+    global _workflow_manager
+    if _workflow_manager is None:
+        with _workflow_manager_lock:
+            if _workflow_manager is None:
+                workflow_manager = WorkflowManager()
+                uuids = [uuid for uuid in os.getenv("WARM_UP_UUIDS", "").split(",") if uuid]
+                workflow_manager.warm_up(uuids)
+                _workflow_manager = workflow_manager
+    return _workflow_manager
@@ -1,8 +1,4 @@
-
-
-from my_agent.WorkflowManager import WorkflowManager
+from my_agent.WorkflowManager import get_workflow_manager
 
 # for deployment on langgraph cloud
-graph = WorkflowManager().returnGraph()
-    
-    
\ No newline at end of file
+graph = get_workflow_manager().returnGraph()
@@ -0,0 +1,13 @@
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _encoding = None
+
+
+def estimate_tokens(text) -> int:
+    """Estimate the number of prompt tokens text will use, falling back to ~4 characters per token."""
+    text = text if isinstance(text, str) else str(text)
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
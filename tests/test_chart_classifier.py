@@ -0,0 +1,29 @@
+import pytest
+
+from my_agent.ChartClassifier import classify_chart
+from my_agent.ResultDigest import build_result_digest
+
+CITIES = ["Yangon", "Mandalay", "Naypyitaw", "Bago", "Mawlamyine"]
+
+
+@pytest.mark.parametrize("question, rows, expected", [
+    ("Monthly sales over time", [[f"2024-{month:02d}-01", month * 10.0] for month in range(1, 13)], "line"),
+    ("Sales per year", [[year, year - 2000.0] for year in range(2015, 2025)], "line"),
+    ("Sales by city and month", [[f"2024-{month:02d}-01", city, 1.0] for month in (1, 2) for city in CITIES[:2]],
+     "line"),
+    ("What does each city contribute?", [["Yangon", 50.0], ["Mandalay", 30.0], ["Bago", 20.0]], "pie"),
+    ("Sales in Yangon and Mandalay", [["Yangon", 120.0], ["Mandalay", 80.0]], "horizontal_bar"),
+    ("Sales by city", [[city, float(index)] for index, city in enumerate(CITIES)], "bar"),
+    ("Unit price versus quantity", [[float(i), i * 2.5] for i in range(20)], "scatter"),
+    ("Unit price and rating by city", [[city, float(i), i * 0.5] for i, city in enumerate(CITIES)], "scatter"),
+    ("Sales by city and product line", [[city, line, 1.0] for city in CITIES[:2] for line in ("Food", "Travel")],
+     "bar"),
+    ("Everything about each sale", [["Yangon", "Food", 1.0, 2.0], ["Bago", "Travel", 3.0, 4.0]], None),
+    ("Total sales", [[322966.75]], "none"),
+    ("Sales in Atlantis", [], "none"),
+])
+def test_classify_chart(question, rows, expected):
+    visualization, confidence, reason = classify_chart(question, build_result_digest(rows))
+    assert visualization == expected
+    assert reason
+    assert (confidence > 0) == (expected is not None)
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from my_agent.ColumnarFormatter import format_chart, pivot, to_columns
+
+
+def _strict_json(payload):
+    """Serialize like a browser would accept it: NaN and Infinity are not JSON."""
+    return json.dumps(payload, allow_nan=False)
+
+
+@pytest.mark.parametrize("visualization, results", [
+    ("line", [["2024-01", 1.0], ["2024-02", None], ["2024-03", 3.0]]),
+    ("bar", [["A", 1.0], ["B", None]]),
+    ("scatter", [[1.0, 2.0], [None, 3.0], [4.0, None]]),
+    ("line", [["A", "2024-01", 1.0], ["A", "2024-02", None], ["B", "2024-01", 2.0]]),
+    ("bar", [["A", "x", 1.0], ["B", "y", None]]),
+])
+def test_nulls_become_json_null(visualization, results):
+    payload = format_chart(visualization, to_columns(results))
+    assert "NaN" not in _strict_json(payload)
+
+
+def test_line_null_is_null():
+    payload = format_chart("line", to_columns([["2024-01", 1.0], ["2024-02", None], ["2024-03", 3.0]]))
+    assert payload["yValues"] == [{"data": [1.0, None, 3.0]}]
+
+
+def test_scatter_null_is_null():
+    payload = format_chart("scatter", to_columns([[1.0, 2.0], [None, 3.0]]))
+    assert payload["series"][0]["data"] == [{"x": 1.0, "y": 2.0, "id": 1}, {"x": None, "y": 3.0, "id": 2}]
+
+
+def test_pivot_missing_pairs_are_nan_and_order_is_kept():
+    rows, columns, matrix = pivot(*to_columns([["B", "x", 1], ["A", "y", 2], ["B", "y", 3]]))
+    assert rows.tolist() == ["B", "A"]
+    assert columns.tolist() == ["x", "y"]
+    assert matrix[1, 0] != matrix[1, 0]
+    assert matrix[0].tolist() == [1.0, 3.0]
+
+
+@pytest.mark.parametrize("visualization", ["bar", "line"])
+def test_duplicate_pairs_raise_instead_of_dropping_values(visualization):
+    results = [["A", "x", 1], ["A", "x", 5], ["B", "x", 2]]
+    with pytest.raises(ValueError):
+        format_chart(visualization, to_columns(results))
+
+
+def test_unsupported_shapes_raise():
+    with pytest.raises(ValueError):
+        format_chart("bar", to_columns([["A", 1, 2, 3]]))
+    with pytest.raises(ValueError):
+        format_chart("pie", to_columns([["A", 1]]))
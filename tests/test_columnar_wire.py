@@ -0,0 +1,76 @@
+import json
+
+import numpy as np
+import pytest
+
+from my_agent.ColumnarFormatter import format_chart, to_columns
+from my_agent.ColumnarWire import decode_columnar, decode_columnar_rows, encode_columnar
+
+ROWS = [
+    ["Yangon", 3, 10.5, "naïve", {"a": 1}],
+    ["Mandalay", None, None, None, 2],
+    ["", -7, 2.25, "x", None],
+]
+NAMES = ["city", "count", "total", "note", "mixed"]
+
+
+def test_round_trip_keeps_values_and_nulls():
+    assert decode_columnar_rows(encode_columnar(NAMES, ROWS)) == ROWS
+
+
+def test_round_trip_of_empty_result():
+    result = decode_columnar(encode_columnar(["a"], []))
+    assert len(result) == 0
+    assert result.to_rows() == []
+
+
+def test_row_limit_truncates_every_column():
+    result = decode_columnar(encode_columnar(NAMES, ROWS), row_limit=2)
+    assert len(result) == 2
+    assert result.total_row_count == 3
+    assert result.to_rows() == ROWS[:2]
+
+
+def test_result_is_a_row_sequence():
+    result = decode_columnar(encode_columnar(NAMES, ROWS))
+    assert result[0] == ROWS[0]
+    assert result[-1] == ROWS[-1]
+    assert result[1:] == ROWS[1:]
+    assert result[::2] == ROWS[::2]
+    assert list(result.iter_rows(chunk_size=2)) == ROWS
+    with pytest.raises(IndexError):
+        result[3]
+
+
+def test_rejects_other_bodies():
+    with pytest.raises(ValueError):
+        decode_columnar(b'[[1, 2]]')
+
+
+def test_numeric_columns_without_nulls_are_views_over_the_body():
+    body = encode_columnar(["x", "y", "label"], [[1.5, 1, "a"], [2.5, 2, "b"]])
+    columns = to_columns(decode_columnar(body))
+    for column in columns[:2]:
+        assert not column.flags.owndata
+        assert np.shares_memory(column, np.frombuffer(body, dtype=np.uint8))
+    assert columns[2].dtype == object
+
+
+def test_columns_with_nulls_hold_none():
+    column = decode_columnar(encode_columnar(["x"], [[1], [None]])).column_array(0)
+    assert column.tolist() == [1, None]
+
+
+@pytest.mark.parametrize("visualization, rows", [
+    ("line", [["2024-01", 1.0], ["2024-02", None], ["2024-03", 3.0]]),
+    ("line", [["A", "2024-01", 1], ["A", "2024-02", 2], ["B", "2024-01", 3]]),
+    ("bar", [["A", 1], ["B", 2]]),
+    ("bar", [["A", "x", 1.5], ["B", "y", None]]),
+    ("scatter", [[1.0, 2.0], [3.5, 3.0], [4.0, None]]),
+    ("scatter", [["A", 1, 2.0], ["B", 2, 3.0]]),
+])
+def test_formatting_columns_matches_formatting_rows(visualization, rows):
+    names = [str(index) for index in range(len(rows[0]))]
+    from_columns = format_chart(visualization, to_columns(decode_columnar(encode_columnar(names, rows))), 2)
+    from_rows = format_chart(visualization, to_columns(rows), 2)
+    assert json.dumps(from_columns, allow_nan=False) == json.dumps(from_rows, allow_nan=False)
@@ -0,0 +1,131 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from benchmarks.local_sql_server import LocalSQLServer
+from my_agent.ColumnarWire import ColumnarResult
+from my_agent.DatabaseManager import DatabaseManager
+from my_agent.Tracing import run_trace
+
+QUERY = "SELECT name, value FROM items ORDER BY value"
+
+
+@pytest.fixture
+def server(tmp_path):
+    path = str(tmp_path / "items.sqlite")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE items (name TEXT, value REAL)")
+        conn.executemany("INSERT INTO items VALUES (?, ?)", [(f"item {i}", float(i)) for i in range(1000)])
+    with LocalSQLServer(path) as server:
+        yield server
+
+
+@pytest.fixture
+def db_manager(server, monkeypatch):
+    monkeypatch.setenv("DB_ENDPOINT_URL", server.url)
+    db_manager = DatabaseManager()
+    yield db_manager
+    db_manager.close()
+
+
+def test_stream_query_reads_columnar_body_within_budget(server, db_manager):
+    stream = db_manager.stream_query("u", QUERY, max_rows=100, max_bytes=1_000_000)
+    rows = list(stream)
+    assert rows[:2] == [["item 0", 0.0], ["item 1", 1.0]]
+    assert stream.row_count == 100 and stream.truncated
+    assert server.request_count == 1
+
+
+def test_stream_query_falls_back_to_ndjson_over_byte_budget(server, db_manager):
+    stream = db_manager.stream_query("u", QUERY, max_bytes=2_000)
+    rows = list(stream)
+    # NDJSON is cut off line by line, so the budget bounds what was read
+    assert stream.truncated
+    assert 0 < len(rows) < 1000
+    assert stream.bytes_read <= 2_000
+    assert rows[0] == ["item 0", 0.0]
+    assert server.request_count == 2
+
+
+def test_stream_query_without_budget_returns_every_row(db_manager):
+    stream = db_manager.stream_query("u", QUERY)
+    assert len(list(stream)) == 1000
+    assert not stream.truncated
+
+
+def test_collect_keeps_columnar_result(db_manager):
+    stream = db_manager.stream_query("u", QUERY, max_rows=100)
+    results = stream.collect()
+    assert isinstance(results, ColumnarResult)
+    assert len(results) == 100 and stream.row_count == 100 and stream.truncated
+    assert results[99] == ["item 99", 99.0]
+
+
+def test_parallel_fallback_records_spans_in_the_run_trace(db_manager):
+    db_manager.batch_supported = False
+    queries = [QUERY, "SELECT COUNT(*) FROM items", "SELECT MAX(value) FROM items"]
+    with run_trace() as trace:
+        results = db_manager.execute_queries("u", queries)
+    assert results[1] == [[1000]]
+    assert [record["name"] for record in trace.spans] == ["execute_query"] * 3
+
+
+def _run_async(db_manager, coroutine_function):
+    async def run():
+        try:
+            return await coroutine_function()
+        finally:
+            await db_manager.aclose()
+
+    return asyncio.run(run())
+
+
+def test_async_queries_negotiate_and_decode_like_sync(server, db_manager):
+    async def run():
+        return (
+            await db_manager.aget_schema("u"),
+            await db_manager.aexecute_query("u", QUERY),
+            await db_manager.aexecute_queries("u", [QUERY, "SELECT COUNT(*) FROM items"]),
+        )
+
+    schema, rows, batch = _run_async(db_manager, run)
+    assert "CREATE TABLE items" in schema
+    assert rows == db_manager.execute_query("u", QUERY)
+    assert batch[1] == [[1000]]
+
+
+def test_async_stream_query_keeps_the_budget(server, db_manager):
+    async def run():
+        within = await db_manager.astream_query("u", QUERY, max_rows=100, max_bytes=1_000_000)
+        over = await db_manager.astream_query("u", QUERY, max_bytes=2_000)
+        return within, await within.acollect(), over, await over.acollect()
+
+    within, within_rows, over, over_rows = _run_async(db_manager, run)
+    assert isinstance(within_rows, ColumnarResult) and len(within_rows) == 100 and within.truncated
+    assert over.truncated and 0 < len(over_rows) < 1000 and over.bytes_read <= 2_000
+    assert over_rows[0] == ["item 0", 0.0]
+    assert server.request_count == 3
+
+
+def test_async_queries_fall_back_to_threads_without_httpx(db_manager):
+    db_manager.async_transport = False
+
+    async def run():
+        stream = await db_manager.astream_query("u", QUERY, max_rows=10)
+        return await db_manager.aexecute_query("u", QUERY), await stream.acollect()
+
+    rows, streamed = _run_async(db_manager, run)
+    assert rows[:10] == list(streamed)
+
+
+def test_concurrent_collects_of_one_query_share_a_request(server, db_manager):
+    async def run():
+        return await asyncio.gather(*(db_manager.acollect_query("u", QUERY, max_rows=100) for _ in range(3)))
+
+    collected = _run_async(db_manager, run)
+    assert all(results is collected[0][1] for _, results in collected)
+    assert len(collected[0][1]) == 100 and collected[0][0].truncated
+    assert server.request_count == 1
+    db_manager.collect_query("u", QUERY, max_rows=10)
+    assert server.request_count == 2
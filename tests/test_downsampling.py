@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from my_agent.ColumnarFormatter import format_chart, to_columns
+from my_agent.Downsampling import bin_2d, lttb_indices, value_range
+
+
+@pytest.mark.parametrize("n, budget", [(1000, 100), (1000, 3), (101, 100), (10, 10), (10, 50)])
+def test_lttb_keeps_endpoints_and_returns_budget_points(n, budget):
+    x = np.arange(n, dtype=np.float64)
+    indices = lttb_indices(x, np.sin(x / 10), budget)
+    assert len(indices) == min(n, budget)
+    assert indices[0] == 0 and indices[-1] == n - 1
+    assert np.all(np.diff(indices) > 0)
+
+
+def test_lttb_keeps_a_spike():
+    y = np.zeros(1000)
+    y[537] = 100.0
+    assert 537 in lttb_indices(np.arange(1000, dtype=np.float64), y, 50)
+
+
+def test_bin_counts_sum_to_non_null_points():
+    rng = np.random.default_rng(0)
+    x, y = rng.normal(size=5000), rng.normal(size=5000)
+    x[::7] = np.nan
+    y[::11] = np.nan
+    non_null = int(np.sum(~np.isnan(x) & ~np.isnan(y)))
+    _, _, counts = bin_2d(x, y, 10, value_range(x), value_range(y))
+    assert len(counts) <= 100 and np.all(counts > 0)
+    assert counts.sum() == non_null
+
+
+def test_line_downsampling_is_recorded():
+    rows = [[f"2024-01-01 {i:05d}", float(i % 37)] for i in range(2000)]
+    payload = format_chart("line", to_columns(rows), point_budget=200)
+    assert len(payload["xValues"]) == 200
+    assert payload["xValues"][0] == rows[0][0] and payload["xValues"][-1] == rows[-1][0]
+    assert payload["downsampling"] == {"method": "lttb", "original_points": 2000, "points": 200, "budget": 200}
+
+
+def test_scatter_downsampling_is_recorded():
+    rows = [[float(i % 97), float(i % 89)] for i in range(5000)] + [[None, 1.0]]
+    payload = format_chart("scatter", to_columns(rows), point_budget=400)
+    points = payload["series"][0]["data"]
+    assert sum(point["count"] for point in points) == 5000
+    assert payload["downsampling"] == {"method": "bin", "original_points": 5001, "points": len(points), "budget": 400}
+    assert len(points) <= 400
+
+
+def test_results_within_budget_are_not_downsampled():
+    payload = format_chart("line", to_columns([["2024-01", 1.0], ["2024-02", 2.0]]), point_budget=200)
+    assert payload["downsampling"] == {"method": "none", "original_points": 2, "points": 2, "budget": 200}
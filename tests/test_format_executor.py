@@ -0,0 +1,16 @@
+import asyncio
+import json
+
+from my_agent.ColumnarFormatter import format_chart, to_columns
+from my_agent.ColumnarWire import decode_columnar, encode_columnar
+from my_agent.FormatExecutor import aformat_chart_offloaded, format_chart_offloaded
+
+ROWS = [[["A", "B"][i % 2], f"2024/01/{i // 2 + 1:02d}", i * 1.5 if i % 7 else None] for i in range(60)]
+
+
+def test_offloaded_chart_matches_inline_and_keeps_the_row_limit():
+    result = decode_columnar(encode_columnar(["label", "day", "value"], ROWS), row_limit=40)
+    inline = format_chart("line", to_columns(result), 10)
+    assert json.dumps(format_chart_offloaded("line", result, 10)) == json.dumps(inline)
+    assert json.dumps(asyncio.run(aformat_chart_offloaded("line", result, 10))) == json.dumps(inline)
+    assert inline["downsampling"]["original_points"] == 20
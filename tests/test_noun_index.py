@@ -0,0 +1,51 @@
+import sqlite3
+
+import pytest
+
+from benchmarks.local_sql_server import LocalSQLServer
+from my_agent.DatabaseManager import DatabaseManager
+from my_agent.NounIndex import NounIndex
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    path = str(tmp_path / "sales.sqlite")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE sales (city TEXT, total REAL)")
+        conn.executemany("INSERT INTO sales VALUES (?, ?)", [("Yangon", 1.0), ("Mandalay", 2.0)])
+        conn.execute("CREATE VIEW big_sales AS SELECT city FROM sales WHERE total > 1")
+        conn.execute("CREATE TABLE branches (code TEXT PRIMARY KEY, city TEXT) WITHOUT ROWID")
+        conn.executemany("INSERT INTO branches VALUES (?, ?)", [("A", "Yangon"), ("B", "Bago")])
+    return path
+
+
+@pytest.fixture
+def noun_index(data_path, tmp_path, monkeypatch):
+    with LocalSQLServer(data_path) as server:
+        monkeypatch.setenv("DB_ENDPOINT_URL", server.url)
+        db_manager = DatabaseManager()
+        yield NounIndex(db_manager, str(tmp_path / "index.sqlite"))
+        db_manager.close()
+
+
+def test_append_adds_the_new_values(noun_index, data_path):
+    assert sorted(noun_index.get_nouns("u", [("sales", "city")])) == ["Mandalay", "Yangon"]
+    with sqlite3.connect(data_path) as conn:
+        conn.execute("INSERT INTO sales VALUES ('Bago', 3.0)")
+    assert sorted(noun_index.get_nouns("u", [("sales", "city")])) == ["Bago", "Mandalay", "Yangon"]
+
+
+@pytest.mark.parametrize("table_name, before, after", [
+    ("big_sales", ["Mandalay"], ["Bago", "Mandalay"]),
+    ("branches", ["Bago", "Yangon"], ["Bago", "Mandalay", "Yangon"]),
+])
+def test_tables_without_rowid_are_fingerprinted_by_count(noun_index, data_path, table_name, before, after):
+    columns = [(table_name, "city")]
+    assert sorted(noun_index.get_nouns("u", columns)) == before
+    with sqlite3.connect(data_path) as conn:
+        conn.execute("INSERT INTO sales VALUES ('Bago', 3.0)")
+        conn.execute("INSERT INTO branches VALUES ('C', 'Mandalay')")
+        conn.execute("DELETE FROM branches WHERE code = 'A'")
+        conn.execute("INSERT INTO branches VALUES ('D', 'Yangon')")
+    assert sorted(noun_index.get_nouns("u", columns)) == after
+    assert [row[1:] for row in noun_index.noun_map("u")[0]] == [("city", len(after), None)]
@@ -0,0 +1,217 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from my_agent.Scheduler import ConcurrencyController, Overloaded, SingleFlight
+
+
+def _wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.001)
+
+
+def test_single_flight_shares_concurrent_calls():
+    flights = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def func():
+        calls.append(1)
+        release.wait()
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do("key", func))) for _ in range(4)]
+    threads[0].start()
+    _wait_until(lambda: calls)
+    for thread in threads[1:]:
+        thread.start()
+    _wait_until(lambda: all(thread.is_alive() for thread in threads[1:]))
+    time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(results, key=lambda item: item[1]) == [("result", False)] + [("result", True)] * 3
+
+
+def test_single_flight_followers_see_failed_leader_and_next_call_retries():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait()
+        raise ValueError("boom")
+
+    errors = []
+
+    def call():
+        try:
+            flights.do("key", failing)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait()
+    follower = threading.Thread(target=call)
+    follower.start()
+    time.sleep(0.01)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert len(errors) == 2 and errors[0] is errors[1]
+    # Nothing is remembered once the failed call completes
+    assert flights.do("key", lambda: "fresh") == ("fresh", False)
+
+
+def test_single_flight_async_leader_cancellation_does_not_cancel_followers():
+    async def scenario():
+        flights = SingleFlight()
+        calls = []
+
+        async def func():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+
+        leader = asyncio.create_task(flights.ado("key", func))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.ado("key", func))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert await follower == ("result", True)
+        assert not follower.cancelled()
+        assert len(calls) == 1
+        assert flights._async_calls == {}
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_async_followers_see_failed_leader():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(*(flights.ado("key", failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert await flights.ado("key", lambda: asyncio.sleep(0, "fresh")) == ("fresh", False)
+
+    asyncio.run(scenario())
+
+
+def test_slots_are_granted_round_robin_across_uuids():
+    controller = ConcurrencyController(max_concurrency=1, per_uuid_limit=1, max_queue_depth=10)
+    order = []
+    lock = threading.Lock()
+    release = threading.Event()
+
+    def run(uuid):
+        with controller.slot(uuid):
+            with lock:
+                order.append(uuid)
+            release.wait()
+
+    threads = []
+    # "a" holds the only slot while three more "a" runs and two "b" runs queue up behind it
+    for uuid in ["a", "a", "a", "a", "b", "b"]:
+        thread = threading.Thread(target=run, args=(uuid,))
+        thread.start()
+        threads.append(thread)
+        _wait_until(lambda: controller.stats()["running"] + controller.stats()["queue_depth"] == len(threads))
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert order == ["a", "a", "b", "a", "b", "a"]
+    assert controller.stats()["running"] == 0
+
+
+def test_per_uuid_limit_leaves_room_for_other_uuids():
+    controller = ConcurrencyController(max_concurrency=3, per_uuid_limit=2, max_queue_depth=10)
+    granted = threading.Event()
+
+    def third_run():
+        with controller.slot("a"):
+            granted.set()
+
+    with controller.slot("a"), controller.slot("a"):
+        thread = threading.Thread(target=third_run)
+        thread.start()
+        _wait_until(lambda: controller.stats()["queue_depth"] == 1)
+        # The third "a" run waits although a slot is free, and a "b" run still gets in
+        with controller.slot("b"):
+            assert controller.stats()["running_per_uuid"] == {"a": 2, "b": 1}
+        assert not granted.is_set()
+    thread.join()
+    assert granted.is_set()
+
+
+def test_full_queue_rejects_with_overloaded():
+    controller = ConcurrencyController(max_concurrency=1, per_uuid_limit=1, max_queue_depth=1)
+    release = threading.Event()
+
+    def run():
+        with controller.slot("a"):
+            release.wait()
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    _wait_until(lambda: controller.stats()["queue_depth"] == 1)
+
+    with pytest.raises(Overloaded):
+        with controller.slot("b"):
+            pass
+    assert controller.stats()["rejected"] == 1
+
+    release.set()
+    for thread in threads:
+        thread.join()
+    # Free slots are granted immediately, whatever the queue limit
+    with controller.slot("b"):
+        assert controller.stats()["running"] == 1
+
+
+def test_cancelled_async_waiter_gives_up_its_place():
+    async def scenario():
+        controller = ConcurrencyController(max_concurrency=1, per_uuid_limit=1, max_queue_depth=10)
+        release = asyncio.Event()
+        entered = []
+
+        async def run(name):
+            async with controller.aslot("a"):
+                entered.append(name)
+                await release.wait()
+
+        holder = asyncio.create_task(run("holder"))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(run("waiter"))
+        last = asyncio.create_task(run("last"))
+        await asyncio.sleep(0.01)
+        assert controller.stats()["queue_depth"] == 2
+
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert controller.stats()["queue_depth"] == 1
+
+        release.set()
+        await asyncio.gather(holder, last)
+        assert entered == ["holder", "last"]
+        assert controller.stats()["running"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+
+from benchmarks.local_sql_server import LocalSQLServer
+from my_agent import SQLTemplateCache as template_module
+from my_agent.DatabaseManager import DatabaseManager
+from my_agent.NounIndex import NounIndex
+from my_agent.SQLTemplateCache import SQLTemplateCache
+
+COLUMNS = [("sales", "city")]
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    path = str(tmp_path / "sales.sqlite")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE sales (city TEXT, total REAL)")
+        conn.executemany("INSERT INTO sales VALUES (?, ?)", [("Yangon", 1.0), ("Mandalay", 2.0)])
+    return path
+
+
+@pytest.fixture
+def noun_index(data_path, tmp_path, monkeypatch):
+    with LocalSQLServer(data_path) as server:
+        monkeypatch.setenv("DB_ENDPOINT_URL", server.url)
+        db_manager = DatabaseManager()
+        yield NounIndex(db_manager, str(tmp_path / "index.sqlite"))
+        db_manager.close()
+
+
+@pytest.fixture
+def compiled(monkeypatch):
+    """Count the noun regexes the template cache compiles."""
+    calls = []
+    original = template_module._noun_pattern
+
+    def counting(nouns):
+        calls.append(sorted(nouns))
+        return original(nouns)
+
+    monkeypatch.setattr(template_module, "_noun_pattern", counting)
+    return calls
+
+
+def test_template_is_reused_for_another_noun(noun_index):
+    noun_index.get_nouns("u", COLUMNS)
+    cache = SQLTemplateCache()
+    cache.set("u", "Total sales in Yangon?", None, *noun_index.noun_map("u"),
+              "SELECT SUM(total) FROM sales WHERE city = 'Yangon'")
+    assert cache.get("u", "Total sales in Mandalay?", None, *noun_index.noun_map("u")) == \
+        "SELECT SUM(total) FROM sales WHERE city = 'Mandalay'"
+    assert cache.get("u", "Total sales in Mandalay?", "v2", *noun_index.noun_map("u")) is None
+
+
+def test_noun_map_and_matcher_are_built_once_per_fingerprint(noun_index, compiled):
+    noun_index.get_nouns("u", COLUMNS)
+    cache = SQLTemplateCache()
+    first = noun_index.noun_map("u")
+    for question in ("Sales in Yangon?", "Sales in Mandalay?", "Sales in Yangon?"):
+        noun_map = noun_index.noun_map("u")
+        assert noun_map[1] is first[1]
+        cache.get("u", question, None, *noun_map)
+    assert compiled == [["Mandalay", "Yangon"]]
+
+
+def test_refresh_with_new_values_replaces_noun_map_and_matcher(noun_index, data_path, compiled):
+    noun_index.get_nouns("u", COLUMNS)
+    cache = SQLTemplateCache()
+    before = noun_index.noun_map("u")
+    cache.get("u", "Sales in Yangon?", None, *before)
+    with sqlite3.connect(data_path) as conn:
+        conn.execute("INSERT INTO sales VALUES ('Bago', 3.0)")
+
+    noun_index.get_nouns("u", COLUMNS)
+    after = noun_index.noun_map("u")
+    assert after[0] != before[0]
+    assert "Bago" in after[1]
+    skeleton, nouns = cache.skeleton("u", "Sales in Bago?", *after)
+    assert nouns == ["Bago"]
+    assert compiled == [["Mandalay", "Yangon"], ["Bago", "Mandalay", "Yangon"]]
+    assert len(cache._matchers) == 1
+
+
+def test_invalidate_drops_noun_map(noun_index):
+    noun_index.get_nouns("u", COLUMNS)
+    assert noun_index.noun_columns("u")
+    noun_index.invalidate("u")
+    assert noun_index.noun_map("u") == ((), {})
@@ -0,0 +1,23 @@
+import pytest
+
+from my_agent.SQLValidator import ONLY_SELECT, SQLValidator
+
+SCHEMA = "CREATE TABLE sales (city TEXT, total REAL)"
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("SELECT city, SUM(total) FROM sales GROUP BY city;", (True, None)),
+    ("WITH big AS (SELECT * FROM sales WHERE total > 10) SELECT COUNT(*) FROM big", (True, None)),
+    ("SELECT region FROM sales", (False, "no such column: region")),
+    ("SELECT city FROM sales; SELECT total FROM sales", (False, "You can only execute one statement at a time.")),
+    ("DELETE FROM sales", (False, ONLY_SELECT)),
+    ("WITH x AS (SELECT 1) DELETE FROM sales", (False, ONLY_SELECT)),
+    ("WITH x AS (SELECT 1) INSERT INTO sales SELECT 'Yangon', 1 FROM x", (False, ONLY_SELECT)),
+    ("WITH x AS (SELECT 1) UPDATE sales SET total = 0", (False, ONLY_SELECT)),
+])
+def test_validate(query, expected):
+    assert SQLValidator().validate(SCHEMA, query) == expected
+
+
+def test_unparsed_schema_is_not_judged():
+    assert SQLValidator().validate("no tables here", "SELECT 1") == (None, None)
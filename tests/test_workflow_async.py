@@ -0,0 +1,60 @@
+import asyncio
+import os
+
+import pytest
+
+from benchmarks.bench_fused import QUESTIONS
+from benchmarks.local_sql_server import LocalSQLServer
+from benchmarks.run_scenarios import scripted_llm
+from my_agent.WorkflowManager import WorkflowManager
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data.sqlite")
+
+
+class BlockingSessionUsed(Exception):
+    pass
+
+
+class NoBlockingSession:
+    """Stand-in for the requests session that fails any blocking call."""
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        raise BlockingSessionUsed(name)
+
+
+@pytest.fixture
+def workflow_manager(tmp_path, monkeypatch):
+    with LocalSQLServer(DATA_PATH) as server:
+        monkeypatch.setenv("DB_ENDPOINT_URL", server.url)
+        monkeypatch.setenv("NOUN_INDEX_PATH", str(tmp_path / "index.sqlite"))
+        yield WorkflowManager(llm_manager=scripted_llm(latency=0, jitter=0))
+
+
+@pytest.mark.parametrize("variant", ["multi_step", "fused"])
+def test_async_graph_does_not_use_the_blocking_session(workflow_manager, variant):
+    db_manager = workflow_manager.sql_agent.db_manager
+    db_manager.session = NoBlockingSession()
+
+    async def run():
+        try:
+            return await workflow_manager.get_graph(variant).ainvoke({"question": QUESTIONS[0][0], "uuid": "u"})
+        finally:
+            await db_manager.aclose()
+
+    state = asyncio.run(run())
+    assert not state.get("error")
+    assert len(state["results"]) > 0
+    assert state["formatted_data_for_visualization"]
+
+
+def test_fused_call_fills_the_noun_index(workflow_manager):
+    noun_index = workflow_manager.sql_agent.noun_index
+    assert not noun_index.noun_columns("u")
+
+    state = workflow_manager.get_graph("fused").invoke({"question": QUESTIONS[0][0], "uuid": "u"})
+    assert not state.get("error")
+    assert noun_index.noun_columns("u")
+    assert set(state["unique_nouns"]) <= set(noun_index.cached_nouns("u"))